@@ -0,0 +1,62 @@
+"""
+Bilateral filter speed and accuracy, exact window vs. bilateral grid, over a sweep of Sigma A.
+
+    python benchmarks/bench_bilateral.py [--size 512] [--sigmas 2 3 4 8] [--sigma-b 0.3]
+
+Error is the max / mean absolute difference of the grid to the exact filter on an RGB image
+of flat patches plus noise; "estimate" is what the operator reports from sampled pixels.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import bilateral  # noqa:E402
+
+
+def test_image(size, seed=0):
+    rng = np.random.default_rng(seed)
+    cells = rng.random((8, 8, 3), dtype=np.float32)
+    pix = np.repeat(np.repeat(cells, size // 8 + 1, axis=0), size // 8 + 1, axis=1)[:size, :size]
+    return pix + rng.normal(0.0, 0.05, pix.shape).astype(np.float32)
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--sigmas", type=float, nargs="+", default=[2, 3, 4, 8])
+    parser.add_argument("--sigma-b", type=float, default=0.3)
+    args = parser.parse_args()
+
+    pix = test_image(args.size)
+
+    print(
+        "{:>6} {:>10} {:>10} {:>10} {:>10} {:>16}".format(
+            "sigma", "exact (s)", "grid (s)", "max err", "mean err", "estimate"
+        )
+    )
+    for s in args.sigmas:
+        ref, t_exact = timed(bilateral.exact, pix, s, args.sigma_b)
+        res, t_grid = timed(bilateral.grid, pix, s, args.sigma_b)
+        diff = np.abs(ref - res)
+        est = bilateral.estimate_error(pix, res, s, args.sigma_b)
+        print(
+            "{:>6} {:>10.3f} {:>10.3f} {:>10.4f} {:>10.4f} {:>8.4f}/{:.4f}".format(
+                s, t_exact, t_grid, diff.max(), diff.mean(), *est
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
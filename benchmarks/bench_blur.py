@@ -0,0 +1,47 @@
+"""
+Gaussian blur speed and accuracy for each method over a sweep of widths.
+
+    python benchmarks/bench_blur.py [--size 1024] [--widths 1 2 4 ... 256]
+
+Error is the max absolute difference to the exact method on uniform noise.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import blur  # noqa:E402
+
+
+def timed(fn, *args, **kw):
+    t0 = time.perf_counter()
+    res = fn(*args, **kw)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--widths", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pix = rng.random((args.size, args.size, 4), dtype=np.float32)
+
+    print("{:>6} {:>10} {:>10} {:>12}".format("width", "method", "time (s)", "max error"))
+    for s in args.widths:
+        ref, t = timed(blur.gaussian, pix, s, method="exact")
+        print("{:>6} {:>10} {:>10.4f} {:>12}".format(s, "exact", t, "-"))
+        for method in blur.METHODS[1:]:
+            res, t = timed(blur.gaussian, pix, s, method=method)
+            err = float(np.abs(res - ref).max())
+            print("{:>6} {:>10} {:>10.4f} {:>12.6f}".format(s, method, t, err))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Histogram matching speed and error, sort based vs. binned.
+
+    python benchmarks/bench_histogram.py [--sizes 1024 2048 4096]
+
+Runs gaussianize and histogram_seamless on float noise and on the same noise rounded to
+8 bits, error is the max / mean absolute difference of the binned result to the exact one.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import filters  # noqa:E402
+
+CASES = [
+    ("gaussianize", lambda pix, method: filters.gaussianize(pix, method=method)[0]),
+    ("seamless", lambda pix, method: filters.histogram_seamless(pix, method=method)),
+]
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        "{:>6} {:>6} {:>12} {:>10} {:>10} {:>10} {:>10}".format(
+            "size", "data", "filter", "exact (s)", "hist (s)", "max err", "mean err"
+        )
+    )
+    for size in args.sizes:
+        noise = rng.random((size, size, 4), dtype=np.float32)
+        for data, pix in (("float", noise), ("8bit", np.round(noise * 255) / 255)):
+            for name, fn in CASES:
+                ref, t_exact = timed(fn, pix.copy(), "exact")
+                res, t_hist = timed(fn, pix.copy(), "histogram")
+                diff = np.abs(ref - res)
+                print(
+                    "{:>6} {:>6} {:>12} {:>10.3f} {:>10.3f} {:>10.5f} {:>10.6f}".format(
+                        size, data, name, t_exact, t_hist, diff.max(), diff.mean()
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
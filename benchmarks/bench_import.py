@@ -0,0 +1,76 @@
+"""
+Start-up cost of the core package, each measured in a fresh interpreter.
+
+    python benchmarks/bench_import.py [--repeat 5]
+
+"import" is what registering the add-on pulls in from core, "worker" what a batch worker
+imports before its first image; "first filter" adds the first gaussian blur call, which is
+where numpy really gets loaded. Plain `import numpy` (and cupy, if installed) for reference.
+"""
+
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("import", "import core.filters, core.pixel_io, core.tiled"),
+    ("worker", "import core.batch; core.batch._init_worker()"),
+    (
+        "first filter",
+        "import core.filters\n"
+        "from core.backend import np\n"
+        "core.filters.gaussian_repeat(np.zeros((64, 64, 4), dtype=np.float32), 2)",
+    ),
+    ("numpy", "import numpy; numpy.zeros(1)"),
+]
+
+TEMPLATE = """
+import sys, time, types
+sys.path.insert(0, {path!r})
+t0 = time.perf_counter()
+{code}
+t = time.perf_counter() - t0
+np = sys.modules.get("numpy")
+loaded = np is not None and type(np) is types.ModuleType
+print(t, loaded, "cupy" in sys.modules)
+"""
+
+
+def measure(code, repeat):
+    best = None
+    for _ in range(repeat):
+        script = TEMPLATE.format(path=ADDON_DIR, code=code)
+        out = subprocess.run(
+            [sys.executable, "-c", script], check=True, capture_output=True, text=True
+        ).stdout.split()
+        res = (float(out[0]), out[1] == "True", out[2] == "True")
+        if best is None or res[0] < best[0]:
+            best = res
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = list(CASES)
+    if importlib.util.find_spec("cupy") is not None:
+        cases.append(("cupy", "import cupy"))
+
+    print("{:>14} {:>10} {:>8} {:>8}".format("case", "time (ms)", "numpy", "cupy"))
+    for name, code in cases:
+        t, np_loaded, cp_loaded = measure(code, args.repeat)
+        print(
+            "{:>14} {:>10.1f} {:>8} {:>8}".format(
+                name, t * 1000, "yes" if np_loaded else "no", "yes" if cp_loaded else "no"
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
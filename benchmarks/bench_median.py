@@ -0,0 +1,75 @@
+"""
+Blob median filter speed, running rank engine vs. the old per column / per row sort loops.
+
+    python benchmarks/bench_median.py [--size 1024] [--widths 1 2 4 8 16 32] [--skip-old]
+
+The old loops are the ones median_filter_blobs ran before core.rank, on a square image (they
+went out of bounds on non-square ones). "same" checks the new result matches them exactly.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import filters  # noqa:E402
+
+PICKS = {"start": "erode", "center": "neutral", "end": "dilate"}
+
+
+def old_loops(pix, s, picked):
+    ph, pw = pix.shape[0], pix.shape[1]
+    pick = {"start": 0, "center": s, "end": s * 2 - 1}[picked]
+
+    temp = pix.copy()
+    r = np.zeros((ph, s * 2, 4), dtype=np.float32)
+    for x in range(pw):
+        r[:, :, :] = temp[:, np.arange(x - s, x + s) % pw, :]
+        pix[:, x, :] = np.sort(r, axis=1)[:, pick, :]
+
+    temp = pix.copy()
+    r = np.zeros((s * 2, pw, 4), dtype=np.float32)
+    for y in range(ph):
+        r[:, :, :] = temp[np.arange(y - s, y + s) % ph, :, :]
+        pix[y, :, :] = np.sort(r, axis=0)[pick, :, :]
+
+    return pix
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--widths", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--skip-old", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pix = rng.random((args.size, args.size, 4), dtype=np.float32)
+
+    print("{:>6} {:>8} {:>10} {:>10} {:>6}".format("width", "style", "new (s)", "old (s)", "same"))
+    for s in args.widths:
+        for picked, name in PICKS.items():
+            res, t_new = timed(filters.median_filter_blobs, pix.copy(), s, picked)
+            if args.skip_old:
+                print("{:>6} {:>8} {:>10.4f} {:>10} {:>6}".format(s, name, t_new, "-", "-"))
+                continue
+            ref, t_old = timed(old_loops, pix.copy(), s, picked)
+            print(
+                "{:>6} {:>8} {:>10.4f} {:>10.4f} {:>6}".format(
+                    s, name, t_new, t_old, "yes" if np.array_equal(res, ref) else "no"
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+The numba kernels against the numpy implementations of the same filters, by thread count.
+
+    python benchmarks/bench_numba.py [--size 1024] [--threads 1 2 4]
+
+Threads default to powers of two up to the core count. "first (s)" is the first call in
+this process, compiling the kernels or loading them from the on-disk cache; the other
+times are the best of --repeat runs after that. Error is the largest absolute difference
+to the numpy result.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import filters  # noqa:E402
+from core import registry  # noqa:E402
+
+CASES = [
+    ("bilateral", lambda pix: filters.bilateral_filter(pix, 3.0, 0.2, "")),
+    ("median_filter_blobs", lambda pix: filters.median_filter_blobs(pix, 8, "center")),
+    ("gimpify", lambda pix: filters.gimpify(pix)),
+    ("inpaint_tangents", lambda pix: filters.inpaint_tangents(pix, 0.5)),
+]
+
+
+def timed(fn, pix, repeat=1):
+    best = None
+    for _ in range(repeat):
+        src = pix.copy()
+        t0 = time.perf_counter()
+        res = fn(src)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return res, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--threads", type=int, nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not registry.usable("numba"):
+        print("numba is not available")
+        return
+    numba = registry.BACKENDS["numba"].module
+
+    cores = numba.config.NUMBA_NUM_THREADS
+    threads = args.threads or [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+
+    rng = np.random.default_rng(0)
+    pix = rng.random((args.size, args.size, 4), dtype=np.float32)
+    # a few dents for the tangent inpainting
+    pix[..., 2] = np.where(rng.random(pix.shape[:2]) < 0.01, 0.1, 0.9)
+
+    print(
+        "{:>20} {:>8} {:>10} {:>10} {:>10} {:>8} {:>9}".format(
+            "filter", "threads", "numpy (s)", "first (s)", "numba (s)", "speedup", "error"
+        )
+    )
+    for name, fn in CASES:
+        with registry.using("numpy"):
+            ref, t_numpy = timed(fn, pix)
+
+        with registry.using("numba"):
+            numba.set_num_threads(threads[-1])
+            _, t_first = timed(fn, pix)
+            for n in threads:
+                numba.set_num_threads(n)
+                res, t = timed(fn, pix, args.repeat)
+                print(
+                    "{:>20} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>7.1f}x {:>9.2e}".format(
+                        name,
+                        n,
+                        t_numpy,
+                        t_first,
+                        t,
+                        t_numpy / t,
+                        float(np.abs(ref.astype(np.float64) - res).max()),
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Every operator payload on synthetic textures, per backend, against a committed baseline.
+
+    python benchmarks/bench_payloads.py [--sizes 512 2048 4096 8192] [--ops bilateral ...]
+        [--textures photo normals] [--backends numpy numba] [--repeat 2]
+        [--baseline benchmarks/baseline.json] [--tolerance 0.25] [--update]
+
+The add-on is imported through the bpy stand-in in stub_bpy.py and each *_IOP payload runs
+with its default property values on the textures in textures.py, the way the operator would
+run it on pixels read from an image. Backends default to every usable one.
+
+Per run: the best wall time of --repeat runs, or of as many as fit in a quarter second for
+quick payloads (after a warm-up on a small texture, which also compiles the numba kernels),
+megapixels per second, peak RSS above what the process held before the run, and
+allocations as counted by core.trace (arrays returned by filter ops and pixel reads), and
+the size of the result as the cache would keep it, which is less than RGBA for results in a
+compact layout (see core.layout). Peak RSS only counts memory the process didn't already
+have, and is only per run on Linux, elsewhere it is the peak of the process.
+
+Results are compared to the baseline where it has the same op, texture, size and backend:
+a run more than --tolerance slower, or with more allocations, or more than --tolerance
+(and 16 MB) more memory is a regression and the exit status is 1. --update writes the
+results into the baseline instead, keeping entries that weren't run. Baselines are only
+comparable on the machine they were made on, which they record.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_bpy  # noqa:E402
+import textures  # noqa:E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# below this much growth peak RSS is noise
+RSS_SLACK_MB = 16
+MIN_SECONDS = 0.25
+MAX_RUNS = 50
+
+COLUMNS = (
+    "op",
+    "texture",
+    "size",
+    "backend",
+    "time (s)",
+    "MPix/s",
+    "RSS (MB)",
+    "allocs",
+    "out (MB)",
+    "vs base",
+)
+HEADER = "{:>20} {:>8} {:>5} {:>7} {:>10} {:>8} {:>9} {:>7} {:>8} {:>7}"
+ROW = "{:>20} {:>8} {:>5} {:>7} {:>10.4f} {:>8.1f} {:>9.1f} {:>7} {:>8.1f} {:>7}  {}"
+
+
+def _rss_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def _reset_peak_rss():
+    """Start a new peak RSS measurement, the current RSS in MB, None where it can't be reset"""
+    try:
+        # Linux: 5 resets the peak resident set size of the process
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _rss_kb("VmRSS") / 1024
+    except OSError:
+        return None
+
+
+def _peak_rss():
+    try:
+        return _rss_kb("VmHWM") / 1024
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def machine(registry):
+    numba = registry.BACKENDS["numba"].module
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__ if numba else None,
+    }
+
+
+def measure(payload, pix, repeat, trace):
+    best = None
+    spent = runs = 0
+    # short runs repeat until they add up to MIN_SECONDS, the best of a few is noise
+    while runs < repeat or (spent < MIN_SECONDS and runs < MAX_RUNS):
+        runs += 1
+        src = pix.copy()
+        before = _reset_peak_rss()
+        trace.enable()
+        t0 = time.perf_counter()
+        res = payload.run(src)
+        t = time.perf_counter() - t0
+        spent += t
+        rec = trace.disable()
+        out_mb = res.nbytes / 2**20
+        del src, res
+        if best is None or t < best["seconds"]:
+            best = {
+                "seconds": round(t, 6),
+                "mpix_s": round(pix.shape[0] * pix.shape[1] / t / 1e6, 2),
+                "peak_rss_mb": round(max(_peak_rss() - (before or 0), 0.0), 1),
+                "allocations": rec.counters.get("allocations", 0),
+                "result_mb": round(out_mb, 2),
+            }
+    return best
+
+
+def compare(res, base, tolerance):
+    """(regressions, improvements) against the baseline entry, lists of words"""
+    worse, better = [], []
+    ratio = res["seconds"] / base["seconds"]
+    if ratio > 1 + tolerance:
+        worse.append("slower")
+    elif ratio < 1 / (1 + tolerance):
+        better.append("faster")
+    if res["allocations"] > base["allocations"]:
+        worse.append("more allocations")
+    elif res["allocations"] < base["allocations"]:
+        better.append("fewer allocations")
+    if res["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance) + RSS_SLACK_MB:
+        worse.append("more memory")
+    return worse, better
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048])
+    parser.add_argument("--ops", nargs="+")
+    parser.add_argument("--textures", nargs="+", choices=sorted(textures.TEXTURES))
+    parser.add_argument("--backends", nargs="+")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args()
+
+    addon = stub_bpy.load_addon()
+    registry = addon.core.registry
+    trace = addon.core.trace
+    payloads = stub_bpy.payloads(addon)
+    ops = args.ops or list(payloads)
+    unknown = set(ops) - set(payloads)
+    if unknown:
+        parser.error("unknown ops: {} (known: {})".format(sorted(unknown), ", ".join(payloads)))
+    backends = args.backends or [n for n in registry.ORDER if registry.usable(n)]
+    names = args.textures or list(textures.TEXTURES)
+
+    baseline = {"machine": None, "results": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    here = machine(registry)
+    if baseline["machine"] and baseline["machine"] != here and not args.update:
+        print("baseline made elsewhere, times may not compare: {}".format(baseline["machine"]))
+
+    print(HEADER.format(*COLUMNS))
+    results = {}
+    regressions = 0
+    warm = set()
+    for size in args.sizes:
+        pixels = {name: textures.make(name, size) for name in names}
+        for op in ops:
+            for b in backends:
+                with registry.using(b):
+                    if (op, b) not in warm:
+                        payloads[op].run(textures.make(names[0], 64))
+                        warm.add((op, b))
+                    for name in names:
+                        key = "{}/{}/{}/{}".format(op, name, size, b)
+                        res = measure(payloads[op], pixels[name], args.repeat, trace)
+                        results[key] = res
+                        base = baseline["results"].get(key)
+                        ratio, note = "-", "new"
+                        if base is not None:
+                            worse, better = compare(res, base, args.tolerance)
+                            regressions += bool(worse)
+                            ratio = "{:.2f}x".format(res["seconds"] / base["seconds"])
+                            note = ", ".join([w.upper() for w in worse] + better)
+                        print(ROW.format(op, name, size, b, *res.values(), ratio, note))
+        del pixels
+
+    if args.update:
+        baseline["machine"] = here
+        baseline["results"].update(results)
+        baseline["results"] = dict(sorted(baseline["results"].items()))
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1)
+            f.write("\n")
+        print("baseline written to {}".format(args.baseline))
+    elif regressions:
+        print("{} regression(s) against {}".format(regressions, args.baseline))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Round-trip throughput of the Blender pixel transfer.
+
+    python benchmarks/bench_pixel_io.py [--sizes 1024 4096 8192] [--legacy]
+
+--legacy also times the old `pixels[:]` / `.tolist()` path, which needs several GB of
+memory at 8K.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import pixel_io  # noqa:E402
+from mock_image import noise_image  # noqa:E402
+
+
+def roundtrip_buffer(image):
+    pix = pixel_io.read_pixels(image)
+    pixel_io.write_pixels(image, pix)
+
+
+def roundtrip_legacy(image):
+    pix = np.array(image.pixels[:], dtype=np.float32).reshape(image.size[1], image.size[0], 4)
+    image.pixels.foreach_set(np.array(pix.ravel().tolist(), dtype=np.float32))
+
+
+def best_of(fn, image, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(image)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096, 8192])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy", action="store_true")
+    args = parser.parse_args()
+
+    methods = [("buffer", roundtrip_buffer)]
+    if args.legacy:
+        methods.append(("legacy", roundtrip_legacy))
+
+    print("{:>6} {:>8} {:>10} {:>12}".format("size", "method", "time (s)", "MB/s"))
+    for size in args.sizes:
+        image = noise_image(size, size)
+        # read + write
+        mbytes = 2 * size * size * 4 * 4 / 1e6
+        for name, fn in methods:
+            t = best_of(fn, image, args.repeat)
+            print("{:>6} {:>8} {:>10.4f} {:>12.1f}".format(size, name, t, mbytes / t))
+        del image
+
+
+if __name__ == "__main__":
+    main()
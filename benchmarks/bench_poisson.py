@@ -0,0 +1,177 @@
+"""
+Wall time to reach a residual, Poisson solvers vs. the old strided Jacobi loops.
+
+    python benchmarks/bench_poisson.py [--sizes 512 1024 2048] [--tol 1e-4]
+
+The right hand side is the divergence of a random smooth slope field, like the one
+normals_to_height builds from a normal map. The old loop is the one normals_to_height ran
+before core.poisson: 200 Jacobi sweeps at each of the strides 16, 8, 4, 2, then stride 1
+sweeps with the residual checked every 50, until it gets there or gives up at 5000.
+
+A second table counts allocations per multigrid iteration (residual check and V-cycle) once
+the full multigrid start and a first iteration have filled the workspace: new workspace
+buffers, and the most memory tracemalloc saw allocated on top of what was there before the
+iteration, which is whatever temporaries it made. What is left there is the same at every
+size: numpy's ufunc iteration buffers for the column shifted views (at most 8192 elements
+per operand), scalars, array views and the FFT of the coarsest grid, nothing the size of an
+image. Masked runs clear a random 10%.
+
+Last, delight (the fill="max" solve) on a 128 pixel photo with transparent areas, multigrid
+at --tol against Jacobi run to a hundredth of it. They must agree within --tol, otherwise the
+exit status is 1.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import textures  # noqa:E402
+from core import blur, filters, pixel_io, poisson  # noqa:E402
+from core.workspace import Workspace  # noqa:E402
+
+
+def test_slopes(size, seed=0):
+    rng = np.random.default_rng(seed)
+    v = blur.gaussian(rng.standard_normal((size, size, 4)).astype(np.float32), 8, method="box")
+    return v[..., 0], v[..., 1]
+
+
+def divergence(vx, vy, k=1):
+    f = np.roll(vx, -k, axis=1) - np.roll(vx, k, axis=1)
+    f += np.roll(vy, -k, axis=0) - np.roll(vy, k, axis=0)
+    return f * 0.5
+
+
+def relative_residual(u, f):
+    t = np.empty_like(u)
+    r = poisson.neighbour_sum(u, t) - 4.0 * u - f
+    return float(np.sqrt(np.mean(r * r)) / np.sqrt(np.mean(f * f)))
+
+
+def old_loops(vx, vy, tol, grid_steps=4, iterations=200, max_sweeps=5000):
+    f = divergence(vx, vy)
+    u = np.ones(f.shape, dtype=np.float32) * 0.5
+    t = np.empty_like(u)
+    sweeps = 0
+    for k in range(grid_steps, -1, -1):
+        k = 2**k
+        n = divergence(vx, vy, k) * -0.25
+        for ic in range(iterations if k > 1 else max_sweeps):
+            t[:-k, :] = u[k:, :]
+            t[-k:, :] = u[:k, :]
+            t[k:, :] += u[:-k, :]
+            t[:k, :] += u[-k:, :]
+            t[:, :-k] += u[:, k:]
+            t[:, -k:] += u[:, :k]
+            t[:, k:] += u[:, :-k]
+            t[:, :k] += u[:, -k:]
+            t *= 0.25
+            u = t + n
+            sweeps += 1
+            if k == 1 and ic % 50 == 49 and relative_residual(u, f) < tol:
+                break
+    return u, sweeps, relative_residual(u, f)
+
+
+def delight_difference(size, tol):
+    """Largest difference of delight with multigrid at tol against Jacobi at a hundredth"""
+    pix = textures.photo(size).copy()
+    pix[..., 3] = 1.0
+    pix[size // 4 : size // 2, size // 8 : size - size // 8, 3] = 0.0
+    pix[-size // 8 :, :, 3] = 0.0
+    mg = filters.delight_simple(pix, -1.0, method="multigrid", tol=tol)
+    jacobi = filters.delight_simple(pix, -1.0, method="jacobi", tol=tol / 100, iterations=10**6)
+    return float(np.abs(pixel_io.to_host(mg) - pixel_io.to_host(jacobi)).max())
+
+
+def cycle_allocations(f, mask=None, cycles=5):
+    """(workspace buffers, workspace MB, new buffers per cycle, worst temporary KB per cycle)"""
+    ws = Workspace(np)
+    rhs = poisson._rhs(f - f.mean() if mask is None else f, mask, 0.0)
+    m = np.ones(f.shape, dtype=np.float32) if mask is None else mask
+    levels = poisson._build_levels(m, mask is None, ws)
+    u = poisson._fmg(levels, rhs)
+
+    def iteration():
+        poisson._rms(levels[0].residual(u, rhs), ws)
+        poisson._vcycle(levels, 0, u, rhs)
+
+    iteration()
+    start = ws.allocations
+    temp = 0
+    tracemalloc.start()
+    for _ in range(cycles):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        iteration()
+        temp = max(temp, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return start, ws.nbytes / 2**20, (ws.allocations - start) / cycles, temp / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--tol", type=float, default=1e-4)
+    parser.add_argument("--skip-old", action="store_true")
+    args = parser.parse_args()
+
+    print(
+        "{:>6} {:>10} {:>10} {:>12} {:>12}".format(
+            "size", "solver", "time (s)", "iterations", "residual"
+        )
+    )
+    for size in args.sizes:
+        vx, vy = test_slopes(size)
+        f = divergence(vx, vy)
+        for method in ("multigrid", "fft"):
+            t0 = time.perf_counter()
+            u, info = poisson.poisson_solve(f, method=method, tol=args.tol)
+            t = time.perf_counter() - t0
+            res = relative_residual(u, f - f.mean())
+            print(
+                "{:>6} {:>10} {:>10.3f} {:>12} {:>12.2e}".format(
+                    size, method, t, info.iterations, res
+                )
+            )
+        if not args.skip_old:
+            t0 = time.perf_counter()
+            u, sweeps, res = old_loops(vx, vy, args.tol)
+            t = time.perf_counter() - t0
+            print(
+                "{:>6} {:>10} {:>10.3f} {:>12} {:>12.2e}".format(size, "old loops", t, sweeps, res)
+            )
+
+    print()
+    print(
+        "{:>6} {:>8} {:>10} {:>10} {:>12} {:>12}".format(
+            "size", "mask", "buffers", "MB", "new/cycle", "temp KB/cycle"
+        )
+    )
+    for size in args.sizes:
+        f = divergence(*test_slopes(size))
+        rng = np.random.default_rng(0)
+        mask = (rng.random(f.shape) > 0.1).astype(np.float32)
+        for name, m in (("none", None), ("10%", mask)):
+            print(
+                "{:>6} {:>8} {:>10} {:>10.1f} {:>12.1f} {:>12.1f}".format(
+                    size, name, *cycle_allocations(f, m)
+                )
+            )
+
+    print()
+    diff = delight_difference(128, args.tol)
+    print("masked delight, multigrid against jacobi, max difference {:.2e}".format(diff))
+    if diff > args.tol:
+        print("multigrid and jacobi disagree by more than --tol")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
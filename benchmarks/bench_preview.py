@@ -0,0 +1,97 @@
+"""
+Proxy preview: time to the first (reduced resolution) preview against time to the full
+resolution result.
+
+    python benchmarks/bench_preview.py [--size 2048] [--factors 4 8]
+
+"preview" covers building the proxy pyramid, running the filter on the proxy with spatial
+parameters scaled down, and upsampling the result to the full size. "cached" is the same
+with the pyramid already built, as it is when only settings change. Error is the mean
+absolute difference of the upsampled preview to the full result.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import filters  # noqa:E402
+from core import proxy  # noqa:E402
+
+# name, function of (pixels, params), params, parameters measured in pixels
+CASES = [
+    (
+        "bilateral",
+        lambda pix, p: filters.bilateral_filter(pix, p["sigma_a"], p["sigma_b"], ""),
+        dict(sigma_a=6.0, sigma_b=0.3),
+        ("sigma_a",),
+    ),
+    (
+        "normals_to_height",
+        lambda pix, p: filters.normals_to_height(pix, method=p["method"], iterations=100),
+        dict(method="multigrid"),
+        (),
+    ),
+    (
+        "contrast_balance",
+        lambda pix, p: filters.contrast_balance(pix, p["gA"], p["gB"], 1.0),
+        dict(gA=20, gB=40),
+        ("gA", "gB"),
+    ),
+]
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--factors", type=int, nargs="+", default=[4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cells = rng.random((16, 16, 4), dtype=np.float32)
+    reps = args.size // 16
+    pix = np.repeat(np.repeat(cells, reps, axis=0), reps, axis=1)
+    pix += rng.normal(0.0, 0.03, pix.shape).astype(np.float32)
+    pix[..., 3] = 1.0
+
+    print(
+        "{:>18} {:>7} {:>12} {:>11} {:>9} {:>9}".format(
+            "filter", "proxy", "preview (s)", "cached (s)", "full (s)", "error"
+        )
+    )
+    for name, fn, params, spatial in CASES:
+        full, t_full = timed(fn, pix.copy(), params)
+        for factor in args.factors:
+
+            def _preview():
+                small = proxy.level(pix, factor, key=name)
+                res = fn(small.copy(), proxy.scale_params(params, spatial, factor))
+                return proxy.upsample(res, pix.shape)
+
+            proxy.clear()
+            preview, t_first = timed(_preview)
+            _, t_cached = timed(_preview)
+            print(
+                "{:>18} {:>7} {:>12.3f} {:>11.3f} {:>9.3f} {:>9.4f}".format(
+                    name,
+                    "1/{}".format(factor),
+                    t_first,
+                    t_cached,
+                    t_full,
+                    float(np.abs(preview - full).mean()),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
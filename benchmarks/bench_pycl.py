@@ -0,0 +1,141 @@
+"""
+OpenCL program binary cache and kernel launch overhead in pycl.
+
+    python benchmarks/bench_pycl.py [--launches 2000]
+
+"cold" builds the program from source into an empty binary cache, "warm" builds it again
+from the cached binaries, as a later session would. Launch overhead is the time per enqueue
+of a tiny kernel (finishing the queue once at the end): setting the arguments through
+kernel(...) every time, with pre-bound arguments, and with pre-bound arguments of which one
+is replaced per launch.
+
+Needs an OpenCL platform, a CPU one such as pocl is fine. pocl keeps its own kernel cache,
+which is turned off here so the cold build really compiles.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("POCL_KERNEL_CACHE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOURCE = """
+kernel void mxplusb(float m, global const float *x, float b, global float *out) {
+    int i = get_global_id(0);
+    out[i] = m * x[i] + b;
+}
+
+kernel void blur5(global const float *src, global float *dst, int w, int h) {
+    int x = get_global_id(0);
+    int y = get_global_id(1);
+    const float taps[5] = {0.0625f, 0.25f, 0.375f, 0.25f, 0.0625f};
+    float acc = 0.0f;
+    for (int j = -2; j <= 2; j++)
+        for (int i = -2; i <= 2; i++)
+            acc += taps[i + 2] * taps[j + 2] * src[((y + j + h) % h) * w + (x + i + w) % w];
+    dst[y * w + x] = acc;
+}
+"""
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t0
+
+
+def run_mxplusb(pycl, queue, program, x):
+    kernel = program["mxplusb"]
+    kernel.argtypes = (pycl.cl_float, pycl.cl_mem, pycl.cl_float, pycl.cl_mem)
+    x_buf, evt = pycl.buffer_from_ndarray(queue, x)
+    y_buf = x_buf.empty_like_this()
+    evt = kernel(2.0, x_buf, 5.0, y_buf).on(queue, len(x), wait_for=evt)
+    y, evt = pycl.buffer_to_ndarray(queue, y_buf, like=x, wait_for=evt)
+    evt.wait()
+    return y
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--launches", type=int, default=2000)
+    args = parser.parse_args()
+
+    try:
+        import pycl
+    except RuntimeError as e:
+        print(e)
+        return
+    try:
+        ctx = pycl.clCreateContext()
+    except pycl.OpenCLError as e:
+        print("No usable OpenCL platform: {}".format(type(e).__name__))
+        return
+    queue = pycl.clCreateCommandQueue(ctx)
+    print("device: {}".format(ctx.devices[0].name))
+
+    # the first build in a process also loads the compiler, keep that out of the timings
+    pycl.clCreateProgramWithSource(ctx, "kernel void nop() {}").build()
+
+    x = np.arange(1024, dtype=np.float32)
+    cache_dir = tempfile.mkdtemp(prefix="pycl_bench_")
+    try:
+        cold, t_cold = timed(lambda: pycl.build_program_cached(ctx, SOURCE, cache_dir=cache_dir))
+        warm, t_warm = timed(lambda: pycl.build_program_cached(ctx, SOURCE, cache_dir=cache_dir))
+        _, t_source = timed(lambda: pycl.clCreateProgramWithSource(ctx, SOURCE).build())
+        same = np.array_equal(run_mxplusb(pycl, queue, cold, x), run_mxplusb(pycl, queue, warm, x))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print("{:>28} {:>12}".format("build", "time (ms)"))
+    print("{:>28} {:>12.2f}".format("from source, no cache", t_source * 1e3))
+    print("{:>28} {:>12.2f}".format("cold cache", t_cold * 1e3))
+    print("{:>28} {:>12.2f}".format("warm cache", t_warm * 1e3))
+    print("cached binary gives the same result: {}".format("yes" if same else "no"))
+
+    kernel = warm["mxplusb"]
+    kernel.argtypes = (pycl.cl_float, pycl.cl_mem, pycl.cl_float, pycl.cl_mem)
+    x_buf, evt = pycl.buffer_from_ndarray(queue, x)
+    evt.wait()
+    y_buf = x_buf.empty_like_this()
+    z_buf = x_buf.empty_like_this()
+    n = len(x)
+
+    def _setarg():
+        for _ in range(args.launches):
+            kernel(2.0, x_buf, 5.0, y_buf).on(queue, n)
+        pycl.clFinish(queue)
+
+    def _bound():
+        call = kernel.bind(2.0, x_buf, 5.0, y_buf)
+        for _ in range(args.launches):
+            call.on(queue, n)
+        pycl.clFinish(queue)
+
+    def _bound_update():
+        call = kernel.bind(2.0, x_buf, 5.0, y_buf)
+        outs = (y_buf, z_buf)
+        for i in range(args.launches):
+            call.update(3, outs[i % 2])
+            call.on(queue, n)
+        pycl.clFinish(queue)
+
+    print()
+    print("{:>28} {:>12}".format("launch", "per call (us)"))
+    for name, fn in (
+        ("kernel(...).on()", _setarg),
+        ("bound .on()", _bound),
+        ("bound, one arg updated", _bound_update),
+    ):
+        fn()
+        _, t = timed(fn)
+        print("{:>28} {:>12.1f}".format(name, t / args.launches * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Tile throughput of the pycl path: a kernel run over an image in row bands.
+
+    python benchmarks/bench_pycl_tiles.py [--size 2048] [--rows 256] [--runs 3]
+
+    allocate   -- new device buffers per tile, blocking transfers (buffer_from_ndarray as is)
+    pool       -- buffers from a buffer_pool, blocking transfers
+    pipelined  -- pipeline_tiles on one in-order queue
+    3 queues   -- pipeline_tiles with separate upload, compute and download queues
+
+Each mode runs the whole image --runs times, so the pooled ones only allocate in the first
+run. "same" compares the output to that of the first mode (numpy differs in the last bit
+where the device fuses the multiply-add). Needs an OpenCL platform, a CPU one such as pocl is fine.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOURCE = """
+kernel void levels(global const float *src, global float *dst, float gain, float lift) {
+    int i = get_global_id(0);
+    dst[i] = clamp(src[i] * gain + lift, 0.0f, 1.0f);
+}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--rows", type=int, default=256)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import pycl
+    except RuntimeError as e:
+        print(e)
+        return
+    try:
+        ctx = pycl.clCreateContext()
+    except pycl.OpenCLError as e:
+        print("No usable OpenCL platform: {}".format(type(e).__name__))
+        return
+    print("device: {}".format(ctx.devices[0].name))
+    queues = [pycl.clCreateCommandQueue(ctx) for _ in range(3)]
+    kernel = pycl.build_program_cached(ctx, SOURCE)["levels"]
+    kernel.argtypes = (pycl.cl_mem, pycl.cl_mem, pycl.cl_float, pycl.cl_float)
+
+    rng = np.random.default_rng(0)
+    pix = rng.random((args.size, args.size, 4), dtype=np.float32)
+
+    def _bands(out):
+        for r in range(0, args.size, args.rows):
+            yield pix[r : r + args.rows], out[r : r + args.rows]
+
+    def _blocking(pool):
+        out = np.empty_like(pix)
+        q = queues[0]
+        for src, dst in _bands(out):
+            src_buf, _ = pycl.buffer_from_ndarray(q, src, pool=pool)
+            dst_buf = pool.get(dst.nbytes) if pool else src_buf.empty_like_this()
+            kernel(src_buf, dst_buf, 1.5, -0.1).on(q, src.size).wait()
+            pycl.buffer_to_ndarray(q, dst_buf, out=dst)
+            if pool:
+                pool.put(src_buf)
+                pool.put(dst_buf)
+        return out
+
+    call = kernel.bind(None, None, 1.5, -0.1)
+
+    def _launch(queue, src_buf, dst_buf, src, wait_for):
+        call.update(0, src_buf)
+        call.update(1, dst_buf)
+        return call.on(queue, src.size, wait_for=wait_for)
+
+    def _pipelined(qs):
+        out = np.empty_like(pix)
+        pycl.pipeline_tiles(qs, _bands(out), _launch, pool=pool)
+        return out
+
+    pool = pycl.buffer_pool(ctx)
+    modes = [
+        ("allocate", lambda: _blocking(None)),
+        ("pool", lambda: _blocking(pool)),
+        ("pipelined", lambda: _pipelined(queues[0])),
+        ("3 queues", lambda: _pipelined(tuple(queues))),
+    ]
+
+    print(
+        "{:>12} {:>10} {:>10} {:>12} {:>6}".format(
+            "mode", "time (s)", "MB/s", "allocations", "same"
+        )
+    )
+    ref = None
+    for name, fn in modes:
+        pool.clear()
+        pool.allocations = 0
+        t0 = time.perf_counter()
+        for _ in range(args.runs):
+            out = fn()
+        t = (time.perf_counter() - t0) / args.runs
+        if ref is None:
+            ref = out
+        allocs = (
+            pool.allocations if name != "allocate" else args.runs * 2 * -(-args.size // args.rows)
+        )
+        print(
+            "{:>12} {:>10.3f} {:>10.0f} {:>12} {:>6}".format(
+                name, t, pix.nbytes / t / 2**20, allocs, "yes" if np.array_equal(out, ref) else "no"
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Copies made getting strided views and tiles through a kernel with pycl, counted.
+
+    python benchmarks/bench_pycl_zerocopy.py [--size 2048] [--rows 256]
+
+channel -- one channel of an RGBA image through a kernel and back into the image
+    copy       contiguous temporaries on the host, plain reads and writes
+    rect       rectangular reads and writes straight from and into the strided view
+tiles -- the whole image through a kernel in row bands
+    transfers  a write and a read per band
+    zero copy  buffers over the host arrays, a sub-buffer per band, one map at the end
+
+"transfers" counts the reads and writes pycl enqueued and their megabytes, "host temp" the
+largest amount of host memory allocated on the way (numpy reports its arrays to
+tracemalloc). "in place" says whether mapping the output gave back the output array's own
+memory. Needs an OpenCL platform that shares memory with the host, a CPU one such as pocl.
+"""
+
+import argparse
+import functools
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOURCE = """
+kernel void scale(global const float *src, global float *dst, float gain) {
+    int i = get_global_id(0);
+    dst[i] = src[i] * gain;
+}
+"""
+
+_counts = {"calls": 0, "bytes": 0}
+
+
+def _count(pycl, name, nbytes):
+    # wrap a pycl transfer function, the helpers look it up in the module when called
+    fn = getattr(pycl, name)
+
+    @functools.wraps(fn)
+    def _wrapped(*args, **kw):
+        _counts["calls"] += 1
+        _counts["bytes"] += nbytes(*args, **kw)
+        return fn(*args, **kw)
+
+    setattr(pycl, name, _wrapped)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--rows", type=int, default=256)
+    args = parser.parse_args()
+
+    try:
+        import pycl
+    except RuntimeError as e:
+        print(e)
+        return
+    try:
+        ctx = pycl.clCreateContext()
+    except pycl.OpenCLError as e:
+        print("No usable OpenCL platform: {}".format(type(e).__name__))
+        return
+    print("device: {}".format(ctx.devices[0].name))
+    queue = pycl.clCreateCommandQueue(ctx)
+    kernel = pycl.build_program_cached(ctx, SOURCE)["scale"]
+    kernel.argtypes = (pycl.cl_mem, pycl.cl_mem, pycl.cl_float)
+
+    _count(pycl, "clEnqueueReadBuffer", lambda q, m, p, size=None, *a, **k: size)
+    _count(pycl, "clEnqueueWriteBuffer", lambda q, m, p, size=None, *a, **k: size)
+    rect = lambda q, m, p, region, *a, **k: int(np.prod(region))  # noqa:E731
+    _count(pycl, "clEnqueueReadBufferRect", rect)
+    _count(pycl, "clEnqueueWriteBufferRect", rect)
+
+    h = w = args.size
+    pix = pycl.empty_aligned((h, w, 4))
+    pix[...] = np.random.default_rng(0).random(pix.shape, dtype=np.float32)
+    gain = 0.5
+
+    def channel_copy(out):
+        tmp = np.ascontiguousarray(pix[..., 0])
+        src, _ = pycl.buffer_from_ndarray(queue, tmp)
+        dst = src.empty_like_this()
+        kernel(src, dst, gain).on(queue, tmp.size).wait()
+        res, _ = pycl.buffer_to_ndarray(queue, dst, like=tmp)
+        out[..., 0] = res
+
+    def channel_rect(out):
+        src, _ = pycl.buffer_from_ndarray(queue, pix[..., 0])
+        dst = src.empty_like_this()
+        kernel(src, dst, gain).on(queue, h * w).wait()
+        pycl.buffer_to_ndarray(queue, dst, out=out[..., 0])
+
+    def tiles_transfers(out):
+        for r in range(0, h, args.rows):
+            band = pix[r : r + args.rows]
+            src, _ = pycl.buffer_from_ndarray(queue, band)
+            dst = src.empty_like_this()
+            kernel(src, dst, gain).on(queue, band.size).wait()
+            pycl.buffer_to_ndarray(queue, dst, out=out[r : r + args.rows])
+
+    def tiles_zero_copy(out):
+        src = pycl.buffer_over_ndarray(ctx, pix, pycl.cl_mem_flags.CL_MEM_READ_ONLY)
+        dst = pycl.buffer_over_ndarray(ctx, out)
+        row = w * 4 * 4
+        call = kernel.bind(None, None, gain)
+        for r in range(0, h, args.rows):
+            n = min(args.rows, h - r)
+            call.update(0, pycl.clCreateSubBuffer(src, r * row, n * row))
+            call.update(1, pycl.clCreateSubBuffer(dst, r * row, n * row))
+            call.on(queue, n * w * 4)
+        mapped, evt = pycl.map_ndarray(queue, dst, out.shape)
+        evt.wait()
+        in_place = mapped.__array_interface__["data"][0] == out.__array_interface__["data"][0]
+        pycl.unmap_ndarray(queue, dst, mapped).wait()
+        return in_place
+
+    channel_ref = pix.copy()
+    channel_ref[..., 0] *= np.float32(gain)
+    tiles_ref = pix * np.float32(gain)
+    cases = [
+        ("channel", "copy", channel_copy, channel_ref),
+        ("channel", "rect", channel_rect, channel_ref),
+        ("tiles", "transfers", tiles_transfers, tiles_ref),
+        ("tiles", "zero copy", tiles_zero_copy, tiles_ref),
+    ]
+
+    print(
+        "{:>8} {:>10} {:>9} {:>10} {:>13} {:>14} {:>9} {:>5}".format(
+            "case",
+            "mode",
+            "time (s)",
+            "transfers",
+            "moved (MB)",
+            "host temp (MB)",
+            "in place",
+            "same",
+        )
+    )
+    for case, mode, fn, ref in cases:
+        out = pycl.empty_aligned(pix.shape)
+        out[...] = pix
+        fn(out)  # warm up
+        out[...] = pix
+        _counts.update(calls=0, bytes=0)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        in_place = fn(out)
+        t = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            "{:>8} {:>10} {:>9.3f} {:>10} {:>13.1f} {:>14.1f} {:>9} {:>5}".format(
+                case,
+                mode,
+                t,
+                _counts["calls"],
+                _counts["bytes"] / 2**20,
+                peak / 2**20,
+                {True: "yes", False: "no", None: "-"}[in_place],
+                "yes" if np.array_equal(out, ref) else "no",
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Speed against accuracy of the approximate fast paths, next to the function they stand in for.
+
+    python benchmarks/bench_quality.py [--size 512] [--cases gaussian bilateral ...]
+        [--backend numpy] [--repeat 3] [--json quality.json]
+
+Each case runs a reference (the exact filter, or the solver at a tight tolerance) and its
+fast paths on one of the synthetic textures in textures.py, and prints them slowest first
+with the errors from metrics.py: max abs, PSNR, SSIM and the seam error across the wrap
+boundary, plus the angular error for normal map results. "preview 1/n" paths are the proxy
+previews the operators show first: the filter on a reduced copy with spatial parameters
+scaled down, upsampled back.
+
+A * marks the Pareto front of time against the case's main error (max abs, or the mean
+angle for normal maps): no other path is both at least as fast and at least as accurate.
+Times are the best of --repeat.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa:E402
+import textures  # noqa:E402
+from core import blur  # noqa:E402
+from core import filters  # noqa:E402
+from core import pixel_io  # noqa:E402
+from core import proxy  # noqa:E402
+from core import registry  # noqa:E402
+
+# normals: the result is a normal map, error is the mean angle
+Case = namedtuple("Case", "name texture reference paths normals")
+
+
+def preview(fn, params, spatial, factor):
+    """The operator preview of fn(pix, **params) at 1/factor resolution"""
+
+    def _run(pix):
+        small = proxy.level(pix, factor)
+        res = fn(small, **proxy.scale_params(params, spatial, factor))
+        return proxy.upsample(pixel_io.to_host(res), pix.shape)
+
+    return _run
+
+
+def _gaussian(pix, width, method):
+    return filters.gaussian_repeat(pix, width, method=method)
+
+
+def _bilateral(pix, sigma_a, method):
+    return filters.bilateral_filter(pix, sigma_a, 0.2, "", method=method)
+
+
+def _hist_match(pix, method):
+    # each channel of the photo onto the distribution of the matching noise channel
+    res = pix.copy()
+    template = textures.make("noise", pix.shape[0], seed=1)
+    for c in range(3):
+        res[..., c] = filters.hist_match(pix[..., c], template[..., c], method=method)
+    return res
+
+
+def _normals_to_height(pix, method, tol=1e-4, iterations=100):
+    return filters.normals_to_height(pix, method=method, tol=tol, iterations=iterations)
+
+
+def _to_normals(pix, width):
+    # height_to_normals of a blurred photo, so the preview has something smooth to keep
+    return filters.normals_simple(filters.gaussian_repeat(pix, width), "Luminance")
+
+
+CASES = [
+    Case(
+        "gaussian",
+        "photo",
+        lambda pix: _gaussian(pix, 20, "exact"),
+        [
+            ("box", lambda pix: _gaussian(pix, 20, "box")),
+            ("box x2", lambda pix: blur.gaussian_box(pix, 20, passes=2)),
+            ("box x5", lambda pix: blur.gaussian_box(pix, 20, passes=5)),
+            ("recursive", lambda pix: _gaussian(pix, 20, "recursive")),
+            ("preview 1/4", preview(_gaussian, dict(width=20, method="exact"), ("width",), 4)),
+        ],
+        False,
+    ),
+    Case(
+        "bilateral",
+        "photo",
+        lambda pix: _bilateral(pix, 4.0, "exact"),
+        [
+            ("grid", lambda pix: _bilateral(pix, 4.0, "grid")),
+            (
+                "preview 1/4",
+                preview(_bilateral, dict(sigma_a=4.0, method="exact"), ("sigma_a",), 4),
+            ),
+        ],
+        False,
+    ),
+    Case(
+        "hist_match",
+        "photo",
+        lambda pix: _hist_match(pix, "exact"),
+        [("histogram", lambda pix: _hist_match(pix, "histogram"))],
+        False,
+    ),
+    Case(
+        "gaussianize",
+        "photo",
+        lambda pix: filters.gaussianize(pix, method="exact")[0],
+        [("histogram", lambda pix: filters.gaussianize(pix, method="histogram")[0])],
+        False,
+    ),
+    Case(
+        "normals_to_height",
+        "normals",
+        lambda pix: _normals_to_height(pix, "multigrid", tol=1e-7, iterations=1000),
+        [
+            ("multigrid 1e-3", lambda pix: _normals_to_height(pix, "multigrid", tol=1e-3)),
+            ("multigrid 1e-4", lambda pix: _normals_to_height(pix, "multigrid", tol=1e-4)),
+            ("multigrid 1e-5", lambda pix: _normals_to_height(pix, "multigrid", tol=1e-5)),
+            ("fft", lambda pix: _normals_to_height(pix, "fft")),
+            ("jacobi 1000", lambda pix: _normals_to_height(pix, "jacobi", 0.0, 1000)),
+            ("preview 1/4", preview(_normals_to_height, dict(method="multigrid"), (), 4)),
+        ],
+        False,
+    ),
+    Case(
+        "height_to_normals",
+        "photo",
+        lambda pix: _to_normals(pix, 8),
+        [
+            ("preview 1/4", preview(_to_normals, dict(width=8), ("width",), 4)),
+            ("preview 1/8", preview(_to_normals, dict(width=8), ("width",), 8)),
+        ],
+        True,
+    ),
+]
+
+
+def timed(fn, pix, repeat):
+    best = None
+    for _ in range(repeat):
+        src = pix.copy()
+        t0 = time.perf_counter()
+        res = pixel_io.to_host(fn(src))
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return res, best
+
+
+def pareto(rows, key):
+    """Names of the rows no other row beats on both time and key"""
+    front = set()
+    for r in rows:
+        if not any(
+            o["seconds"] <= r["seconds"]
+            and o[key] <= r[key]
+            and (o["seconds"] < r["seconds"] or o[key] < r[key])
+            for o in rows
+        ):
+            front.add(r["path"])
+    return front
+
+
+def run_case(case, size, repeat):
+    pix = textures.make(case.texture, size)
+    ref, t_ref = timed(case.reference, pix, repeat)
+    score = metrics.normal_metrics if case.normals else metrics.image_metrics
+    rows = [dict(path="reference", seconds=t_ref, **score(ref, ref))]
+    for name, fn in case.paths:
+        res, t = timed(fn, pix, repeat)
+        rows.append(dict(path=name, seconds=t, **score(res, ref)))
+    for r in rows:
+        r["speedup"] = t_ref / r["seconds"]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--cases", nargs="+", choices=[c.name for c in CASES])
+    parser.add_argument("--backend", default="numpy", choices=registry.ORDER)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json")
+    args = parser.parse_args()
+
+    cases = [c for c in CASES if not args.cases or c.name in args.cases]
+    results = {}
+    with registry.using(args.backend):
+        for case in cases:
+            rows = run_case(case, args.size, args.repeat)
+            results[case.name] = rows
+            key = "angle_mean" if case.normals else "max_abs"
+            front = pareto(rows, key)
+
+            print()
+            print("{} ({}, {}px, {})".format(case.name, case.texture, args.size, args.backend))
+            print(
+                "  {:>16} {:>9} {:>8} {:>9} {:>7} {:>7} {:>9} {:>8}".format(
+                    "path", "time (s)", "speedup", "max abs", "PSNR", "SSIM", "seam", "angle"
+                )
+            )
+            for r in sorted(rows, key=lambda r: -r["seconds"]):
+                print(
+                    "{} {:>16} {:>9.4f} {:>7.1f}x {:>9.2e} {:>7.1f} {:>7.4f} {:>9.2e} {:>8}".format(
+                        "*" if r["path"] in front else " ",
+                        r["path"],
+                        r["seconds"],
+                        r["speedup"],
+                        r["max_abs"],
+                        r["psnr"],
+                        r["ssim"],
+                        r["seam"],
+                        "{:.2f}".format(r["angle_mean"]) if case.normals else "-",
+                    )
+                )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"size": args.size, "backend": args.backend, "cases": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Redo latency of the staged filters: the time to rerun after changing one property, with the
+intermediates of the previous run memoized, against running the whole filter again.
+
+    python benchmarks/bench_redo.py [--size 1024] [--storage float32]
+
+Each row changes one parameter from its first value to the second. "full" is a run with no
+memo, "redo" a run where the previous settings have just been run through the same memo.
+"memo" is what the memo holds after the redo, "max diff" how far the redo result is from the
+full one: 0 at float32 storage, the float16 rounding of the reused intermediates otherwise.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import cache  # noqa:E402
+from core import filters  # noqa:E402
+from core import precision  # noqa:E402
+from core import stages  # noqa:E402
+
+CASES = [
+    (
+        "contrast_balance",
+        filters.CONTRAST_BALANCE,
+        dict(gA=20, gB=40, strength=1.0, method="exact"),
+        [("strength", 0.5), ("gB", 30), ("gA", 10), ("method", "box")],
+    ),
+    (
+        "hipass_balance",
+        filters.HI_PASS_BALANCE,
+        dict(s=8, zoom=1000, method="histogram"),
+        [("zoom", 200), ("s", 16), ("method", "exact")],
+    ),
+    (
+        "histogram_seamless",
+        filters.HISTOGRAM_SEAMLESS,
+        dict(method="histogram"),
+        [("method", "exact")],
+    ),
+    (
+        "delighting",
+        filters.DELIGHT,
+        dict(dd=1, method="multigrid", tol=1e-4, iterations=100),
+        [("iterations", 50), ("tol", 1e-3), ("dd", -1)],
+    ),
+]
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--storage", choices=precision.STORAGE, default="float32")
+    args = parser.parse_args()
+    precision.configure(storage=args.storage)
+
+    rng = np.random.default_rng(0)
+    pix = rng.random((args.size, args.size, 4), dtype=np.float32)
+    pix[..., 3] = 1.0
+    key = cache.fingerprint(pix)
+
+    print(
+        "{:>20} {:>12} {:>10} {:>10} {:>10} {:>10}".format(
+            "filter", "property", "full (s)", "redo (s)", "memo (MB)", "max diff"
+        )
+    )
+    for name, graph, params, changes in CASES:
+        for prop, value in changes:
+            changed = dict(params, **{prop: value})
+            ref, t_full = timed(graph.run, pix, **changed)
+
+            memo = stages.Memo(2**32)
+            timed(graph.run, pix, memo, key, **params)
+            res, t_redo = timed(graph.run, pix, memo, key, **changed)
+            diff = np.abs(np.asarray(res) - np.asarray(ref)).max()
+            print(
+                "{:>20} {:>12} {:>10.3f} {:>10.3f} {:>10.1f} {:>10.2e}".format(
+                    name, prop, t_full, t_redo, memo.nbytes / 2**20, diff
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cost of the instrumentation in core.trace: a filter chain with recording off, on, and on
+with peak memory.
+
+    python benchmarks/bench_trace.py [--size 1024] [--chain "..."] [--out trace.json]
+
+"overhead" is relative to the run with recording off; the per span cost below is an empty
+span, measured in a loop. With --out the recording with memory is written as a Chrome trace
+(and the plain JSON next to it) to look at in chrome://tracing or ui.perfetto.dev.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import pipeline  # noqa:E402
+from core import registry  # noqa:E402
+from core import trace  # noqa:E402
+
+CHAIN = "normals_to_height gaussian_blur:width=10 sharpen bilateral delighting"
+
+
+def _empty_spans(n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with trace.span("empty"):
+            pass
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--chain", default=CHAIN)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    chain = pipeline.parse_chain(args.chain)
+    pix = np.random.default_rng(0).random((args.size, args.size, 4), dtype=np.float32)
+
+    def _run(mode):
+        best = None
+        for _ in range(args.repeat):
+            if mode != "off":
+                trace.enable(memory=mode == "memory")
+            t0 = time.perf_counter()
+            pipeline.run(pix, chain)
+            t = time.perf_counter() - t0
+            rec = trace.disable()
+            best = t if best is None else min(best, t)
+        return best, rec
+
+    with registry.using("numpy"):
+        _run("off")  # warm up
+        print(
+            "{:>8} {:>10} {:>10} {:>8} {:>16}".format(
+                "trace", "time (s)", "overhead", "spans", "peak host (MB)"
+            )
+        )
+        base = None
+        for mode in ("off", "on", "memory"):
+            t, rec = _run(mode)
+            base = base or t
+            print(
+                "{:>8} {:>10.3f} {:>9.1f}% {:>8} {:>16}".format(
+                    mode,
+                    t,
+                    (t / base - 1) * 100,
+                    len(rec.events) if rec else 0,
+                    "{:.1f}".format(rec.peak_host / 2**20) if rec and rec.memory else "-",
+                )
+            )
+
+    print()
+    print("{:>8} {:>14}".format("trace", "per span (us)"))
+    n = 100000
+    print("{:>8} {:>14.3f}".format("off", _empty_spans(n) * 1e6))
+    trace.enable()
+    print("{:>8} {:>14.3f}".format("on", _empty_spans(n) * 1e6))
+    trace.disable()
+    trace.enable(memory=True)
+    print("{:>8} {:>14.3f}".format("memory", _empty_spans(n // 10) * 1e6))
+    trace.disable()
+
+    if args.out:
+        print()
+        print(rec.summary())
+        stem, _ = os.path.splitext(args.out)
+        rec.save_chrome_trace(args.out)
+        rec.save_json(stem + ".summary.json")
+        print("written {} and {}.summary.json".format(args.out, stem))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Error metrics of a result against a reference, for (H, W, C) float pixels in [0, 1].
+
+All of them are whole-array numpy, computed in float64, and treat the images as tiles of a
+repeating plane like the filters do: SSIM windows wrap around, and the seam error looks at
+the jump from the last row (column) back to the first.
+
+    max_abs        largest absolute difference
+    psnr           peak signal to noise ratio in dB, peak 1, inf when equal
+    ssim           mean structural similarity, 7x7 box windows, per channel
+    seam_error     largest difference in the jump across the wrap boundary
+    angular_error  (mean, max) angle in degrees between normals encoded as 0.5 + 0.5 * n
+"""
+
+import numpy as np
+
+SSIM_WINDOW = 7
+_C1 = 0.01**2
+_C2 = 0.03**2
+
+
+def _f64(a):
+    return np.asarray(a, dtype=np.float64)
+
+
+def max_abs(a, ref):
+    return float(np.max(np.abs(_f64(a) - _f64(ref))))
+
+
+def psnr(a, ref):
+    mse = float(np.mean((_f64(a) - _f64(ref)) ** 2))
+    return float("inf") if mse == 0.0 else float(10.0 * np.log10(1.0 / mse))
+
+
+def _box_mean(x, r):
+    """Mean over (2r + 1)^2 windows around every pixel, wrapping around"""
+    n = 2 * r + 1
+    for axis in (0, 1):
+        x = np.moveaxis(x, axis, 0)
+        h = x.shape[0]
+        # r + 1 rows before so the running sum can start at zero
+        c = np.cumsum(np.concatenate([x[h - r - 1 :], x, x[:r]]), axis=0)
+        x = np.moveaxis((c[n : n + h] - c[:h]) / n, 0, axis)
+    return x
+
+
+def ssim(a, ref, window=SSIM_WINDOW):
+    a, ref = _f64(a), _f64(ref)
+    r = window // 2
+    mu_a, mu_r = _box_mean(a, r), _box_mean(ref, r)
+    var_a = _box_mean(a * a, r) - mu_a * mu_a
+    var_r = _box_mean(ref * ref, r) - mu_r * mu_r
+    cov = _box_mean(a * ref, r) - mu_a * mu_r
+    s = ((2 * mu_a * mu_r + _C1) * (2 * cov + _C2)) / (
+        (mu_a * mu_a + mu_r * mu_r + _C1) * (var_a + var_r + _C2)
+    )
+    return float(np.mean(s))
+
+
+def seam_error(a, ref):
+    a, ref = _f64(a), _f64(ref)
+    rows = np.abs((a[0] - a[-1]) - (ref[0] - ref[-1]))
+    cols = np.abs((a[:, 0] - a[:, -1]) - (ref[:, 0] - ref[:, -1]))
+    return float(max(rows.max(), cols.max()))
+
+
+def _unit(nmap):
+    v = _f64(nmap[..., :3]) * 2.0 - 1.0
+    return v / np.maximum(np.linalg.norm(v, axis=-1, keepdims=True), 1e-12)
+
+
+def angular_error(a, ref):
+    dot = np.sum(_unit(a) * _unit(ref), axis=-1)
+    angle = np.degrees(np.arccos(np.clip(dot, -1.0, 1.0)))
+    return float(angle.mean()), float(angle.max())
+
+
+def image_metrics(a, ref):
+    """{name: value} of the metrics for colour (or height) results, over RGB"""
+    a, ref = a[..., :3], ref[..., :3]
+    return {
+        "max_abs": max_abs(a, ref),
+        "psnr": psnr(a, ref),
+        "ssim": ssim(a, ref),
+        "seam": seam_error(a, ref),
+    }
+
+
+def normal_metrics(a, ref):
+    """image_metrics() and the angular error, for normal map results"""
+    res = image_metrics(a, ref)
+    res["angle_mean"], res["angle_max"] = angular_error(a, ref)
+    return res
@@ -0,0 +1,53 @@
+"""
+Stand-in for bpy.types.Image, enough for the pixel transfer code.
+
+`pixels.foreach_get` and `pixels.foreach_set` go through the buffer protocol like Blender's
+do, so they only accept contiguous float32 buffers of the exact size.
+"""
+
+import numpy as np
+
+
+class MockPixels:
+    def __init__(self, count):
+        self._data = np.zeros(count, dtype=np.float32)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _check(self, seq):
+        mv = memoryview(seq)
+        if mv.format != "f" or mv.nbytes != self._data.nbytes or not mv.c_contiguous:
+            raise TypeError("foreach_get/set expects a contiguous float buffer of matching size")
+        return mv.cast("B")
+
+    def foreach_get(self, seq):
+        self._check(seq)[:] = memoryview(self._data).cast("B")
+
+    def foreach_set(self, seq):
+        memoryview(self._data).cast("B")[:] = self._check(seq)
+
+    def __getitem__(self, key):
+        # slow path used by the old `image.pixels[:]` code
+        return self._data[key].tolist()
+
+
+class MockImage:
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.pixels = MockPixels(width * height * 4)
+        self.updates = 0
+
+    def scale(self, width, height):
+        self.size = (width, height)
+        self.pixels = MockPixels(width * height * 4)
+
+    def update(self):
+        self.updates += 1
+
+
+def noise_image(width, height, seed=0):
+    img = MockImage(width, height)
+    rng = np.random.default_rng(seed)
+    img.pixels.foreach_set(rng.random(width * height * 4, dtype=np.float32))
+    return img
@@ -0,0 +1,156 @@
+"""
+Stand-in for bpy, enough to import the add-on outside Blender and run operator payloads.
+
+    addon = stub_bpy.load_addon()
+    for name, op in stub_bpy.payloads(addon).items():
+        res = op.run(pixels)
+
+Properties are recorded with their keyword arguments so operators can be given their
+default values, types are empty classes and registration does nothing. bpy_amb's
+master_ops, which builds and registers the operator classes, is replaced as well: payloads
+run through image_ops._Settings, the object the add-on already uses to run a payload away
+from its operator, so none of the operator machinery is needed.
+"""
+
+import importlib.util
+import os
+import sys
+import types
+from collections import OrderedDict
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "texture_tools"
+
+
+class Property:
+    def __init__(self, kind, kw):
+        self.kind = kind
+        self.kw = kw
+
+    @property
+    def default(self):
+        if "default" in self.kw:
+            return self.kw["default"]
+        if self.kind == "Enum":
+            return self.kw["items"][0][0]
+        return {"Int": 0, "Float": 0.0, "Bool": False, "String": ""}.get(self.kind)
+
+
+def _prop(kind):
+    return lambda **kw: Property(kind, kw)
+
+
+def _module(name, **attrs):
+    m = types.ModuleType(name)
+    m.__dict__.update(attrs)
+    sys.modules[name] = m
+    return m
+
+
+def install():
+    """Put the bpy stand-in in sys.modules, unless a real bpy is there"""
+    if "bpy" in sys.modules:
+        return sys.modules["bpy"]
+    props = _module(
+        "bpy.props",
+        **{
+            kind + "Property": _prop(kind)
+            for kind in ("Bool", "Int", "Float", "String", "Enum", "Pointer", "FloatVector")
+        }
+    )
+    bpy_types = _module(
+        "bpy.types",
+        **{
+            name: type(name, (), {})
+            for name in ("Operator", "Panel", "PropertyGroup", "AddonPreferences", "Image")
+        }
+    )
+    return _module(
+        "bpy",
+        props=props,
+        types=bpy_types,
+        utils=types.SimpleNamespace(register_class=id, unregister_class=id),
+        app=types.SimpleNamespace(
+            binary_path_python=sys.executable,
+            timers=types.SimpleNamespace(register=lambda fn, first_interval=0: None),
+        ),
+        path=types.SimpleNamespace(abspath=os.path.abspath),
+        data=types.SimpleNamespace(images={}),
+        context=None,
+    )
+
+
+def _master_ops():
+    class OperatorGenerator:
+        def init_begin(self, master_name):
+            self.props = OrderedDict()
+
+    class MacroOperator:
+        pass
+
+    class PanelBuilder:
+        def __init__(self, *args):
+            self.register_params = self.unregister_params = lambda: None
+
+    _module(PACKAGE + ".bpy_amb", __path__=[])
+    return _module(
+        PACKAGE + ".bpy_amb.master_ops",
+        OperatorGenerator=OperatorGenerator,
+        MacroOperator=MacroOperator,
+        PanelBuilder=PanelBuilder,
+    )
+
+
+def load_addon():
+    """The add-on package, imported as texture_tools with the stand-ins in place"""
+    if PACKAGE in sys.modules:
+        return sys.modules[PACKAGE]
+    install()
+    _master_ops()
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE, os.path.join(ADDON_DIR, "__init__.py"), submodule_search_locations=[ADDON_DIR]
+    )
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = addon
+    spec.loader.exec_module(addon)
+    return addon
+
+
+def generators(addon):
+    """{prefix: generator} for every *_IOP class, with generate() run on it"""
+    res = OrderedDict()
+    for name, cls in vars(addon).items():
+        if not (name.endswith("_IOP") and isinstance(cls, type)):
+            continue
+        # ImageOperatorGenerator.__init__ up to generate(), without creating the operator
+        gen = cls.__new__(cls)
+        gen.init_begin(None)
+        gen._init_defaults()
+        gen.generate()
+        res[gen.prefix] = gen
+    return res
+
+
+class Payload:
+    """An operator payload with its property values, run on (H, W, 4) pixels"""
+
+    def __init__(self, addon, gen, **params):
+        self.gen = gen
+        self.params = {k: p.default for k, p in gen.props.items()}
+        self.params.update(params)
+        self.messages = []
+        op = type(gen.prefix, (), {"payload": gen.payload, "prefix": gen.prefix})()
+        self.settings = addon.image_ops._Settings(op, self.params, None, None)
+        # report() prints, keep the messages instead
+        self.settings.report = lambda kind, message: self.messages.append(message)
+
+    def run(self, pixels):
+        return self.settings.run(pixels)
+
+
+def payloads(addon, **params):
+    """{prefix: Payload} for every operator, at default property values"""
+    return OrderedDict(
+        (prefix, Payload(addon, gen, **params.get(prefix, {})))
+        for prefix, gen in generators(addon).items()
+    )
@@ -0,0 +1,98 @@
+"""
+Deterministic synthetic textures for the benchmarks, (size, size, 4) float32 like pixel_io
+reads them, alpha 1.
+
+    noise    -- uniform white noise, the worst case for anything adaptive
+    photo    -- colour gradients, soft fractal detail, hard edged shapes and a little grain
+    normals  -- tangent space normal map of a fractal height field, wraps around
+
+The same name, size and seed always give the same pixels. Fractal detail is value noise on
+periodic lattices, linear time in the pixel count, so 8K textures take seconds to make.
+"""
+
+import numpy as np
+
+
+def value_noise(size, cells, rng):
+    """(size, size) smooth periodic noise in [0, 1] on a cells x cells lattice"""
+    grid = rng.random((cells, cells), dtype=np.float32)
+    t = np.arange(size, dtype=np.float32) * (cells / size)
+    i0 = t.astype(np.int64)
+    i1 = (i0 + 1) % cells
+    f = t - i0
+    f = f * f * (3.0 - 2.0 * f)
+    rows = grid[i0] + (grid[i1] - grid[i0]) * f[:, None]
+    return rows[:, i0] + (rows[:, i1] - rows[:, i0]) * f[None, :]
+
+
+def fbm(size, rng, cells=4, octaves=6):
+    """Octaves of value noise, each twice as fine and half as strong, normalized to [0, 1]"""
+    res = np.zeros((size, size), dtype=np.float32)
+    amp = 1.0
+    for _ in range(octaves):
+        if cells > size:
+            break
+        res += amp * value_noise(size, cells, rng)
+        cells *= 2
+        amp *= 0.5
+    res -= res.min()
+    res /= max(float(res.max()), 1e-12)
+    return res
+
+
+def noise(size, seed=0):
+    rng = np.random.default_rng(seed)
+    pix = rng.random((size, size, 4), dtype=np.float32)
+    pix[..., 3] = 1.0
+    return pix
+
+
+def photo(size, seed=0):
+    rng = np.random.default_rng(seed)
+    pix = np.empty((size, size, 4), dtype=np.float32)
+    ramp = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    lo, hi = rng.random((2, 3), dtype=np.float32)
+    for c in range(3):
+        detail = fbm(size, rng)
+        pix[..., c] = lo[c] + (hi[c] - lo[c]) * (0.6 * ramp[:, None] + 0.4 * ramp[None, :])
+        pix[..., c] = 0.6 * pix[..., c] + 0.4 * detail
+
+    # flat coloured discs and boxes, for edges
+    for _ in range(12):
+        cy, cx = rng.random(2) * size
+        r = (0.03 + 0.1 * rng.random()) * size
+        y0, y1 = int(max(cy - r, 0)), int(min(cy + r + 1, size))
+        x0, x1 = int(max(cx - r, 0)), int(min(cx + r + 1, size))
+        yy, xx = np.ogrid[y0:y1, x0:x1]
+        if rng.random() < 0.5:
+            shape = (yy - cy) ** 2 + (xx - cx) ** 2 < r * r
+        else:
+            shape = (abs(yy - cy) < r) & (abs(xx - cx) < r * 0.6)
+        pix[y0:y1, x0:x1][shape, :3] = rng.random(3, dtype=np.float32)
+
+    pix[..., :3] += 0.02 * rng.standard_normal((size, size, 3), dtype=np.float32)
+    np.clip(pix, 0.0, 1.0, out=pix)
+    pix[..., 3] = 1.0
+    return pix
+
+
+def normals(size, seed=0, strength=8.0):
+    rng = np.random.default_rng(seed)
+    h = fbm(size, rng, octaves=8) * (strength * size / 512)
+    # slopes per pixel, central differences that wrap like the texture
+    dx = 0.5 * (np.roll(h, -1, axis=1) - np.roll(h, 1, axis=1))
+    dy = 0.5 * (np.roll(h, -1, axis=0) - np.roll(h, 1, axis=0))
+    inv = 1.0 / np.sqrt(dx * dx + dy * dy + 1.0)
+    pix = np.empty((size, size, 4), dtype=np.float32)
+    pix[..., 0] = 0.5 - 0.5 * dx * inv
+    pix[..., 1] = 0.5 + 0.5 * dy * inv
+    pix[..., 2] = 0.5 + 0.5 * inv
+    pix[..., 3] = 1.0
+    return pix
+
+
+TEXTURES = {"noise": noise, "photo": photo, "normals": normals}
+
+
+def make(name, size, seed=0):
+    return TEXTURES[name](size, seed)
@@ -0,0 +1,84 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Array module selection.
+
+Nothing here imports numpy or cupy up front: `np` is a lazily loaded numpy, which is only
+really imported when one of its attributes is first used, and cupy is only imported when
+something asks for it. Importing the core package (and registering the add-on) stays cheap.
+"""
+
+import importlib
+import importlib.util
+import sys
+
+_cupy = None
+
+
+def lazy_import(name):
+    """Module that is really imported on first attribute access"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+np = lazy_import("numpy")
+
+
+def cuda_installed():
+    """Whether cupy can be found, without importing it"""
+    return importlib.util.find_spec("cupy") is not None
+
+
+def load_cupy(retry=False):
+    """cupy, or None if it isn't installed or fails to import. Only tried once, unless retry"""
+    global _cupy
+    if _cupy is None or (retry and _cupy is False):
+        try:
+            _cupy = importlib.import_module("cupy")
+        except Exception:
+            _cupy = False
+    return _cupy or None
+
+
+def get_array_module(a):
+    """numpy or cupy, depending on where the array lives"""
+    if hasattr(a, "channels"):
+        # layout.ImageBuffer
+        a = a.data
+    if type(a).__module__.startswith("cupy"):
+        import cupy
+
+        return cupy
+    return np
+
+
+def synchronize(a):
+    """Wait for the device work that produces a to finish, for timing. No-op for numpy"""
+    xp = get_array_module(a)
+    if xp is not np:
+        xp.cuda.get_current_stream().synchronize()
+
+
+def device_memory():
+    """Bytes held by the cupy memory pool, 0 when cupy isn't loaded"""
+    if not _cupy:
+        return 0
+    return _cupy.get_default_memory_pool().total_bytes()
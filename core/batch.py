@@ -0,0 +1,219 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Headless batch runner: apply a chain of filters to many images with a process pool.
+
+Run from the add-on directory:
+
+    python -m core.batch scans/ -o out/ \\
+        -c hipass_balance:width=8 histogram_seamless height_to_normals normalize_tangents
+
+Steps are written as in core.pipeline: the operator prefixes used in the Image Editor panel,
+with parameters given as `name:key=value,key=value` and the same defaults as the operator
+properties.
+
+Inputs are directories, image files, `.txt` manifests (one path per line) or `.json`
+manifests of the form {"images": [...], "chain": [...], "output": "dir"}; values in the
+json manifest are used when not given on the command line.
+
+The parent process decodes each image into shared memory and the workers only receive the
+name of the block, the shape and the chain. Results are written back into the same block
+(or a new one when the shape changes), so no pixel data is pickled in either direction.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+from . import image_files
+from . import pipeline
+from . import pixel_io
+from . import registry
+from .backend import np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tga", ".tif", ".tiff", ".bmp", ".npy")
+
+
+def run_chain(pix, chain):
+    """Apply a parsed chain to (H, W, 4) float32 pixels, returns host float32 pixels"""
+    pix, _ = pipeline.run(pix, chain)
+    return pixel_io.to_host(pix)
+
+
+def collect_images(inputs):
+    """Expand directories and manifests into (paths, manifest settings)"""
+    paths, settings = [], {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for f in sorted(os.listdir(item)):
+                if f.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(item, f))
+        elif item.lower().endswith(".json"):
+            with open(item) as f:
+                manifest = json.load(f)
+            base = os.path.dirname(item)
+            paths.extend(os.path.join(base, p) for p in manifest.get("images", []))
+            settings.update({k: v for k, v in manifest.items() if k != "images"})
+            if "output" in manifest:
+                settings["output"] = os.path.join(base, manifest["output"])
+        elif item.lower().endswith(".txt"):
+            base = os.path.dirname(item)
+            with open(item) as f:
+                lines = (l.strip() for l in f)
+                paths.extend(os.path.join(base, l) for l in lines if l and not l.startswith("#"))
+        else:
+            paths.append(item)
+    return paths, settings
+
+
+def _init_worker():
+    # keep workers on the cpu, a pool of processes fighting over one gpu is slower
+    registry.enable("cupy", False)
+
+
+def _untrack(shm):
+    # blocks are unlinked by the parent, don't let the worker's resource tracker do it too
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _process(job):
+    name, shape, chain = job
+    shm = shared_memory.SharedMemory(name=name)
+    _untrack(shm)
+    try:
+        # filters may work in place, the input block is only read here so that's fine
+        pix = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        res = run_chain(pix, chain)
+        if res.shape == tuple(shape):
+            pix[...] = res
+            del pix
+            return name, shape
+        del pix
+    finally:
+        shm.close()
+
+    out = shared_memory.SharedMemory(create=True, size=max(res.nbytes, 1))
+    _untrack(out)
+    np.ndarray(res.shape, dtype=np.float32, buffer=out.buf)[...] = res
+    out.close()
+    return out.name, res.shape
+
+
+def _to_shared(pix):
+    shm = shared_memory.SharedMemory(create=True, size=max(pix.nbytes, 1))
+    np.ndarray(pix.shape, dtype=np.float32, buffer=shm.buf)[...] = pix
+    return shm
+
+
+def _release(entry):
+    """Free the blocks of a job whose result won't be written"""
+    _, shm, result = entry
+    result.wait()
+    if result.successful():
+        name, _ = result.get()
+        if name != shm.name:
+            out = shared_memory.SharedMemory(name=name)
+            out.close()
+            out.unlink()
+    shm.close()
+    shm.unlink()
+
+
+def _output_path(path, output, suffix):
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(output, stem + suffix + ext)
+
+
+def run_batch(paths, chain, output, workers=None, suffix=""):
+    """Process every image in paths, returns (images, megapixels, seconds)"""
+    workers = workers or os.cpu_count() or 1
+    pending = deque(paths)
+    in_flight = deque()
+    count, mpix = 0, 0.0
+
+    def _finish(entry):
+        nonlocal count, mpix
+        path, shm, result = entry
+        try:
+            name, shape = result.get()
+            res_shm = shm if name == shm.name else shared_memory.SharedMemory(name=name)
+            try:
+                res = np.ndarray(shape, dtype=np.float32, buffer=res_shm.buf)
+                image_files.save_image(_output_path(path, output, suffix), res)
+                del res
+            finally:
+                if res_shm is not shm:
+                    res_shm.close()
+                    res_shm.unlink()
+        finally:
+            shm.close()
+            shm.unlink()
+        count += 1
+        mpix += shape[0] * shape[1] / 1e6
+        print("{}/{} {}".format(count, len(paths), path))
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        try:
+            while pending or in_flight:
+                # decode ahead of the workers, but only so far that memory stays bounded
+                while pending and len(in_flight) < 2 * workers:
+                    path = pending.popleft()
+                    pix = image_files.load_image(path)
+                    shm = _to_shared(pix)
+                    job = (shm.name, pix.shape, chain)
+                    in_flight.append((path, shm, pool.apply_async(_process, (job,))))
+                    del pix
+                _finish(in_flight.popleft())
+        finally:
+            # after an error, let the running jobs end before freeing their blocks
+            while in_flight:
+                _release(in_flight.popleft())
+    return count, mpix, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("inputs", nargs="+", help="images, directories or manifests")
+    parser.add_argument("-c", "--chain", nargs="+", help="steps, e.g. gaussian_blur:width=4")
+    parser.add_argument("-o", "--output", help="output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--suffix", default="", help="appended to output file names")
+    args = parser.parse_args(argv)
+
+    paths, settings = collect_images(args.inputs)
+    chain_text = args.chain or settings.get("chain")
+    output = args.output or settings.get("output")
+    if not chain_text or not output:
+        parser.error("a chain and an output directory are needed")
+    if not paths:
+        parser.error("no images found")
+
+    chain = [pipeline.parse_step(s) for s in chain_text]
+    count, mpix, secs = run_batch(paths, chain, output, workers=args.workers, suffix=args.suffix)
+    print(
+        "{} images, {:.1f} MPix in {:.2f}s: {:.2f} images/s, {:.2f} MPix/s".format(
+            count, mpix, secs, count / secs, mpix / secs
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Bilateral filter with wrap-around edges, every channel filtered on its own values.
+
+Methods:
+    exact  -- the full (2 * ceil(3 sigma_s) + 1)^2 window, all channels in one loop
+    grid   -- bilateral grid (Paris & Durand): values are splatted trilinearly into a
+              (y, x, value) grid with cells of sigma_s pixels and sigma_v values, the grid
+              is blurred and the result read back trilinearly. Cost is linear in the pixel
+              count and goes down as sigma_s grows. Sigmas below 2 use exact.
+
+The grid blur is narrower than one cell so that, together with the two trilinear tents
+(variance 1/6 each), the effective kernel has the requested sigmas.
+"""
+
+import math
+
+from .backend import get_array_module, np
+from .convolve import roll_into
+
+METHODS = ("exact", "grid")
+
+# empty cells kept below and above the value range, so the grid blur needs no wrapping there
+_RANGE_PAD = 2
+
+# grid blur, in cells, and how many cells it reaches
+_GRID_SIGMA = math.sqrt(1.0 - 2.0 / 6.0)
+_GRID_RADIUS = 2
+
+# below this the window is small enough for exact to be faster
+_MIN_GRID_SIGMA = 2.0
+
+# samples splatted or sliced at a time
+_CHUNK_SAMPLES = 2**20
+
+
+def support(sigma_s):
+    """How far the exact filter reaches"""
+    return int(math.ceil(3 * sigma_s))
+
+
+def exact(img, sigma_s, sigma_v, eps=1e-8):
+    """Brute force bilateral of (H, W) or (H, W, C) pixels, channels filtered independently"""
+    xp = get_array_module(img)
+    gsi = lambda r2, sigma: xp.exp(-0.5 * r2 / sigma**2)
+    win_width = support(sigma_s)
+    wgt_sum = xp.ones(img.shape) * eps
+    result = img * eps
+    off = xp.empty_like(img, dtype=xp.float32)
+    cols = xp.empty_like(off)
+
+    for shft_x in range(-win_width, win_width + 1):
+        roll_into(cols, img, -shft_x, 1)
+        for shft_y in range(-win_width, win_width + 1):
+            roll_into(off, cols, -shft_y, 0)
+
+            w = gsi(shft_x**2 + shft_y**2, sigma_s)
+            tw = w * gsi((off - img) ** 2, sigma_v)
+            result += off * tw
+            wgt_sum += tw
+
+    # normalize the result and return
+    return (result / wgt_sum).astype(xp.float32)
+
+
+def _cell_coords(n, cells, xp):
+    """Cell coordinates of n pixels spread over `cells` cells, wrapping around at the end"""
+    pos = xp.arange(n, dtype=xp.float32) * (cells / n)
+    lo = xp.floor(pos)
+    return lo.astype(xp.int64), pos - lo
+
+
+def _blur_grid(g, axis):
+    # rolls wrap around, which is right for y and x, and harmless for the value axis because
+    # of the empty padding there
+    xp = get_array_module(g)
+    taps = [math.exp(-0.5 * (i / _GRID_SIGMA) ** 2) for i in range(_GRID_RADIUS + 1)]
+    norm = 1.0 / (taps[0] + 2 * sum(taps[1:]))
+    res = g * (taps[0] * norm)
+    for i in range(1, _GRID_RADIUS + 1):
+        res += (taps[i] * norm) * (xp.roll(g, i, axis=axis) + xp.roll(g, -i, axis=axis))
+    return res
+
+
+def _corners(fy, fx, fz, shape):
+    """Offset from the lower corner and trilinear weight of the 8 grid corners around each
+    sample, for a (gh + 1, gw + 1, gz, channels) grid"""
+    _, gw1, gz, nc = shape
+    for dy in (0, 1):
+        wy = (fy if dy else 1.0 - fy)[:, None, None]
+        for dx in (0, 1):
+            wyx = wy * (fx if dx else 1.0 - fx)[None, :, None]
+            for dz in (0, 1):
+                offset = (dy * gw1 + dx) * gz * nc + dz * nc
+                yield offset, (wyx * (fz if dz else 1.0 - fz)).ravel()
+
+
+def grid(img, sigma_s, sigma_v):
+    """Bilateral grid approximation of exact(), same arguments"""
+    xp = get_array_module(img)
+    h, w = img.shape[0], img.shape[1]
+    pix = img.reshape(h, w, -1).astype(xp.float32, copy=False)
+    nc = pix.shape[2]
+
+    gh = max(1, int(round(h / sigma_s)))
+    gw = max(1, int(round(w / sigma_s)))
+    vmin = pix.min(axis=(0, 1))
+    gz = int(math.ceil(float((pix.max(axis=(0, 1)) - vmin).max()) / sigma_v)) + 2 * _RANGE_PAD + 2
+
+    # one extra row and column past the end stand in for the first ones, so a block of image
+    # rows only ever touches a contiguous block of the grid
+    shape = (gh + 1, gw + 1, gz, nc)
+    plane = (gw + 1) * gz * nc
+    values = xp.zeros(shape, dtype=xp.float64).ravel()
+    weights = xp.zeros_like(values)
+
+    y0, fy = _cell_coords(h, gh, xp)
+    x0, fx = _cell_coords(w, gw, xp)
+    xz = x0[None, :, None] * (gz * nc) + xp.arange(nc, dtype=xp.int64)
+    step = max(1, _CHUNK_SAMPLES // (w * nc))
+
+    def _chunks():
+        for r in range(0, h, step):
+            rows = slice(r, r + step)
+            z = (pix[rows] - vmin) / sigma_v + _RANGE_PAD
+            z0 = xp.floor(z)
+            low = (y0[rows, None, None] * plane + xz + z0.astype(xp.int64) * nc).ravel()
+            yield rows, low, _corners(fy[rows], fx, z - z0, shape)
+
+    for rows, low, corners in _chunks():
+        v = pix[rows].ravel()
+        base = int(y0[rows][0]) * plane
+        length = (int(y0[rows][-1]) - int(y0[rows][0]) + 2) * plane
+        low -= base
+        for offset, wgt in corners:
+            values[base : base + length] += xp.bincount(low + offset, wgt * v, minlength=length)
+            weights[base : base + length] += xp.bincount(low + offset, wgt, minlength=length)
+
+    g = xp.stack([values.reshape(shape), weights.reshape(shape)])
+    g[:, 0] += g[:, gh]
+    g[:, :, 0] += g[:, :, gw]
+    g = g[:, :gh, :gw]
+    for axis in (1, 2, 3):
+        g = _blur_grid(g, axis)
+    g = g[:, xp.arange(gh + 1) % gh][:, :, xp.arange(gw + 1) % gw]
+    values, weights = g[0].ravel(), g[1].ravel()
+
+    res = xp.empty(pix.shape, dtype=xp.float32)
+    for rows, low, corners in _chunks():
+        num = 0.0
+        den = 0.0
+        for offset, wgt in corners:
+            idx = low + offset
+            num = num + values[idx] * wgt
+            den = den + weights[idx] * wgt
+        res[rows] = (num / xp.maximum(den, 1e-12)).reshape(res[rows].shape)
+    return res.reshape(img.shape)
+
+
+def bilateral(img, sigma_s, sigma_v, method="exact", exact=exact):
+    """Bilateral filter, `method` is one of METHODS. `exact` is the brute force filter to
+    use, the numba backend passes its kernel"""
+    if method == "exact" or sigma_s < _MIN_GRID_SIGMA:
+        return exact(img, sigma_s, sigma_v)
+    if method == "grid":
+        return grid(img, sigma_s, sigma_v)
+    raise ValueError("Unknown bilateral method: {}".format(method))
+
+
+def estimate_error(img, result, sigma_s, sigma_v, samples=512, seed=0):
+    """Max and mean absolute difference of `result` to the exact filter, which is only
+    evaluated at `samples` random pixels so this stays cheap for any image size"""
+    xp = get_array_module(img)
+    h, w = img.shape[0], img.shape[1]
+    pix = img.reshape(h, w, -1)
+    res = result.reshape(h, w, -1)
+    r = support(sigma_s)
+
+    rng = np.random.RandomState(seed)
+    ys = xp.asarray(rng.randint(0, h, samples))
+    xs = xp.asarray(rng.randint(0, w, samples))
+    d = xp.arange(-r, r + 1)
+    spatial = xp.exp(-0.5 * (d[:, None] ** 2 + d[None, :] ** 2) / sigma_s**2)[..., None]
+
+    diffs = []
+    step = max(1, _CHUNK_SAMPLES // ((2 * r + 1) ** 2 * pix.shape[2]))
+    for i in range(0, samples, step):
+        y, x = ys[i : i + step], xs[i : i + step]
+        win = pix[((y[:, None] + d) % h)[:, :, None], ((x[:, None] + d) % w)[:, None, :]]
+        center = pix[y, x][:, None, None, :]
+        wgt = spatial * xp.exp(-0.5 * (win - center) ** 2 / sigma_v**2)
+        ref = (wgt * win).sum(axis=(1, 2)) / wgt.sum(axis=(1, 2))
+        diffs.append(xp.abs(ref - res[y, x]))
+
+    diff = xp.concatenate(diffs)
+    return float(diff.max()), float(diff.mean())
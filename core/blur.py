@@ -0,0 +1,183 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Separable Gaussian blur with wrap-around edges.
+
+Width `s` means the same thing everywhere: the kernel spans -s..s and falls to exp(-4) at
+the ends, so sigma = s / (2 * sqrt(2)).
+
+Methods:
+    exact      -- truncated kernel through core.convolve, direct taps for small widths and
+                  FFT for large ones
+    box        -- stacked box blurs from running sums (cost independent of s)
+    recursive  -- Young & van Vliet third order IIR, forward and backward (cost independent
+                  of s up to the wrap padding, which is capped at the image size). Loses
+                  accuracy for very wide kernels, prefer box there.
+
+Widths below 4 always use the exact kernel.
+"""
+
+import math
+
+from . import convolve
+from .backend import get_array_module, np
+
+METHODS = ("exact", "box", "recursive")
+
+# below this width the approximations are visibly off, and exact is cheap anyway
+_MIN_APPROX_WIDTH = 4
+
+# running sums are recomputed from scratch every this many rows
+_RESYNC = 512
+
+
+def sigma_from_width(s):
+    return s / (2.0 * math.sqrt(2.0))
+
+
+def gauss_curve(x, xp=np):
+    # gaussian with 0.01831 at last
+    res = xp.exp(-((xp.arange(-x, x + 1, dtype=xp.float32) * (2 / x)) ** 2))
+    res /= xp.sum(res)
+    return res.astype(xp.float32)
+
+
+def gaussian_exact(pix, s):
+    gcr = gauss_curve(s)
+    return convolve.convolve_separable(pix, gcr, gcr)
+
+
+def box_sizes(sigma, n):
+    """Widths of n box filters whose sum has (close to) the given standard deviation"""
+    w_ideal = math.sqrt(12.0 * sigma * sigma / n + 1.0)
+    wl = int(math.floor(w_ideal))
+    if wl % 2 == 0:
+        wl -= 1
+    wl = max(wl, 1)
+    wu = wl + 2
+    m = round((12.0 * sigma * sigma - n * wl * wl - 4 * n * wl - 3 * n) / (-4.0 * wl - 4.0))
+    return [wl if i < m else wu for i in range(n)]
+
+
+def _box_axis0(a, r, out):
+    """Periodic running mean over 2r+1 values along axis 0, written into out"""
+    xp = get_array_module(a)
+    n = a.shape[0]
+    norm = 1.0 / (2 * r + 1)
+    for i in range(n):
+        if i % _RESYNC == 0:
+            # start over every now and then so float32 rounding can't drift
+            acc = xp.sum(a[xp.arange(i - r, i + r + 1) % n], axis=0, dtype=xp.float32)
+        else:
+            acc += a[(i + r) % n]
+            acc -= a[(i - r - 1) % n]
+        out[i] = acc
+    out *= norm
+    return out
+
+
+def _along_axes(fn, pix):
+    """Run fn(array) in place along axis 0, then along axis 1 on a contiguous transpose"""
+    xp = get_array_module(pix)
+    res = xp.array(pix, dtype=xp.float32)
+    fn(res)
+    res = xp.ascontiguousarray(xp.swapaxes(res, 0, 1))
+    fn(res)
+    return xp.ascontiguousarray(xp.swapaxes(res, 0, 1))
+
+
+def gaussian_box(pix, s, passes=3):
+    xp = get_array_module(pix)
+    sizes = [w for w in box_sizes(sigma_from_width(s), passes) if w > 1]
+
+    def _passes(a):
+        tmp = xp.empty_like(a)
+        for w in sizes:
+            _box_axis0(a, (w - 1) // 2, tmp)
+            a, tmp = tmp, a
+        if len(sizes) % 2 == 1:
+            tmp[...] = a
+
+    return _along_axes(_passes, pix)
+
+
+def _yvv_coefficients(sigma):
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * math.sqrt(1.0 - 0.26891 * sigma)
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q**2 + 0.422205 * q**3
+    b1 = (2.44413 * q + 2.85619 * q**2 + 1.26661 * q**3) / b0
+    b2 = -(1.4281 * q**2 + 1.26661 * q**3) / b0
+    b3 = 0.422205 * q**3 / b0
+    return 1.0 - (b1 + b2 + b3), b1, b2, b3
+
+
+def _recursive_axis0(a, sigma):
+    xp = get_array_module(a)
+    n = a.shape[0]
+    B, b1, b2, b3 = _yvv_coefficients(sigma)
+
+    # wrap data in from the other side, and start both passes from the steady state of the
+    # local mean, so the start-up transient has faded by the time we reach the image
+    pad = min(int(math.ceil(4 * sigma)) + 3, n)
+    idx = xp.arange(-pad, n + pad) % n
+    w = a[idx]
+    m = w.shape[0]
+    k = max(3, min(pad, int(math.ceil(sigma))))
+
+    w[:3] = xp.mean(w[:k], axis=0)
+    for i in range(3, m):
+        w[i] *= B
+        w[i] += b1 * w[i - 1]
+        w[i] += b2 * w[i - 2]
+        w[i] += b3 * w[i - 3]
+
+    w[m - 3 :] = xp.mean(w[m - k :], axis=0)
+    for i in range(m - 4, -1, -1):
+        w[i] *= B
+        w[i] += b1 * w[i + 1]
+        w[i] += b2 * w[i + 2]
+        w[i] += b3 * w[i + 3]
+
+    a[...] = w[pad : pad + n]
+    return a
+
+
+def gaussian_recursive(pix, s):
+    sigma = sigma_from_width(s)
+    if sigma < 0.5:
+        # outside of the range the coefficients were fitted for
+        return gaussian_exact(pix, s)
+    return _along_axes(lambda a: _recursive_axis0(a, sigma), pix)
+
+
+def support(s, method="exact"):
+    """How many pixels away a blur of width s reaches (the recursive one never quite ends)"""
+    if method == "exact" or s < _MIN_APPROX_WIDTH:
+        return s
+    if method == "box":
+        return sum((w - 1) // 2 for w in box_sizes(sigma_from_width(s), 3))
+    return 2 * (int(math.ceil(4 * sigma_from_width(s))) + 3)
+
+
+def gaussian(pix, s, method="exact"):
+    """Blur with wrap-around edges, `method` is one of METHODS"""
+    if method == "exact" or s < _MIN_APPROX_WIDTH:
+        return gaussian_exact(pix, s)
+    if method == "box":
+        return gaussian_box(pix, s)
+    if method == "recursive":
+        return gaussian_recursive(pix, s)
+    raise ValueError("Unknown blur method: {}".format(method))
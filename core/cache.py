@@ -0,0 +1,202 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Content addressed cache of operator results.
+
+Results are keyed on a hash of the source pixels, the operator prefix and its parameters,
+so going back to parameter values used before (in the redo panel, say) finds the earlier
+result whatever image it came from. Entries live in memory up to a byte budget, least
+recently used first out. Evicted entries can spill to float16 .npy files in a directory,
+which has its own budget; those come back at float16 precision. With float16 storage (see
+precision) entries are kept at half precision in memory as well.
+"""
+
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import layout
+from . import precision
+from .backend import np
+from .pixel_io import to_host
+
+# hashlib releases the GIL on large buffers, so chunks are hashed on several threads
+_HASH_CHUNK = 16 * 2**20
+
+
+def _digest(buf):
+    return hashlib.blake2b(buf, digest_size=16).digest()
+
+
+def fingerprint(pix):
+    """Hash of the shape, dtype and contents of a host array"""
+    pix = np.ascontiguousarray(pix)
+    buf = memoryview(pix.reshape(-1).view(np.uint8))
+    chunks = [buf[i : i + _HASH_CHUNK] for i in range(0, len(buf), _HASH_CHUNK)]
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(min(len(chunks), os.cpu_count() or 1)) as pool:
+            digests = list(pool.map(_digest, chunks))
+    else:
+        digests = [_digest(c) for c in chunks]
+
+    h = hashlib.blake2b(repr((pix.shape, pix.dtype.str)).encode(), digest_size=16)
+    for d in digests:
+        h.update(d)
+    return h.hexdigest()
+
+
+def make_key(source_hash, prefix, params):
+    """Cache key of running operator `prefix` with `params` (a dict) on a source"""
+    text = repr((source_hash, prefix, sorted(params.items())))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """LRU of float32 result arrays and layout.ImageBuffers, optionally spilling evicted entries
+    to disk (as RGBA arrays)"""
+
+    def __init__(self, budget, spill_dir=None, spill_budget=0):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.spill_budget = spill_budget
+        self.memory = OrderedDict()
+        self.disk = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def memory_bytes(self):
+        return sum(a.nbytes for a in self.memory.values())
+
+    @property
+    def disk_bytes(self):
+        return sum(self.disk.values())
+
+    def get(self, key):
+        """The cached result, or None. Results are shared, don't modify them"""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return precision.load(self.memory[key])
+
+        if key in self.disk:
+            path = self._path(key)
+            try:
+                pix = np.load(path).astype(np.float32)
+            except OSError:
+                pix = None
+            self._remove_spilled(key)
+            if pix is not None:
+                self.hits += 1
+                self._store(key, precision.store(pix))
+                return pix
+
+        self.misses += 1
+        return None
+
+    def put(self, key, pix):
+        """Keep a copy of pix, the caller's array stays its own and writable"""
+        if isinstance(pix, layout.ImageBuffer):
+            # kept in its own layout, a gray result takes half the room of RGBA
+            kept = precision.store(pix.to_host())
+            if kept.data is pix.data or kept.data.base is not None:
+                kept = kept.copy()
+            kept.data.flags.writeable = False
+        else:
+            kept = precision.store(to_host(pix))
+            # copies made on the way (off the device, to float16) are the cache's already, a
+            # view would also keep a whole source buffer alive
+            if kept is pix or kept.base is not None:
+                kept = kept.copy()
+            kept.flags.writeable = False
+        self._store(key, kept)
+
+    def clear(self):
+        for key in list(self.disk):
+            self._remove_spilled(key)
+        self.memory.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def configure(self, budget, spill_dir=None, spill_budget=0):
+        if spill_dir != self.spill_dir:
+            for key in list(self.disk):
+                self._remove_spilled(key)
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.spill_budget = spill_budget
+        self._evict()
+
+    def _store(self, key, pix):
+        self.memory[key] = pix
+        self.memory.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        size = self.memory_bytes
+        while self.memory and size > self.budget:
+            key, pix = self.memory.popitem(last=False)
+            size -= pix.nbytes
+            self.evictions += 1
+            if self.spill_dir:
+                self._spill(key, pix)
+
+    def _path(self, key):
+        return os.path.join(self.spill_dir, key + ".npy")
+
+    def _spill(self, key, pix):
+        half = layout.as_rgba(pix).astype(np.float16)
+        if half.nbytes > self.spill_budget:
+            return
+        while self.disk and self.disk_bytes + half.nbytes > self.spill_budget:
+            self._remove_spilled(next(iter(self.disk)))
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            np.save(self._path(key), half)
+        except OSError:
+            return
+        self.disk[key] = half.nbytes
+
+    def _remove_spilled(self, key):
+        del self.disk[key]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+_shared = None
+
+
+def shared_cache(budget, spill_dir=None, spill_budget=0):
+    """The process wide cache, created or reconfigured with these settings"""
+    global _shared
+    if spill_dir == "":
+        spill_dir = os.path.join(tempfile.gettempdir(), "texture_tools_cache")
+    if _shared is None:
+        _shared = ResultCache(budget, spill_dir, spill_budget)
+    elif (budget, spill_dir, spill_budget) != (
+        _shared.budget,
+        _shared.spill_dir,
+        _shared.spill_budget,
+    ):
+        _shared.configure(budget, spill_dir, spill_budget)
+    return _shared
+
+
+def current():
+    """The process wide cache if it has been created, for showing its counters"""
+    return _shared
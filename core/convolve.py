@@ -0,0 +1,207 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Periodic 2D convolution over the first two axes of an image.
+
+The image is treated as one tile of an infinite repeating plane, so seamless textures stay
+seamless. Kernels are applied as true convolutions with the center tap at (kh // 2, kw // 2):
+
+    out[y, x] = sum(k[j, i] * pix[y - (j - kh // 2), x - (i - kw // 2)])
+
+Small kernels run directly, one in-place shifted multiply-add per tap (or per 1D tap if the
+kernel is separable). Large kernels go through rfft2 with the kernel spectrum cached. With
+method="auto" a rough cost model picks between the two.
+"""
+
+import contextlib
+import math
+import threading
+from collections import OrderedDict
+
+from .backend import get_array_module, np
+
+METHODS = ("auto", "direct", "fft")
+
+# relative cost of one direct tap vs. one FFT butterfly, per pixel and channel
+_DIRECT_TAP_COST = 1.0
+_FFT_COST = 1.2
+_SPECTRUM_CACHE_SIZE = 8
+_spectrum_cache = OrderedDict()
+# previews refine on a worker thread, both threads convolve
+_spectrum_lock = threading.RLock()
+# overrides method="auto" while set, see forced_method(). Per thread, forcing it for tiles
+# must not change a refine running next to them
+_local = threading.local()
+
+
+def _forced():
+    return getattr(_local, "forced", None)
+
+
+@contextlib.contextmanager
+def forced_method(method):
+    """Make method="auto" pick `method` on this thread, for callers that need size independent
+    arithmetic"""
+    old, _local.forced = _forced(), method
+    try:
+        yield
+    finally:
+        _local.forced = old
+
+
+def roll_into(out, src, shift, axis):
+    """out = roll(src, shift, axis) without allocating, out and src must not overlap"""
+    n = src.shape[axis]
+    shift %= n
+    if shift == 0:
+        out[...] = src
+        return out
+    o = out.swapaxes(0, axis)
+    s = src.swapaxes(0, axis)
+    o[shift:] = s[:-shift]
+    o[:shift] = s[-shift:]
+    return out
+
+
+def separate(kernel):
+    """(column, row) 1D kernels whose outer product is kernel, or None"""
+    k = np.asarray(kernel, dtype=np.float64)
+    if not np.any(k):
+        return None, None
+    u, s, vt = np.linalg.svd(k)
+    if len(s) > 1 and s[1] > 1e-6 * s[0]:
+        return None, None
+    col, row = u[:, 0] * math.sqrt(s[0]), vt[0] * math.sqrt(s[0])
+    col[np.abs(col) < 1e-7 * np.abs(col).max()] = 0.0
+    row[np.abs(row) < 1e-7 * np.abs(row).max()] = 0.0
+    return col, row
+
+
+def _direct_1d(pix, taps, axis, xp):
+    """Periodic 1D convolution along axis, allocating only the output and one scratch"""
+    c = len(taps) // 2
+    out = xp.zeros(pix.shape, dtype=xp.float32)
+    tmp = xp.empty_like(out)
+    for j, w in enumerate(taps):
+        if w == 0.0:
+            continue
+        roll_into(tmp, pix, j - c, axis)
+        tmp *= xp.float32(w)
+        out += tmp
+    return out
+
+
+def _direct_2d(pix, kernel, xp):
+    kh, kw = kernel.shape
+    out = xp.zeros(pix.shape, dtype=xp.float32)
+    rows = xp.empty_like(out)
+    tmp = xp.empty_like(out)
+    for j in range(kh):
+        if not np.any(kernel[j]):
+            continue
+        roll_into(rows, pix, j - kh // 2, 0)
+        for i in range(kw):
+            w = kernel[j, i]
+            if w == 0.0:
+                continue
+            roll_into(tmp, rows, i - kw // 2, 1)
+            tmp *= xp.float32(w)
+            out += tmp
+    return out
+
+
+def _kernel_spectrum(kernel, shape, xp):
+    key = (kernel.tobytes(), kernel.shape, shape, xp.__name__)
+    with _spectrum_lock:
+        if key in _spectrum_cache:
+            _spectrum_cache.move_to_end(key)
+            return _spectrum_cache[key]
+
+    # place the kernel so that its center tap lands on (0, 0)
+    kh, kw = kernel.shape
+    h, w = shape
+    ys = (np.arange(kh) - kh // 2) % h
+    xs = (np.arange(kw) - kw // 2) % w
+    padded = np.zeros(shape, dtype=np.float32)
+    np.add.at(padded, (ys[:, None], xs[None, :]), kernel)
+    spec = xp.fft.rfft2(xp.asarray(padded))
+
+    with _spectrum_lock:
+        _spectrum_cache[key] = spec
+        _spectrum_cache.move_to_end(key)
+        if len(_spectrum_cache) > _SPECTRUM_CACHE_SIZE:
+            _spectrum_cache.popitem(last=False)
+    return spec
+
+
+def _fft(pix, kernel, xp):
+    h, w = pix.shape[0], pix.shape[1]
+    spec = _kernel_spectrum(kernel, (h, w), xp)
+    if pix.ndim == 3:
+        spec = spec[..., None]
+    res = xp.fft.irfft2(xp.fft.rfft2(pix, axes=(0, 1)) * spec, s=(h, w), axes=(0, 1))
+    return res.astype(xp.float32, copy=False)
+
+
+def choose_method(shape, kernel):
+    """'direct' or 'fft', whichever the cost model thinks is cheaper"""
+    col, row = separate(kernel)
+    if col is None:
+        taps = np.count_nonzero(kernel)
+    else:
+        taps = np.count_nonzero(col) + np.count_nonzero(row)
+    direct = _DIRECT_TAP_COST * taps
+    fft = _FFT_COST * math.log2(max(shape[0] * shape[1], 2))
+    return "direct" if direct <= fft else "fft"
+
+
+def convolve(pix, kernel, method="auto"):
+    """Periodic convolution of pix (H, W) or (H, W, C) with a 2D kernel"""
+    xp = get_array_module(pix)
+    kernel = np.asarray(kernel.get() if hasattr(kernel, "get") else kernel, dtype=np.float32)
+    if kernel.ndim == 1:
+        kernel = kernel[None, :]
+
+    if method == "auto":
+        method = _forced() or choose_method(pix.shape[:2], kernel)
+
+    if method == "fft":
+        return _fft(pix, kernel, xp)
+    if method != "direct":
+        raise ValueError("Unknown convolution method: {}".format(method))
+
+    col, row = separate(kernel)
+    if col is None:
+        return _direct_2d(pix, kernel, xp)
+    return _direct_1d(_direct_1d(pix, col, 0, xp), row, 1, xp)
+
+
+def convolve_separable(pix, col, row, method="auto"):
+    """Periodic convolution with the outer product of two 1D kernels"""
+    xp = get_array_module(pix)
+    col = np.asarray(col.get() if hasattr(col, "get") else col, dtype=np.float32)
+    row = np.asarray(row.get() if hasattr(row, "get") else row, dtype=np.float32)
+
+    if method == "auto" and _forced():
+        method = _forced()
+    elif method == "auto":
+        taps = len(col) + len(row)
+        fft = _FFT_COST * math.log2(max(pix.shape[0] * pix.shape[1], 2))
+        method = "direct" if _DIRECT_TAP_COST * taps <= fft else "fft"
+
+    if method == "fft":
+        return _fft(pix, np.outer(col, row), xp)
+    if method != "direct":
+        raise ValueError("Unknown convolution method: {}".format(method))
+    return _direct_1d(_direct_1d(pix, col, 0, xp), row, 1, xp)
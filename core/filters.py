@@ -0,0 +1,960 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The image filters behind the operators, as functions on (H, W, 4) float32 arrays.
+
+Filters allocate with the array module of their input, so the same code runs on numpy and
+cupy arrays. The public ones are registry ops: calling them moves the pixels to the fastest
+usable backend that implements them first, see core.registry.
+
+Filters with a single value per pixel (grayscale, curvature, heights) return a gray
+layout.ImageBuffer of that plane and alpha instead of copying it into R, G and B.
+"""
+
+import math
+
+from . import backend
+from . import bilateral
+from . import blur
+from . import convolve
+from . import histogram
+from . import layout
+from . import poisson
+from . import rank
+from . import stages
+from .backend import np
+from .registry import op
+
+
+def gauss_curve(x, xp=np):
+    return blur.gauss_curve(x, xp)
+
+
+def gauss_curve_np(x):
+    return blur.gauss_curve(x, np)
+
+
+def vectors_to_nmap(vectors, nmap):
+    vectors *= 0.5
+    nmap[:, :, 0] = vectors[:, :, 0] + 0.5
+    nmap[:, :, 1] = vectors[:, :, 1] + 0.5
+    nmap[:, :, 2] = vectors[:, :, 2] + 0.5
+
+
+def nmap_to_vectors(nmap):
+    xp = backend.get_array_module(nmap)
+    vectors = xp.empty((nmap.shape[0], nmap.shape[1], 3), dtype=xp.float32)
+    vectors[..., 0] = nmap[..., 0] - 0.5
+    vectors[..., 1] = nmap[..., 1] - 0.5
+    vectors[..., 2] = nmap[..., 2] - 0.5
+    vectors *= 2.0
+    return vectors
+
+
+def neighbour_average(ig):
+    return (ig[1:-1, :-2] + ig[1:-1, 2:] + ig[:-2, 1:-1] + ig[:-2, 1:-1]) * 0.25
+
+
+def explicit_cross(a, b):
+    xp = backend.get_array_module(a)
+    x = a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1]
+    y = a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2]
+    z = a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+    return xp.dstack([x, y, z])
+
+
+def aroll0(o, i, d):
+    if d > 0:
+        k = d
+        o[:-k, :] = i[k:, :]
+        o[-k:, :] = i[:k, :]
+    elif d < 0:
+        k = -d
+        o[k:, :] = i[:-k, :]
+        o[:k, :] = i[-k:, :]
+
+
+def aroll1(o, i, d):
+    if d > 0:
+        k = d
+        o[:, :-k] = i[:, k:]
+        o[:, -k:] = i[:, :k]
+    elif d < 0:
+        k = -d
+        o[:, k:] = i[:, :-k]
+        o[:, :k] = i[:, -k:]
+
+
+def addroll0(o, i, d):
+    if d > 0:
+        k = d
+        o[:-k, :] += i[k:, :]
+        o[-k:, :] += i[:k, :]
+    elif d < 0:
+        k = -d
+        o[k:, :] += i[:-k, :]
+        o[:k, :] += i[-k:, :]
+
+
+def addroll1(o, i, d):
+    if d > 0:
+        k = d
+        o[:, :-k] += i[:, k:]
+        o[:, -k:] += i[:, :k]
+    elif d < 0:
+        k = -d
+        o[:, k:] += i[:, :-k]
+        o[:, :k] += i[:, -k:]
+
+
+def convolution(ssp, intens, sfil):
+    # source, intensity, convolution matrix
+    return convolve.convolve(ssp, sfil)
+
+
+@op()
+def grayscale(ssp):
+    r, g, b = ssp[:, :, 0], ssp[:, :, 1], ssp[:, :, 2]
+    res = layout.gray(0.2989 * r, ssp[..., 3])
+    gray = res.plane("L")
+    gray += 0.5870 * g
+    gray += 0.1140 * b
+    return res
+
+
+@op(compact=True)
+def normalize(pix, save_alpha=False):
+    xp = backend.get_array_module(pix)
+    if layout.is_gray(pix):
+        return _normalize_gray(pix, save_alpha, xp)
+    pix = layout.as_rgba(pix)
+    if save_alpha:
+        A = pix[..., 3]
+    t = pix - xp.min(pix)
+    t = t / xp.max(t)
+    if save_alpha:
+        t[..., 3] = A
+    return t
+
+
+def _normalize_gray(pix, save_alpha, xp):
+    # the same numbers as normalize() of the RGBA pixels, with R, G and B computed once
+    L = pix.plane("L")
+    A = layout.plane(pix, "A")
+    lo = xp.minimum(xp.min(L), xp.min(A))
+    res = layout.empty_gray(L.shape, A, xp)
+    gray, alpha = res.plane("L"), res.plane("A")
+    xp.subtract(L, lo, out=gray)
+    alpha -= lo
+    m = xp.maximum(xp.max(gray), xp.max(alpha))
+    gray /= m
+    if save_alpha:
+        alpha[...] = A
+    else:
+        alpha /= m
+    return res
+
+
+@op()
+def random_pixels(image):
+    xp = backend.get_array_module(image)
+    t = xp.random.default_rng().random(image.shape, dtype=xp.float32)
+    t[..., 3] = 1.0
+    return t
+
+
+@op()
+def swizzle(image, order_a, order_b, reverse=False):
+    test_a = order_a.upper()
+    test_b = order_b.upper()
+
+    if len(test_a) != 4 or len(test_b) != 4:
+        raise ValueError("Swizzle channel count must be 4")
+
+    if set(test_a) != set(test_b):
+        raise ValueError("Swizzle channels must have same names")
+
+    first = order_a
+    second = order_b
+
+    if reverse:
+        first, second = second, first
+
+    temp = image.copy()
+
+    for i in range(4):
+        fl = first[i].upper()
+        t = second.upper().index(fl)
+        if second[t] != first[i]:
+            temp[..., t] = 1.0 - image[..., i]
+        else:
+            temp[..., t] = image[..., i]
+
+    return temp
+
+
+@op()
+def fractal(image, count, style):
+    # A = image[..., 3]
+    iw, ih = image.shape[1], image.shape[0]
+    iwh, ihh = iw // 2, ih // 2
+
+    pix = image.copy()
+    for i in range(count):
+        if style == "blend":
+            smol = pix[::2, ::2, :] * 0.5
+            pix *= 0.5
+            pix[:ihh, :iwh, :] += smol
+            pix[-ihh:, :iwh, :] += smol
+            pix[:ihh, -iwh:, :] += smol
+            pix[-ihh:, -iwh:, :] += smol
+        else:
+            smol = pix[::2, ::2, :].copy() * 2.0
+            pix[:ihh, :iwh, :] *= smol
+            pix[ihh:, :iwh, :] *= smol
+            pix[:ihh, iwh:, :] *= smol
+            pix[ihh:, iwh:, :] *= smol
+
+            if style == "multiply":
+                pix *= 0.5
+            else:
+                pix = (pix - 0.5) * 0.5 + 0.5
+
+    # pix[..., 3] = A
+    return pix
+
+
+@op()
+def crop_to_power(image):
+    h, w = image.shape[0], image.shape[1]
+
+    offx = 0
+    offy = 0
+
+    wpow = int(math.log2(w))
+    hpow = int(math.log2(h))
+
+    offx = (w - 2 ** wpow) // 2
+    offy = (h - 2 ** hpow) // 2
+
+    if w > 2 ** wpow:
+        w = 2 ** wpow
+    if h > 2 ** hpow:
+        h = 2 ** hpow
+    # crop to center
+    image = image[offy : offy + h, offx : offx + w]
+
+    return image
+
+
+@op()
+def crop_to_square(image):
+    h, w = image.shape[0], image.shape[1]
+
+    offx = w // 2
+    offy = h // 2
+
+    if h > w:
+        h = w
+    if w > h:
+        w = h
+
+    xt = w // 2 - 1
+    yt = w // 2 - 1
+
+    # crop to center
+    image = image[offy - yt : offy + yt, offx - xt : offx + xt]
+
+    return image
+
+
+def sobel_x(pix, intensity):
+    xp = backend.get_array_module(pix)
+    gx = xp.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+    return convolution(pix, intensity, gx)
+
+
+def sobel_y(pix, intensity):
+    xp = backend.get_array_module(pix)
+    gy = xp.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]])
+    return convolution(pix, intensity, gy)
+
+
+@op(compact=True)
+def sobel(pix, intensity):
+    if layout.is_gray(pix):
+        # a gray plane convolved once instead of in R, G and B
+        L = pix.plane("L")
+        res = sobel_x(L, 1.0)
+        res += sobel_y(L, 1.0)
+        return layout.gray((res * intensity) * 0.5 + 0.5, pix.plane("A"))
+    pix = layout.as_rgba(pix)
+    retarr = sobel_x(pix, 1.0)
+    retarr += sobel_y(pix, 1.0)
+    retarr = (retarr * intensity) * 0.5 + 0.5
+    retarr[..., 3] = pix[..., 3]
+    return retarr
+
+
+@op()
+def gaussian_repeat(pix, s, method="exact"):
+    return blur.gaussian(pix, s, method=method)
+
+
+@op()
+def sharpen(pix, width, intensity):
+    # return convolution(pix, intensity, cup.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]]))
+    A = pix[..., 3]
+    gas = gaussian_repeat(pix, width)
+    pix += (pix - gas) * intensity
+    pix[..., 3] = A
+    return pix
+
+
+@op()
+def hi_pass(pix, s, intensity):
+    bg = pix.copy()
+    pix = (bg - gaussian_repeat(pix, s)) * 0.5 + 0.5
+    pix[:, :, 3] = bg[:, :, 3]
+    return pix
+
+
+def gaussian_repeat_fit(pix, s):
+    rf = s
+    pix[0, :] = (pix[0, :] + pix[-1, :]) * 0.5
+    pix[-1, :] = pix[0, :]
+    for i in range(1, rf):
+        factor = ((rf - i)) / rf
+        pix[i, :] = pix[0, :] * factor + pix[i, :] * (1 - factor)
+        pix[-i, :] = pix[0, :] * factor + pix[-i, :] * (1 - factor)
+
+    pix[:, 0] = (pix[:, 0] + pix[:, -1]) * 0.5
+    pix[:, -1] = pix[:, 0]
+    for i in range(1, rf):
+        factor = ((rf - i)) / rf
+        pix[:, i] = pix[:, 0] * factor + pix[:, i] * (1 - factor)
+        pix[:, -i] = pix[:, 0] * factor + pix[:, -i] * (1 - factor)
+
+    return gaussian_repeat(pix, s)
+
+
+@op()
+def hist_match(source, template, method="histogram"):
+    """
+    Adjust the pixel values of a grayscale image such that its histogram
+    matches that of a target image
+
+    Arguments:
+    -----------
+        source: np.ndarray
+            Image to transform; the histogram is computed over the flattened
+            array
+        template: np.ndarray
+            Template image; can have different dimensions to source
+        method: str
+            One of histogram.METHODS
+    Returns:
+    -----------
+        matched: np.ndarray
+            The transformed output image
+    """
+    t_values, t_quantiles = histogram.distribution(template, method)
+    return histogram.match(source, t_values, t_quantiles, method)[0]
+
+
+@op()
+def gaussianize(source, NG=1000, method="histogram"):
+    output = source.copy()
+    transforms = []
+
+    t_values = np.arange(NG * 8 + 1) / (NG * 8)
+    t_counts = gauss_curve_np(NG * 4)
+    t_quantiles = np.cumsum(t_counts).astype(np.float64)
+
+    t_max = 0.0
+    for i in range(3):
+        tv, (s_values, s_quantiles) = histogram.match(
+            source[..., i], t_values, t_quantiles, method
+        )
+        s_max = s_quantiles[-1]
+        if s_max > t_max:
+            t_max = s_max
+        # the source distribution, so degaussianize can map back without counting it again
+        transforms.append([s_values, s_quantiles, s_max])
+        output[..., i] = tv
+
+    return output, transforms
+
+
+@op()
+def degaussianize(source, transforms, method="histogram"):
+    output = source.copy()
+
+    for i in range(3):
+        t_values, t_quantiles, _ = transforms[i]
+        output[..., i] = histogram.match(output[..., i], t_values, t_quantiles, method)[0]
+
+    return output
+
+
+HISTOGRAM_SEAMLESS = stages.Graph(
+    "histogram_seamless",
+    [
+        stages.stage(
+            "gaussian",
+            lambda image, method: gaussianize(image, method=method),
+            params=["method"],
+        ),
+        stages.stage("blended", lambda g: gimpify(g[0]), inputs=["gaussian"]),
+        stages.stage(
+            "result",
+            lambda blended, g, method: degaussianize(blended, g[1], method=method),
+            inputs=["blended", "gaussian"],
+            params=["method"],
+        ),
+    ],
+)
+
+
+@op()
+def histogram_seamless(image, method="histogram"):
+    return HISTOGRAM_SEAMLESS.run(image, method=method)
+
+
+def cumulative_distribution(data, bins):
+    xp = backend.get_array_module(data)
+    assert xp.min(data) >= 0.0 and xp.max(data) <= 1.0
+    hg_av, hg_a = xp.unique(xp.floor(data * (bins - 1)), return_index=True)
+    hg_a = xp.float32(hg_a)
+    hgs = xp.sum(hg_a)
+    hg_a /= hgs
+    res = xp.zeros((bins,))
+    res[xp.int64(hg_av)] = hg_a
+    return xp.cumsum(res)
+
+
+def _center_distributions(pix, zoom, method):
+    # distribution of each color channel in a (2 * zoom)^2 slice at the image center
+    yzm = pix.shape[0] // 2
+    xzm = pix.shape[1] // 2
+
+    yzoom = zoom if zoom < yzm else yzm
+    xzoom = zoom if zoom < xzm else xzm
+
+    center = pix[yzm - yzoom : yzm + yzoom, xzm - xzoom : xzm + xzoom]
+    return [histogram.distribution(center[..., c], method) for c in range(3)]
+
+
+def _hi_pass_centered(pix, s):
+    pixmin = pix.min()
+    pixmax = pix.max()
+    med = (pixmin + pixmax) / 2
+    # TODO: np.mean
+    gas = gaussian_repeat(pix - med, s) + med
+    return (pix - gas) * 0.5 + 0.5
+
+
+def _hi_pass_balance_match(bg, hp, distributions, method):
+    pix = hp.copy()
+    for c in range(3):
+        pix[..., c] = histogram.match(pix[..., c], *distributions[c], method)[0]
+    pix[..., 3] = bg[..., 3]
+    return pix
+
+
+HI_PASS_BALANCE = stages.Graph(
+    "hi_pass_balance",
+    [
+        stages.stage("high_pass", _hi_pass_centered, params=["s"]),
+        stages.stage("distributions", _center_distributions, params=["zoom", "method"]),
+        stages.stage(
+            "result",
+            _hi_pass_balance_match,
+            inputs=["source", "high_pass", "distributions"],
+            params=["method"],
+        ),
+    ],
+)
+
+
+@op()
+def hi_pass_balance(pix, s, zoom, method="histogram"):
+    return HI_PASS_BALANCE.run(pix, s=s, zoom=zoom, method=method)
+
+
+@op()
+def hgram_equalize(pix, intensity, atest):
+    xp = backend.get_array_module(pix)
+    old = pix.copy()
+    # aw = cup.argwhere(pix[..., 3] > atest)
+    aw = (pix[..., 3] > atest).nonzero()
+    aws = (aw[0], aw[1])
+    # aws = (aw[:, 0], aw[:, 1])
+    for c in range(3):
+        t = pix[..., c][aws]
+        pix[..., c][aws] = xp.sort(t).searchsorted(t)
+        # pix[..., c][aws] = cup.argsort(t)
+    pix[..., :3] /= xp.max(pix[..., :3])
+    return old * (1.0 - intensity) + pix * intensity
+
+
+@op()
+def bilateral_filter(pix, s, intensity, source, method="exact"):
+    # multiply by alpha
+    # pix[..., 0] *= pix[..., 3]
+    # pix[..., 1] *= pix[..., 3]
+    # pix[..., 2] *= pix[..., 3]
+
+    # TODO: this
+    # if source == "SOBEL":
+    #     sb = sobel(pix, 1.0)
+    # else:
+    #     sb = pix
+
+    # image, spatial, range. RGB in one go, each channel weighted by its own differences
+    res = pix.copy()
+    res[..., :3] = bilateral.bilateral(pix[..., :3], s, intensity, method=method)
+    return res
+
+
+@bilateral_filter.implementation("numba")
+def _bilateral_filter_numba(pix, s, intensity, source, method="exact"):
+    from . import numba_kernels
+
+    res = pix.copy()
+    res[..., :3] = bilateral.bilateral(
+        pix[..., :3], s, intensity, method=method, exact=numba_kernels.bilateral
+    )
+    return res
+
+
+@op()
+def median_filter_blobs(pix, s, picked="center"):
+    return rank.rank_filter(pix, s * 2, s, _blob_pick(s, picked))
+
+
+@median_filter_blobs.implementation("numba")
+def _median_filter_blobs_numba(pix, s, picked="center"):
+    from . import numba_kernels
+
+    return numba_kernels.rank_filter(pix, s * 2, s, _blob_pick(s, picked))
+
+
+def _blob_pick(s, picked):
+    # 2s wide window from x - s to x + s - 1, erode picks the smallest value, dilate the
+    # largest and neutral the upper median
+    pick = 0
+    if picked == "center":
+        pick = s
+    if picked == "end":
+        pick = s * 2 - 1
+    return pick
+
+
+@op()
+def normals_simple(pix, source):
+    xp = backend.get_array_module(pix)
+    pix = grayscale(pix)
+    pix = normalize(pix)
+    sshape = pix.shape
+    height = layout.plane(pix, "B")
+
+    # extract x and y deltas, of the gray plane only
+    px = xp.empty(sshape[:2] + (3,), dtype=xp.float32)
+    px[:, :, 2] = sobel_x(height, 1.0)
+    px[:, :, 1] = 0
+    px[:, :, 0] = 1
+
+    py = xp.empty(sshape[:2] + (3,), dtype=xp.float32)
+    py[:, :, 2] = sobel_y(height, 1.0)
+    py[:, :, 1] = 1
+    py[:, :, 0] = 0
+
+    # normalize
+    # dv = max(abs(cup.min(curve)), abs(cup.max(curve)))
+    # curve /= dv
+
+    # find the imagined approximate surface normal
+    # arr = cup.cross(px[:, :, :3], py[:, :, :3])
+    arr = explicit_cross(px[:, :, :3], py[:, :, :3])
+
+    # normalization: vec *= 1/len(vec)
+    m = 1.0 / xp.sqrt(arr[:, :, 0] ** 2 + arr[:, :, 1] ** 2 + arr[:, :, 2] ** 2)
+    arr[..., 0] *= m
+    arr[..., 1] *= m
+    arr[..., 2] *= m
+    arr[..., 0] = -arr[..., 0]
+
+    # normals format
+    retarr = xp.zeros(sshape, dtype=xp.float32)
+    vectors_to_nmap(arr, retarr)
+    retarr[:, :, 3] = layout.plane(pix, "A")
+    return retarr
+
+
+@op()
+def normals_to_curvature(pix):
+    xp = backend.get_array_module(pix)
+    intensity = 1.0
+    res = layout.empty_gray(pix.shape, pix[..., 3], xp)
+    curve = res.plane("L")
+    curve.fill(0.0)
+    vectors = nmap_to_vectors(pix)
+
+    # y_vec = cup.array([1, 0, 0], dtype=cup.float32)
+    # x_vec = cup.array([0, 1, 0], dtype=cup.float32)
+
+    # yd = vectors.dot(x_vec)
+    # xd = vectors.dot(y_vec)
+
+    xd = vectors[:, :, 0]
+    yd = vectors[:, :, 1]
+
+    # curve[0,0] = yd[1,0]
+    curve[:-1, :] += yd[1:, :]
+    curve[-1, :] += yd[0, :]
+
+    # curve[0,0] = yd[-1,0]
+    curve[1:, :] -= yd[:-1, :]
+    curve[0, :] -= yd[-1, :]
+
+    # curve[0,0] = xd[1,0]
+    curve[:, :-1] += xd[:, 1:]
+    curve[:, -1] += xd[:, 0]
+
+    # curve[0,0] = xd[-1,0]
+    curve[:, 1:] -= xd[:, :-1]
+    curve[:, 0] -= xd[:, -1]
+
+    # normalize
+    dv = max(abs(xp.min(curve)), abs(xp.max(curve)))
+    curve /= dv
+
+    # 0 = 0.5 grey
+    curve *= intensity
+    curve += 0.5
+
+    return res
+
+
+@op(compact=True)
+def curvature_to_height(image, h2, method="multigrid", tol=1e-4, iterations=100):
+    xp = backend.get_array_module(image)
+    f = layout.plane(image, "R")
+    A = layout.plane(image, "A")
+
+    # zero alpha = zero height
+    u, _ = poisson.poisson_solve(
+        h2 * f, mask=A, fill=0.0, method=method, tol=tol, max_iterations=iterations
+    )
+
+    u = -u
+    u -= xp.min(u)
+    u /= xp.max(u)
+
+    return layout.gray(u, A)
+
+
+@op()
+def normals_to_height(image, method="multigrid", tol=1e-4, iterations=100, intensity=1.0):
+    xp = backend.get_array_module(image)
+    vectors = nmap_to_vectors(image)
+    # vectors[..., 0] = 0.5 - image[..., 0]
+    # vectors[..., 1] = image[..., 1] - 0.5
+
+    vectors *= intensity
+
+    # divergence of the normal slopes, with central differences
+    f = xp.roll(vectors[..., 0], -1, axis=1)
+    f -= xp.roll(vectors[..., 0], 1, axis=1)
+    f += xp.roll(vectors[..., 1], -1, axis=0)
+    f -= xp.roll(vectors[..., 1], 1, axis=0)
+    f *= 0.5
+
+    u, _ = poisson.poisson_solve(f, method=method, tol=tol, max_iterations=iterations)
+
+    u = -u
+    u -= xp.min(u)
+    u /= xp.max(u)
+
+    return layout.gray(u, image[..., 3])
+
+
+def _delight_divergence(image, dd):
+    xp = backend.get_array_module(image)
+    A = image[..., 3]
+
+    grads = xp.zeros((image.shape[0], image.shape[1], 2), dtype=xp.float32)
+    grads[..., 0] = (xp.roll(image[..., 0], 1, axis=0) - image[..., 0]) * dd
+    grads[..., 1] = (image[..., 0] - xp.roll(image[..., 0], 1, axis=1)) * dd
+    # grads[..., 0] = (image[..., 0] - 0.5) * (dd)
+    # grads[..., 1] = (image[..., 0] - 0.5) * (dd)
+
+    f = xp.roll(grads[..., 0], -1, axis=1)
+    f -= xp.roll(grads[..., 0], 1, axis=1)
+    f += xp.roll(grads[..., 1], -1, axis=0)
+    f -= xp.roll(grads[..., 1], 1, axis=0)
+    f *= 0.5 * A
+    return f
+
+
+def _delight_solve(image, f, method, tol, iterations):
+    xp = backend.get_array_module(image)
+    # zero alpha = max height
+    u, _ = poisson.poisson_solve(
+        f, mask=image[..., 3], fill="max", method=method, tol=tol, max_iterations=iterations
+    )
+
+    u = -u
+    u -= xp.min(u)
+    u /= xp.max(u)
+    return u
+
+
+def _delight_shade(image, u):
+    # u *= image[..., 3]
+
+    # u -= cup.mean(u)
+    # u /= max(abs(cup.min(u)), abs(cup.max(u)))
+    # u *= 0.5
+    # u += 0.5
+    # u = 1.0 - u
+
+    # return cup.dstack([(u - image[..., 0]) * 0.5 + 0.5, u, u, image[..., 3]])
+    u = (image[..., 0] - u) * 0.5 + 0.5
+    return layout.gray(u, image[..., 3])
+
+
+DELIGHT = stages.Graph(
+    "delight",
+    [
+        # the solve integrates any rounding of its right hand side
+        stages.stage("divergence", _delight_divergence, params=["dd"], exact=True),
+        stages.stage(
+            "height",
+            _delight_solve,
+            inputs=["source", "divergence"],
+            params=["method", "tol", "iterations"],
+        ),
+        stages.stage("result", _delight_shade, inputs=["source", "height"]),
+    ],
+)
+
+
+@op()
+def delight_simple(image, dd, method="multigrid", tol=1e-4, iterations=100):
+    return DELIGHT.run(image, dd=dd, method=method, tol=tol, iterations=iterations)
+
+
+@op()
+def fill_alpha(image, style="black"):
+    if style == "black":
+        for c in range(3):
+            image[..., c] *= image[..., 3]
+        image[..., 3] = 1.0
+        return image
+    else:
+        cols = [0.5, 0.5, 1.0]
+        A = image[..., 3]
+        for c in range(3):
+            image[..., c] = cols[c] * (1 - A) + image[..., c] * A
+        image[..., 3] = 1.0
+        return image
+
+
+def dog(pix, a, b, mp):
+    xp = backend.get_array_module(pix)
+    pixb = pix.copy()
+    pix[..., :3] = xp.abs(gaussian_repeat(pix, a) - gaussian_repeat(pixb, b))[..., :3]
+    pix[pix < mp][..., :3] = 0.0
+    return pix
+
+
+@op()
+def gimpify(image):
+    xp = backend.get_array_module(image)
+    pixels = xp.copy(image)
+    xs, ys = image.shape[1], image.shape[0]
+    image = xp.roll(image, _gimpify_shift(xs, ys))
+
+    # apply mask
+    amask = _gimpify_mask(xs, ys, xp)[..., None]
+
+    return amask * image + (1.0 - amask) * pixels
+
+
+@gimpify.implementation("numba")
+def _gimpify_numba(image):
+    from . import numba_kernels
+
+    xs, ys = image.shape[1], image.shape[0]
+    return numba_kernels.gimpify_blend(image, _gimpify_mask(xs, ys, np), _gimpify_shift(xs, ys))
+
+
+def _gimpify_shift(xs, ys):
+    # half the image down and half across, on the flattened pixels
+    return xs * 2 + xs * 4 * (ys // 2)
+
+
+def _gimpify_mask(xs, ys, xp):
+    sxs = xs // 2
+    sys = ys // 2
+
+    # generate the mask, in float64 on the host like the per pixel loop it replaces
+    zy0 = (np.arange(sys) / sys + 0.001)[:, None]
+    zy1 = (1 - np.arange(sys) / sys + 0.001)[:, None]
+    xr = (np.arange(sxs) / sxs)[None, :]
+    p = 1.0 - zy0 / (1.0 - xr + 0.001)
+    t = 1.0 - xr / zy1
+    tmask = xp.asarray(np.maximum(t, p), dtype=xp.float32)
+
+    imask = xp.zeros((ys, xs), dtype=xp.float32)
+    imask[:sys, :sxs] = tmask
+
+    imask[imask < 0] = 0
+
+    # copy the data into the three remaining corners
+    imask[0 : sys + 1, sxs:xs] = xp.fliplr(imask[0 : sys + 1, 0:sxs])
+    imask[-sys:ys, 0:sxs] = xp.flipud(imask[0:sys, 0:sxs])
+    imask[-sys:ys, sxs:xs] = xp.flipud(imask[0:sys, sxs:xs])
+    imask[sys, :] = imask[sys - 1, :]  # center line
+    return imask
+
+
+@op()
+def inpaint_tangents(pixels, threshold):
+    xp = backend.get_array_module(pixels)
+    # invalid = pixels[:, :, 2] < 0.5 + (self.tolerance * 0.5)
+    invalid = pixels[:, :, 2] < threshold
+    # n2 = (
+    #     ((pixels[:, :, 0] - 0.5) * 2) ** 2
+    #     + ((pixels[:, :, 1] - 0.5) * 2) ** 2
+    #     + ((pixels[:, :, 2] - 0.5) * 2) ** 2
+    # )
+    # invalid |= (n2 < 0.9) | (n2 > 1.1)
+
+    # grow selection
+    for _ in range(2):
+        invalid[0, :] = False
+        invalid[-1, :] = False
+        invalid[:, 0] = False
+        invalid[:, -1] = False
+
+        invalid = (
+            xp.roll(invalid, 1, axis=0)
+            | xp.roll(invalid, -1, axis=0)
+            | xp.roll(invalid, 1, axis=1)
+            | xp.roll(invalid, -1, axis=1)
+        )
+
+    pixels[invalid] = xp.array([0.5, 0.5, 1.0, 1.0])
+
+    invalid[0, :] = False
+    invalid[-1, :] = False
+    invalid[:, 0] = False
+    invalid[:, -1] = False
+
+    # fill
+    front = xp.copy(invalid)
+    locs = [(0, -1, 1), (0, 1, -1), (1, -1, 1), (1, 1, -1)]
+    for _ in range(4):
+        for l in locs:
+            r = xp.roll(front, l[1], axis=l[0])
+            a = (r != front) & front
+            pixels[a] = pixels[xp.roll(a, l[2], axis=l[0])]
+            front[a] = False
+
+    cl = xp.roll(invalid, -1, axis=0)
+    cr = xp.roll(invalid, 1, axis=0)
+    uc = xp.roll(invalid, -1, axis=1)
+    bc = xp.roll(invalid, 1, axis=1)
+
+    # smooth
+    for _ in range(4):
+        pixels[invalid] = (pixels[invalid] + pixels[cl] + pixels[cr] + pixels[uc] + pixels[bc]) / 5
+
+    return pixels
+
+
+@inpaint_tangents.implementation("numba")
+def _inpaint_tangents_numba(pixels, threshold):
+    from . import numba_kernels
+
+    return numba_kernels.inpaint_tangents(pixels, threshold)
+
+
+@op()
+def normalize_tangents(image):
+    xp = backend.get_array_module(image)
+    ih, iw = image.shape[0], image.shape[1]
+    vectors = xp.zeros((ih, iw, 3), dtype=xp.float32)
+    vectors[..., 0] = image[..., 0] - 0.5
+    vectors[..., 1] = image[..., 1] - 0.5
+    vectors[..., 2] = image[..., 2] - 0.5
+
+    vectors = vectors / xp.linalg.norm(vectors, axis=2)[..., None] * 0.5
+
+    retarr = xp.empty_like(image)
+    retarr[:, :, 0] = 0.5 + vectors[:, :, 0]
+    retarr[:, :, 1] = 0.5 + vectors[:, :, 1]
+    retarr[:, :, 2] = 0.5 + vectors[:, :, 2]
+    retarr[:, :, 3] = image[..., 3]
+
+    return retarr
+
+
+def _contrast_error(image, gcr, gB, method):
+    xp = backend.get_array_module(image)
+    # squared error, blurred and scaled to 0..1
+    error = (image - gcr) ** 2
+    mask = -gaussian_repeat(error, gB, method=method)
+    mask -= xp.min(mask)
+    mask /= xp.max(mask)
+    return mask
+
+
+def _contrast_apply(image, gcr, mask, strength):
+    mask = (mask - 0.5) * strength + 1.0
+    res = gcr + mask * (image - gcr)
+
+    res[..., 3] = image[..., 3]
+    return res
+
+
+CONTRAST_BALANCE = stages.Graph(
+    "contrast_balance",
+    [
+        stages.stage(
+            "blurred",
+            lambda image, gA, method: gaussian_repeat(image, gA, method=method),
+            params=["gA", "method"],
+        ),
+        stages.stage(
+            "mask", _contrast_error, inputs=["source", "blurred"], params=["gB", "method"]
+        ),
+        stages.stage(
+            "result", _contrast_apply, inputs=["source", "blurred", "mask"], params=["strength"]
+        ),
+    ],
+)
+
+
+@op()
+def contrast_balance(image, gA, gB, strength, method="exact"):
+    return CONTRAST_BALANCE.run(image, gA=gA, gB=gB, strength=strength, method=method)
+
+
+@op()
+def image_to_material(image):
+    return image
@@ -0,0 +1,109 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Empirical distributions and histogram matching.
+
+A distribution is a pair (values, quantiles) of increasing knots, quantile being the share
+of samples <= value. Mapping a channel through another distribution sends each sample to the
+value at its own quantile.
+
+Methods:
+    exact      -- knots at every distinct value, from a full sort (O(n log n))
+    histogram  -- BINS bins between the channel min and max, counted with bincount (O(n)).
+                  Quantiles are interpolated linearly inside a bin. Values sitting on a bin
+                  edge, like 8 and 16 bit data does, come out the same as with exact. Data
+                  where most values crowd into a few bins (HDR with a long tail) loses
+                  precision there, use exact for that.
+
+Both run on numpy and cupy arrays.
+"""
+
+from .backend import get_array_module
+
+METHODS = ("histogram", "exact")
+
+BINS = 65536
+
+
+def _binned(a, bins):
+    """Bin b and position (0, 1] inside it of every value, and the value at each bin's top"""
+    xp = get_array_module(a)
+    lo = float(a.min())
+    hi = float(a.max())
+    scale = (bins - 1) / (hi - lo) if hi > lo else 0.0
+
+    # bin b holds values in ((b - 1) / scale, b / scale], so values exactly on a level sit
+    # at the top of their bin and get its whole count, the way a sort would count them
+    p = (a - lo) * scale
+    top = xp.clip(xp.ceil(p), 0, bins - 1)
+    frac = xp.clip(p - (top - 1), 0.0, 1.0)
+    b = top.astype(xp.int64)
+    tops = lo + xp.arange(bins, dtype=xp.float64) / scale if scale else xp.full(bins, lo)
+    return b, frac, tops
+
+
+def distribution(a, method="histogram", bins=BINS):
+    """Knots (values, quantiles) of the distribution of all values in a"""
+    xp = get_array_module(a)
+    a = a.ravel()
+    if method == "exact":
+        values, counts = xp.unique(a, return_counts=True)
+    elif method == "histogram":
+        b, _, tops = _binned(a, bins)
+        counts = xp.bincount(b, minlength=bins)
+        used = counts > 0
+        values, counts = tops[used], counts[used]
+    else:
+        raise ValueError("Unknown histogram method: {}".format(method))
+
+    quantiles = xp.cumsum(counts).astype(xp.float64)
+    quantiles /= quantiles[-1]
+    return values, quantiles
+
+
+def match(source, t_values, t_quantiles, method="histogram", bins=BINS):
+    """
+    Map source onto the distribution (t_values, t_quantiles).
+
+    Returns the mapped array, same shape and dtype as source, and the knots of the source
+    distribution so the mapping can be undone later without counting the source again.
+    """
+    xp = get_array_module(source)
+    flat = source.ravel()
+    t_values = xp.asarray(t_values)
+    t_quantiles = xp.asarray(t_quantiles)
+
+    if method == "exact":
+        s_values, bin_idx, s_counts = xp.unique(flat, return_inverse=True, return_counts=True)
+        s_quantiles = xp.cumsum(s_counts).astype(xp.float64)
+        s_quantiles /= s_quantiles[-1]
+        lut = xp.interp(s_quantiles, t_quantiles, t_values).astype(source.dtype)
+        mapped = lut[bin_idx.ravel()]
+        return mapped.reshape(source.shape), (s_values, s_quantiles)
+
+    if method != "histogram":
+        raise ValueError("Unknown histogram method: {}".format(method))
+
+    b, frac, tops = _binned(flat, bins)
+    counts = xp.bincount(b, minlength=bins)
+    cdf = xp.cumsum(counts).astype(xp.float64)
+    cdf /= cdf[-1]
+
+    # result at the top of every bin, samples inside a bin interpolate from the one below
+    lut = xp.interp(cdf, t_quantiles, t_values).astype(source.dtype)
+    below = lut[xp.maximum(b - 1, 0)]
+    mapped = below + (lut[b] - below) * frac
+
+    used = counts > 0
+    return mapped.reshape(source.shape), (tops[used], cdf[used])
@@ -0,0 +1,86 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Reading and writing image files outside of Blender.
+
+Arrays are (H, W, 4) float32 with the bottom row first, the way Blender stores pixels, so
+filters see the same data as they do inside Blender. `.npy` files are always supported,
+other formats need Pillow.
+
+Pillow reads 16 bit grayscale at full precision but 16 bit colour (PNG, TIFF) only at 8
+bits, loading one warns. Outputs are written at 8 bits, without alpha in formats that have
+none (JPEG). Use `.npy` to keep float precision in and out.
+"""
+
+import os
+import warnings
+
+from .backend import np
+
+try:
+    from PIL import Image
+
+    PIL_ACTIVE = True
+except Exception:
+    PIL_ACTIVE = False
+
+
+def _require_pil(path):
+    if not PIL_ACTIVE:
+        raise RuntimeError("Pillow is needed for {}, or use .npy files".format(path))
+
+
+# formats Pillow can't write RGBA to
+_NO_ALPHA = (".jpg", ".jpeg")
+
+
+def _is_16bit_colour(img):
+    # Pillow has no 16 bit colour modes, the file's raw mode tells them apart
+    return img.mode in ("RGB", "RGBA") and any(";16" in str(t[3]) for t in img.tile)
+
+
+def load_image(path):
+    if path.lower().endswith(".npy"):
+        pix = np.load(path).astype(np.float32, copy=False)
+        if pix.ndim != 3 or pix.shape[2] != 4:
+            raise ValueError("{}: expected an (H, W, 4) array".format(path))
+        return pix
+
+    _require_pil(path)
+    with Image.open(path) as img:
+        if img.mode in ("I;16", "I;16B", "I"):
+            arr = np.asarray(img, dtype=np.float32) / 65535.0
+            arr = np.dstack([arr, arr, arr])
+        else:
+            if _is_16bit_colour(img):
+                warnings.warn("{}: 16 bit colour is read at 8 bits, use .npy".format(path))
+            arr = np.asarray(img.convert("RGBA"), dtype=np.float32) / 255.0
+
+    pix = np.ones((arr.shape[0], arr.shape[1], 4), dtype=np.float32)
+    pix[..., : arr.shape[2]] = arr
+    return np.ascontiguousarray(pix[::-1])
+
+
+def save_image(path, pix):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.lower().endswith(".npy"):
+        np.save(path, np.ascontiguousarray(pix, dtype=np.float32))
+        return
+
+    _require_pil(path)
+    arr = np.clip(pix[::-1] * 255.0 + 0.5, 0, 255).astype(np.uint8)
+    if path.lower().endswith(_NO_ALPHA):
+        Image.fromarray(np.ascontiguousarray(arr[..., :3]), "RGB").save(path)
+    else:
+        Image.fromarray(arr, "RGBA").save(path)
@@ -0,0 +1,182 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Pixels that know their channel layout.
+
+Blender images are (H, W, 4) interleaved RGBA, four values a pixel even when a result is a
+single one: grayscale, curvature and the height solvers used to write the same plane into
+R, G and B. An ImageBuffer holds only the channels there are, either as planes (C, H, W)
+or interleaved (H, W, C), and builds RGBA where something needs it:
+
+    pixel_io.write_pixels / to_host   at the Blender boundary, after leaving the device
+    registry.Op                       filters take their input as RGBA, see as_rgba(),
+                                      except compact ops, which read planes with plane()
+
+Until then a gray result is half the size in the result cache and the stage memo, and half
+the transfer off the GPU. The layouts:
+
+    L     one value shown as grey, opaque
+    LA    one value and alpha
+    RGB   colour, opaque
+    RGBA  colour and alpha
+"""
+
+from . import trace
+from .backend import get_array_module, np
+
+CHANNELS = ("L", "LA", "RGB", "RGBA")
+
+
+class ImageBuffer:
+    """Pixels in one of the CHANNELS layouts, planar (C, H, W) or interleaved (H, W, C)"""
+
+    def __init__(self, data, channels="RGBA", planar=False):
+        if channels not in CHANNELS:
+            raise ValueError("Unknown channel layout: {}".format(channels))
+        if data.ndim != 3 or data.shape[0 if planar else 2] != len(channels):
+            raise ValueError(
+                "{} pixels of shape {} don't have the {} channels of {}".format(
+                    "Planar" if planar else "Interleaved",
+                    tuple(data.shape),
+                    len(channels),
+                    channels,
+                )
+            )
+        self.data = data
+        self.channels = channels
+        self.planar = planar
+
+    def __repr__(self):
+        return "ImageBuffer({}x{} {} {})".format(
+            self.width, self.height, self.channels, "planar" if self.planar else "interleaved"
+        )
+
+    @property
+    def xp(self):
+        return get_array_module(self.data)
+
+    @property
+    def height(self):
+        return self.data.shape[1 if self.planar else 0]
+
+    @property
+    def width(self):
+        return self.data.shape[2 if self.planar else 1]
+
+    @property
+    def shape(self):
+        """Shape of the RGBA pixels this stands for"""
+        return (self.height, self.width, 4)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def plane(self, c):
+        """(H, W) values of channel c, "R", "G", "B", "A" or "L". R, G and B of L layouts are
+        the grey plane, a missing alpha is None."""
+        if c not in ("R", "G", "B", "A", "L"):
+            raise ValueError("Not a channel: {}".format(c))
+        if c not in self.channels:
+            if c == "A":
+                return None
+            if c == "L":
+                raise ValueError("No grey plane in {} pixels".format(self.channels))
+            c = "L"
+        i = self.channels.index(c)
+        return self.data[i] if self.planar else self.data[..., i]
+
+    def rgba(self, out=None):
+        """Interleaved (H, W, 4) RGBA pixels, written into `out` when given"""
+        if out is None and self.channels == "RGBA" and not self.planar:
+            return self.data
+        xp = self.xp
+        if out is None:
+            out = xp.empty(self.shape, dtype=xp.float32)
+            trace.count("allocations")
+            trace.count("bytes allocated", out.nbytes)
+        if self.channels.startswith("L"):
+            out[..., :3] = self.plane("L")[..., None]
+        else:
+            for i, c in enumerate("RGB"):
+                out[..., i] = self.plane(c)
+        alpha = self.plane("A")
+        out[..., 3] = 1.0 if alpha is None else alpha
+        return out
+
+    def to_planar(self):
+        if self.planar:
+            return self
+        data = self.xp.ascontiguousarray(self.xp.moveaxis(self.data, -1, 0))
+        return ImageBuffer(data, self.channels, planar=True)
+
+    def to_interleaved(self):
+        if not self.planar:
+            return self
+        data = self.xp.ascontiguousarray(self.xp.moveaxis(self.data, 0, -1))
+        return ImageBuffer(data, self.channels, planar=False)
+
+    def to_host(self):
+        """The same pixels in host memory, only the channels there are cross the bus"""
+        if self.xp is np:
+            return self
+        return ImageBuffer(self.data.get(), self.channels, self.planar)
+
+    def copy(self):
+        return ImageBuffer(self.data.copy(), self.channels, self.planar)
+
+    def __array__(self, dtype=None, copy=None):
+        res = self.to_host().rgba()
+        return res if dtype is None else res.astype(dtype, copy=False)
+
+
+def empty_gray(shape, alpha=None, xp=np):
+    """Planar L buffer of (H, W) `shape` with the grey plane left to fill in, LA with a copy of
+    an alpha plane"""
+    channels = "L" if alpha is None else "LA"
+    data = xp.empty((len(channels),) + tuple(shape[:2]), dtype=xp.float32)
+    if alpha is not None:
+        data[1] = alpha
+    return ImageBuffer(data, channels, planar=True)
+
+
+def gray(value, alpha=None):
+    """Planar L buffer of an (H, W) plane, LA with an alpha plane"""
+    res = empty_gray(value.shape, alpha, get_array_module(value))
+    res.data[0] = value
+    return res
+
+
+def plane(pix, c):
+    """(H, W) channel c of RGBA pixels or of an ImageBuffer, a missing alpha as ones"""
+    if not isinstance(pix, ImageBuffer):
+        return pix[..., "RGBA".index(c)]
+    res = pix.plane(c)
+    if res is None:
+        xp = pix.xp
+        res = xp.ones((pix.height, pix.width), dtype=xp.float32)
+    return res
+
+
+def is_gray(pix):
+    return isinstance(pix, ImageBuffer) and pix.channels.startswith("L")
+
+
+def as_rgba(pix):
+    """(H, W, 4) interleaved pixels of an ImageBuffer, arrays are returned as they are"""
+    return pix.rgba() if isinstance(pix, ImageBuffer) else pix
@@ -0,0 +1,219 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Parallel CPU kernels for the numba backend, for the filters that are loops at heart.
+
+Each kernel is one pass over the pixels with rows split over the numba threads. Compiled
+kernels are cached on disk (in __pycache__ next to this file, or in the user cache
+directory when that isn't writable), so only the very first call after installing or
+changing them compiles.
+
+Importing this module imports numba, filters only do it from their numba implementations.
+Results match the numpy implementations exactly, except the bilateral which sums in
+float64 instead of float32.
+"""
+
+import math
+import os
+
+import numba
+import numpy as np
+
+# numba names cache files after the source file alone, and loading one imports the module
+# under the name it was compiled with. The add-on (<package>.core) and the batch runner
+# (core) import this file under different names, so each gets a cache directory of its own.
+_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", __name__)
+
+
+def _jit(fn):
+    saved = numba.config.CACHE_DIR
+    numba.config.CACHE_DIR = _CACHE_DIR
+    try:
+        return numba.njit(parallel=True, cache=True)(fn)
+    finally:
+        numba.config.CACHE_DIR = saved
+
+
+@_jit
+def _bilateral(padded, spatial, r, sigma_v, eps):
+    # padded wraps around by r on every side, so the window needs no index arithmetic
+    h, w, nc = padded.shape[0] - 2 * r, padded.shape[1] - 2 * r, padded.shape[2]
+    res = np.empty((h, w, nc), dtype=padded.dtype)
+    # the range weight in float32 like the numpy version, sums in float64
+    inv = np.float32(-0.5 / (sigma_v * sigma_v))
+    for y in numba.prange(h):
+        for x in range(w):
+            for c in range(nc):
+                v = padded[y + r, x + r, c]
+                num = np.float64(v) * eps
+                den = eps
+                for dy in range(2 * r + 1):
+                    for dx in range(2 * r + 1):
+                        o = padded[y + dy, x + dx, c]
+                        d = o - v
+                        tw = spatial[dy, dx] * math.exp(d * d * inv)
+                        num += o * tw
+                        den += tw
+                res[y, x, c] = num / den
+    return res
+
+
+def bilateral(img, sigma_s, sigma_v, eps=1e-8):
+    """Same as bilateral.exact()"""
+    from .bilateral import support
+
+    r = support(sigma_s)
+    d = np.arange(-r, r + 1)
+    spatial = np.exp(-0.5 * (d[:, None] ** 2 + d[None, :] ** 2) / sigma_s**2)
+    pix = img.reshape(img.shape[0], img.shape[1], -1).astype(np.float32, copy=False)
+    padded = np.pad(pix, ((r, r), (r, r), (0, 0)), mode="wrap")
+    return _bilateral(padded, spatial, r, float(sigma_v), eps).reshape(img.shape)
+
+
+@_jit
+def _rank_rows(a, size, offset, pick):
+    # a sorted copy of the window slides along each row, dropping the value that leaves and
+    # inserting the one that enters, O(size) per pixel for any pick
+    n, m, nc = a.shape
+    res = np.empty_like(a)
+    for i in numba.prange(n):
+        win = np.empty(size, dtype=a.dtype)
+        for c in range(nc):
+            for j in range(size):
+                win[j] = a[i, (j - offset) % m, c]
+            win.sort()
+            for x in range(m):
+                res[i, x, c] = win[pick]
+                if x == m - 1:
+                    break
+                old = a[i, (x - offset) % m, c]
+                new = a[i, (x - offset + size) % m, c]
+                k = np.searchsorted(win, old)
+                # shift towards the removed slot until the new value fits
+                while k > 0 and win[k - 1] > new:
+                    win[k] = win[k - 1]
+                    k -= 1
+                while k < size - 1 and win[k + 1] < new:
+                    win[k] = win[k + 1]
+                    k += 1
+                win[k] = new
+    return res
+
+
+def rank_filter(pix, size, offset, pick):
+    """Same as rank.rank_filter()"""
+    res = _rank_rows(np.ascontiguousarray(pix), size, offset, pick)
+    res = np.ascontiguousarray(np.swapaxes(res, 0, 1))
+    return np.ascontiguousarray(np.swapaxes(_rank_rows(res, size, offset, pick), 0, 1))
+
+
+@_jit
+def _gimpify_blend(image, imask, shift):
+    h, w, nc = image.shape
+    total = h * w * nc
+    flat = image.ravel()
+    res = np.empty(image.shape, dtype=np.float32)
+    one = np.float32(1.0)
+    for y in numba.prange(h):
+        for x in range(w):
+            m = imask[y, x]
+            for c in range(nc):
+                src = flat[((y * w + x) * nc + c - shift) % total]
+                res[y, x, c] = m * src + (one - m) * image[y, x, c]
+    return res
+
+
+def gimpify_blend(image, imask, shift):
+    """imask * roll(image, shift) + (1 - imask) * image"""
+    return _gimpify_blend(np.ascontiguousarray(image), imask, shift)
+
+
+@_jit
+def _grow(invalid):
+    h, w = invalid.shape
+    res = np.empty_like(invalid)
+    for y in numba.prange(h):
+        for x in range(w):
+            res[y, x] = (
+                invalid[(y - 1) % h, x]
+                or invalid[(y + 1) % h, x]
+                or invalid[y, (x - 1) % w]
+                or invalid[y, (x + 1) % w]
+            )
+    return res
+
+
+@_jit
+def _clear_border(mask):
+    mask[0, :] = False
+    mask[-1, :] = False
+    mask[:, 0] = False
+    mask[:, -1] = False
+
+
+@_jit
+def _fill(pixels, front, steps):
+    # in each direction every front pixel whose neighbour there is done copies it, one
+    # direction after the other like the numpy version
+    h, w, nc = pixels.shape
+    moved = np.empty_like(front)
+    for _ in range(steps):
+        for axis, d in ((0, 1), (0, -1), (1, 1), (1, -1)):
+            dy = d if axis == 0 else 0
+            dx = d if axis == 1 else 0
+            for y in numba.prange(h):
+                for x in range(w):
+                    ny, nx = (y + dy) % h, (x + dx) % w
+                    moved[y, x] = front[y, x] and not front[ny, nx]
+                    if moved[y, x]:
+                        for c in range(nc):
+                            pixels[y, x, c] = pixels[ny, nx, c]
+            for y in numba.prange(h):
+                for x in range(w):
+                    if moved[y, x]:
+                        front[y, x] = False
+
+
+@_jit
+def _smooth(pixels, invalid, steps):
+    h, w, nc = pixels.shape
+    five = pixels.dtype.type(5)
+    for _ in range(steps):
+        prev = pixels.copy()
+        for y in numba.prange(h):
+            for x in range(w):
+                if invalid[y, x]:
+                    for c in range(nc):
+                        pixels[y, x, c] = (
+                            prev[y, x, c]
+                            + prev[(y - 1) % h, x, c]
+                            + prev[(y + 1) % h, x, c]
+                            + prev[y, (x - 1) % w, c]
+                            + prev[y, (x + 1) % w, c]
+                        ) / five
+
+
+def inpaint_tangents(pixels, threshold):
+    """Same as filters.inpaint_tangents(), fills and returns pixels"""
+    invalid = pixels[:, :, 2] < threshold
+    for _ in range(2):
+        _clear_border(invalid)
+        invalid = _grow(invalid)
+
+    pixels[invalid] = np.array([0.5, 0.5, 1.0, 1.0])
+    _clear_border(invalid)
+
+    _fill(pixels, invalid.copy(), 4)
+    _smooth(pixels, invalid, 4)
+    return pixels
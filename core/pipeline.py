@@ -0,0 +1,229 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Filter chains: several operations run one after another on the same pixel array.
+
+A chain is written as space separated steps, `name:key=value,key=value`, where the names
+are the operator prefixes of the Image Editor panel and the parameters default to the
+operator properties:
+
+    hipass_balance:width=8 histogram_seamless height_to_normals normalize_tangents
+
+STEPS is where the operators get those from as well: each operator's property defaults
+are the step's (see default()) and operators without anything of their own to do run the
+step function as their payload (see payload()), so a chain step and the operator stay the
+same thing.
+
+The pixels stay on the device between steps (a step without a device implementation gets a
+host copy) and each intermediate is dropped as soon as the next step has returned, so a
+chain never holds more than the current step's input and output.
+"""
+
+import ast
+import time
+from collections import namedtuple
+
+from . import backend
+from . import filters
+from . import registry
+from . import trace
+
+Step = namedtuple("Step", "fn defaults")
+
+
+def _step(fn, **defaults):
+    return Step(fn, defaults)
+
+
+# operator prefix -> (function of pixels and parameters, default parameters)
+STEPS = {
+    "grayscale": _step(lambda pix: filters.grayscale(pix)),
+    "swizzle": _step(
+        lambda pix, order_a, order_b, direction: filters.swizzle(
+            pix, order_a, order_b, reverse=direction == "BTOA"
+        ),
+        order_a="RGBA",
+        order_b="RBGa",
+        direction="ATOB",
+    ),
+    "fractal": _step(
+        lambda pix, count, style: filters.fractal(pix, count, style), count=2, style="blend"
+    ),
+    "normalize": _step(lambda pix: filters.normalize(pix, save_alpha=True)),
+    "crop_to_power": _step(lambda pix: filters.crop_to_power(pix)),
+    "crop_to_square": _step(lambda pix: filters.crop_to_square(pix)),
+    "sharpen": _step(
+        lambda pix, width, intensity: filters.sharpen(pix, width, intensity), width=5, intensity=0.6
+    ),
+    "sobel": _step(
+        lambda pix: filters.normalize(filters.sobel(filters.grayscale(pix), 1.0), save_alpha=True)
+    ),
+    "fill_alpha": _step(lambda pix, style: filters.fill_alpha(pix, style=style), style="black"),
+    "gaussian_blur": _step(
+        lambda pix, width, method: filters.gaussian_repeat(pix, width, method=method),
+        width=2,
+        method="exact",
+    ),
+    "blob_median": _step(
+        lambda pix, width, style: filters.median_filter_blobs(pix, width, picked=style),
+        width=2,
+        style="start",
+    ),
+    "bilateral": _step(
+        lambda pix, sigma_a, sigma_b, method: filters.bilateral_filter(
+            pix, sigma_a, sigma_b, "", method=method
+        ),
+        sigma_a=3.0,
+        sigma_b=0.3,
+        method="exact",
+    ),
+    "high_pass": _step(
+        lambda pix, width, intensity: filters.hi_pass(pix, width, intensity), width=2, intensity=1.0
+    ),
+    "hipass_balance": _step(
+        lambda pix, width, zoom, method: filters.hi_pass_balance(pix, width, zoom, method=method),
+        width=2,
+        zoom=1000,
+        method="histogram",
+    ),
+    "contrast_balance": _step(
+        lambda pix, gA, gB, strength, method: filters.contrast_balance(
+            pix, gA, gB, strength, method=method
+        ),
+        gA=20,
+        gB=40,
+        strength=1.0,
+        method="exact",
+    ),
+    "histogram_eq": _step(
+        lambda pix, intensity: filters.hgram_equalize(pix, intensity, 0.5), intensity=1.0
+    ),
+    "gaussianize": _step(
+        lambda pix, count, method: filters.gaussianize(pix, NG=count, method=method)[0],
+        count=1000,
+        method="histogram",
+    ),
+    "gimp_seamless": _step(lambda pix: filters.gimpify(pix)),
+    "histogram_seamless": _step(
+        lambda pix, method: filters.histogram_seamless(pix, method=method), method="histogram"
+    ),
+    "height_to_normals": _step(lambda pix: filters.normals_simple(pix, "Luminance")),
+    "normals_to_curvature": _step(lambda pix: filters.normals_to_curvature(pix)),
+    "curvature_to_height": _step(
+        lambda pix, step, method, tolerance, iterations: filters.curvature_to_height(
+            pix, step, method=method, tol=tolerance, iterations=iterations
+        ),
+        step=0.1,
+        method="multigrid",
+        tolerance=1e-4,
+        iterations=100,
+    ),
+    "normals_to_height": _step(
+        lambda pix, method, tolerance, iterations: filters.normals_to_height(
+            pix, method=method, tol=tolerance, iterations=iterations
+        ),
+        method="multigrid",
+        tolerance=1e-4,
+        iterations=100,
+    ),
+    "delighting": _step(
+        lambda pix, flip, method, tolerance, iterations: filters.delight_simple(
+            pix, -1 if flip else 1, method=method, tol=tolerance, iterations=iterations
+        ),
+        flip=False,
+        method="multigrid",
+        tolerance=1e-4,
+        iterations=100,
+    ),
+    "inpaint_invalid": _step(
+        lambda pix, threshold: filters.inpaint_tangents(pix, threshold), threshold=0.5
+    ),
+    "normalize_tangents": _step(lambda pix: filters.normalize_tangents(pix)),
+    "image_to_material": _step(lambda pix: filters.image_to_material(pix)),
+}
+
+
+def default(name, param):
+    """Default value of a parameter of step `name`, for the operator property"""
+    return STEPS[name].defaults[param]
+
+
+def settings(name, props):
+    """Parameters of step `name` taken from an operator's property values"""
+    return {k: getattr(props, k) for k in STEPS[name].defaults}
+
+
+def payload(name):
+    """Operator payload running step `name` with the operator's property values"""
+    fn = STEPS[name].fn
+    return lambda self, image, context: fn(image, **settings(name, self))
+
+
+def parse_step(text):
+    """'name:key=value,...' -> (name, params), values are python literals or plain strings"""
+    name, _, args = text.partition(":")
+    name = name.strip()
+    if name not in STEPS:
+        raise ValueError("Unknown step: {} (known: {})".format(name, ", ".join(sorted(STEPS))))
+
+    params = dict(STEPS[name].defaults)
+    for item in filter(None, (a.strip() for a in args.split(","))):
+        key, sep, value = item.partition("=")
+        key = key.strip()
+        if not sep or key not in params:
+            raise ValueError("{}: unknown parameter '{}'".format(name, key))
+        try:
+            params[key] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            params[key] = value.strip()
+    return name, params
+
+
+def parse_chain(text):
+    """'step step:key=value ...' -> [(name, params), ...]"""
+    return [parse_step(s) for s in text.split()]
+
+
+def run(pix, chain):
+    """
+    Apply a parsed chain to (H, W, 4) pixels.
+
+    The pixels go to the fastest usable backend once, and each step then runs wherever its
+    filters are implemented (see core.registry). Returns the result and a list of
+    (step, seconds) for every step, and for the first copy to the device if there was one.
+    """
+    timings = []
+    t0 = time.perf_counter()
+    moved = registry.to_default(pix)
+    if moved is not pix:
+        backend.synchronize(moved)
+        timings.append(("to device", time.perf_counter() - t0))
+    pix = moved
+    del moved
+
+    for name, params in chain:
+        t0 = time.perf_counter()
+        with trace.span("step " + name) as s:
+            s.set(**params)
+            pix = STEPS[name].fn(pix, **params)
+            backend.synchronize(pix)
+        timings.append((name, time.perf_counter() - t0))
+    return pix, timings
+
+
+def format_timings(timings):
+    """'step 0.12s, step 0.50s, total 0.62s'"""
+    parts = ["{} {:.2f}s".format(name, secs) for name, secs in timings]
+    parts.append("total {:.2f}s".format(sum(secs for _, secs in timings)))
+    return ", ".join(parts)
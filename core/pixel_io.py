@@ -0,0 +1,103 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Pixel transfer between Blender images and float32 arrays.
+
+Blender's `image.pixels[:]` and `image.pixels = list` go through one Python float object
+per channel value. `foreach_get` and `foreach_set` accept any object implementing the
+buffer protocol and copy straight into/out of it, so we hand them flat views of
+preallocated float32 arrays instead.
+
+Anything that has `size` (width, height) and `pixels.foreach_get/foreach_set` works here,
+so the same code runs against mock images in the benchmarks.
+
+Results can also be layout.ImageBuffers, which become RGBA here, after leaving the device.
+"""
+
+from . import layout
+from . import trace
+from .backend import np
+
+
+def image_shape(image):
+    return (image.size[1], image.size[0], 4)
+
+
+def empty_like_image(image):
+    return np.empty(image_shape(image), dtype=np.float32)
+
+
+def read_pixels(image, out=None):
+    """Read image pixels into a (height, width, 4) float32 array, optionally into `out`"""
+    shape = image_shape(image)
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+        trace.count("allocations")
+        trace.count("bytes allocated", out.nbytes)
+    elif out.shape != shape or out.dtype != np.float32 or not out.flags.c_contiguous:
+        raise ValueError(
+            "Output buffer must be a C contiguous float32 array of shape {}".format(shape)
+        )
+
+    image.pixels.foreach_get(out.reshape(-1))
+    return out
+
+
+def to_host(pixels):
+    """Return a C contiguous float32 numpy array, copying only when needed"""
+    if isinstance(pixels, layout.ImageBuffer):
+        return to_host(pixels.to_host().rgba())
+    if not isinstance(pixels, np.ndarray) and hasattr(pixels, "get"):
+        # cupy.ndarray
+        pixels = pixels.get()
+    return np.ascontiguousarray(pixels, dtype=np.float32)
+
+
+def host_result(pixels):
+    """Result pixels in host memory, like to_host() but ImageBuffers keep their layout"""
+    if isinstance(pixels, layout.ImageBuffer):
+        return pixels.to_host()
+    return to_host(pixels)
+
+
+def _fits(scratch, shape, data):
+    return (
+        scratch is not None
+        and scratch.shape == shape
+        and scratch.dtype == np.float32
+        and scratch.flags.c_contiguous
+        and scratch.flags.writeable
+        and not np.may_share_memory(scratch, data)
+    )
+
+
+def write_pixels(image, pixels, scratch=None):
+    """
+    Write a (height, width, 4) array or an ImageBuffer into the image, which must already have
+    that size. The RGBA pixels of an ImageBuffer are built in `scratch`, when it is a host
+    array of that shape that can be overwritten (the buffer the source was read into, say).
+    """
+    shape = image_shape(image)
+    if tuple(pixels.shape) != shape:
+        raise ValueError(
+            "Pixel array shape {} does not match image shape {}".format(tuple(pixels.shape), shape)
+        )
+
+    if isinstance(pixels, layout.ImageBuffer):
+        pixels = pixels.to_host()
+        if _fits(scratch, shape, pixels.data):
+            pixels = pixels.rgba(out=scratch)
+    image.pixels.foreach_set(to_host(pixels).reshape(-1))
+    if hasattr(image, "update"):
+        image.update()
@@ -0,0 +1,343 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Periodic Poisson solver shared by the height reconstruction filters.
+
+Solves, on a wrap-around grid with unit spacing,
+
+    u = m * (avg4(u) - f / 4) + (1 - m) * c
+
+where avg4 is the mean of the four direct neighbours. With the mask m = 1 everywhere that is
+the 5-point Poisson equation sum4(u) - 4u = f. Where m = 0 the solution is pinned to the fill
+value c.
+
+With fill="max" the masked area follows the maximum of u, like the old delight iteration
+did. That iteration has no fixed point: it settles into u rising by a constant step d every
+sweep, which is the same as solving with f + 4d and the masked area held at the maximum. We
+solve for that state directly, with two masked solves and d picked so that max(u) = c = 0.
+
+Methods:
+    multigrid  -- full multigrid start, then V-cycles until the relative residual is below tol
+    fft        -- direct solve in frequency space, unmasked only (falls back to multigrid)
+    jacobi     -- plain Jacobi sweeps, kept as a reference
+
+The iterations take every temporary from a Workspace built for the solve, so after the full
+multigrid start a V-cycle (or a run of Jacobi sweeps) allocates nothing but a few scalars
+and the coarsest grid's FFT.
+"""
+
+from collections import namedtuple
+
+from . import trace
+from .backend import get_array_module, np
+from .workspace import Workspace
+
+METHODS = ("multigrid", "fft", "jacobi")
+
+SolveInfo = namedtuple("SolveInfo", ["method", "iterations", "residual"])
+
+# weighted Jacobi smoothing
+_OMEGA = 0.8
+_PRE_SMOOTH = 3
+_POST_SMOOTH = 3
+# Grids are halved while both sizes are even and above this. The coarsest grid is solved
+# directly with FFT if there is no mask, otherwise by plain iteration, so images that don't
+# halve down far (odd sizes, few factors of two) converge slower with a mask.
+_COARSEST = 8
+_COARSEST_SWEEPS = 60
+# a V-cycle that doesn't reduce the residual at least this much ends the iteration
+_STALL = 0.9
+# Jacobi checks the residual every this many sweeps
+_JACOBI_CHECK = 10
+
+
+def neighbour_sum(u, out):
+    """out = sum of the four wrap-around neighbours of u, out must not be u"""
+    out[:-1, :] = u[1:, :]
+    out[-1:, :] = u[:1, :]
+    out[1:, :] += u[:-1, :]
+    out[:1, :] += u[-1:, :]
+    out[:, :-1] += u[:, 1:]
+    out[:, -1:] += u[:, :1]
+    out[:, 1:] += u[:, :-1]
+    out[:, :1] += u[:, -1:]
+    return out
+
+
+class _Level:
+    """One grid of the hierarchy. `scale` is the (spacing / finest spacing) squared."""
+
+    def __init__(self, mask, scale, singular, ws):
+        self.xp = ws.xp
+        self.ws = ws
+        self.mask = mask
+        self.scale = scale
+        # without a mask the problem only defines u up to a constant
+        self.singular = singular
+        self.shape = mask.shape
+        # L(e) = (1 - m) e + m (e - avg4(e)) / scale
+        self.diag = (1.0 - mask) + mask / scale
+        self.off = mask / (4.0 * scale)
+        self.tmp = ws.get(self.shape, "tmp")
+        if scale > 1.0:
+            # The zero of a masked neighbour is at its center, half a finest cell past the
+            # edge on the finest grid but further out on a coarse one, which makes coarse
+            # corrections too large: with a wide masked area the V-cycles diverge. Take the
+            # neighbour as -c e instead, linear through zero where the finest grid has it.
+            c = (scale**0.5 - 1.0) / (scale**0.5 + 1.0)
+            masked = neighbour_sum(1.0 - mask, self.tmp)
+            self.diag += mask * masked * (c / (4.0 * scale))
+
+    def apply(self, e, out):
+        neighbour_sum(e, self.tmp)
+        self.tmp *= self.off
+        self.xp.multiply(self.diag, e, out=out)
+        out -= self.tmp
+        return out
+
+    def residual(self, e, rhs):
+        """rhs - L(e), in the level's residual buffer"""
+        out = self.apply(e, self.ws.get(self.shape, "residual"))
+        return self.xp.subtract(rhs, out, out=out)
+
+    def smooth(self, e, rhs, sweeps):
+        for _ in range(sweeps):
+            neighbour_sum(e, self.tmp)
+            self.tmp *= self.off
+            self.tmp += rhs
+            self.tmp /= self.diag
+            self.tmp -= e
+            self.tmp *= _OMEGA
+            e += self.tmp
+        return e
+
+
+def restrict(a, out=None):
+    """Average 2x2 cells, both sizes must be even"""
+    xp = get_array_module(a)
+    if out is None:
+        out = xp.empty((a.shape[0] // 2, a.shape[1] // 2), dtype=a.dtype)
+    xp.add(a[0::2, 0::2], a[1::2, 0::2], out=out)
+    out += a[0::2, 1::2]
+    out += a[1::2, 1::2]
+    out *= 0.25
+    return out
+
+
+def _prolong_axis(c, axis, out, q):
+    # fine cell 2k sits a quarter coarse cell off the center of coarse cell k towards k - 1,
+    # fine cell 2k + 1 towards k + 1
+    xp = get_array_module(c)
+    c, o, q = c.swapaxes(0, axis), out.swapaxes(0, axis), q.swapaxes(0, axis)
+    xp.multiply(c, 0.25, out=q)
+    even, odd = o[0::2], o[1::2]
+    xp.multiply(c, 0.75, out=even)
+    even[1:] += q[:-1]
+    even[:1] += q[-1:]
+    xp.multiply(c, 0.75, out=odd)
+    odd[:-1] += q[1:]
+    odd[-1:] += q[:1]
+    return out
+
+
+def prolong(c, shape, ws, out=None):
+    """Bilinear interpolation of a cell centered grid to twice the resolution"""
+    rows = ws.get((shape[0], c.shape[1]), "prolong rows")
+    _prolong_axis(c, 0, rows, ws.get(c.shape, "prolong tmp"))
+    out = ws.get(shape, "prolong") if out is None else out
+    return _prolong_axis(rows, 1, out, ws.get(rows.shape, "prolong tmp"))
+
+
+def _build_levels(mask, singular, ws):
+    levels = [_Level(mask, 1.0, singular, ws)]
+    while min(levels[-1].shape) > _COARSEST and all(n % 2 == 0 for n in levels[-1].shape):
+        m = restrict(levels[-1].mask)
+        levels.append(_Level(m, levels[-1].scale * 4.0, singular, ws))
+    return levels
+
+
+def _project(e, levels):
+    if levels[0].singular:
+        e -= e.mean()
+
+
+def _vcycle(levels, li, e, rhs):
+    lv = levels[li]
+    ws = lv.ws
+    if li == len(levels) - 1:
+        if levels[0].singular:
+            # L = (I - avg4) / scale here, which the FFT solves exactly
+            f = lv.xp.multiply(rhs, -4.0 * lv.scale, out=ws.get(lv.shape, "coarsest"))
+            e[...] = solve_fft(f)
+        else:
+            lv.smooth(e, rhs, _COARSEST_SWEEPS)
+        return e
+
+    lv.smooth(e, rhs, _PRE_SMOOTH)
+    coarse = levels[li + 1].shape
+    r = restrict(lv.residual(e, rhs), out=ws.get(coarse, "restricted"))
+    if levels[0].singular:
+        r -= r.mean()
+    ec = ws.zeros(coarse, "correction")
+    _vcycle(levels, li + 1, ec, r)
+    e += prolong(ec, lv.shape, ws)
+    lv.smooth(e, rhs, _POST_SMOOTH)
+    return e
+
+
+def _fmg(levels, rhs):
+    # restrict the right hand side all the way down, solve there and work back up
+    ws, xp = levels[0].ws, levels[0].xp
+    rhss = [rhs]
+    for lv in levels[1:]:
+        rhss.append(restrict(rhss[-1], out=ws.get(lv.shape, "fmg rhs")))
+    u = ws.zeros(levels[-1].shape, "fmg u")
+    _vcycle(levels, len(levels) - 1, u, rhss[-1])
+    for li in range(len(levels) - 2, -1, -1):
+        # the finest one is the solution, which outlives the workspace
+        shape = levels[li].shape
+        out = xp.empty(shape, dtype=xp.float32) if li == 0 else ws.get(shape, "fmg u")
+        u = prolong(u, shape, ws, out=out)
+        _vcycle(levels, li, u, rhss[li])
+    return u
+
+
+def _rms(a, ws):
+    sq = ws.xp.multiply(a, a, out=ws.get(a.shape, "square"))
+    return float(ws.xp.sqrt(ws.xp.mean(sq)))
+
+
+def _rhs(f, mask, fill):
+    xp = get_array_module(f)
+    rhs = f * -0.25
+    if mask is not None:
+        rhs *= mask
+        rhs += (1.0 - mask) * fill
+    return rhs.astype(xp.float32, copy=False)
+
+
+def solve_fft(f):
+    """Direct periodic solve of sum4(u) - 4u = f, zero mean solution"""
+    xp = get_array_module(f)
+    h, w = f.shape
+    ky = xp.cos(2.0 * np.pi * xp.arange(h) / h)[:, None]
+    kx = xp.cos(2.0 * np.pi * xp.fft.rfftfreq(w))[None, :]
+    eig = 2.0 * ky + 2.0 * kx - 4.0
+    eig[0, 0] = 1.0
+    fh = xp.fft.rfft2(f)
+    fh /= eig
+    fh[0, 0] = 0.0
+    return xp.fft.irfft2(fh, s=(h, w)).astype(xp.float32)
+
+
+def poisson_solve(
+    f, mask=None, fill=0.0, method="multigrid", tol=1e-4, max_iterations=100, u0=None
+):
+    """
+    Solve the masked periodic Poisson problem described in the module docstring.
+
+    `tol` is the RMS of the residual relative to the RMS of the right hand side. For multigrid
+    `max_iterations` counts V-cycles, for jacobi single sweeps. Returns (u, SolveInfo).
+    """
+    with trace.span("poisson_solve", method=method) as s:
+        ws = Workspace(get_array_module(f))
+        u, info = _solve(f, mask, fill, method, tol, max_iterations, u0, ws)
+        s.set(solver=info.method, iterations=info.iterations, residual=info.residual)
+    trace.count("solver iterations", info.iterations)
+    return u, info
+
+
+def _solve(f, mask, fill, method, tol, max_iterations, u0, ws):
+    xp = get_array_module(f)
+    f = f.astype(xp.float32, copy=False)
+    if mask is not None and float(xp.min(mask)) >= 1.0:
+        mask = None
+
+    if fill == "max":
+        w, info = _solve(f, mask, 0.0, method, tol, max_iterations, u0, ws)
+        if mask is None:
+            return w, info
+        # p is the response to a unit step d, and is negative wherever the mask isn't zero.
+        # Same grids, so this solve gets by with the buffers of the first.
+        p, pinfo = _solve(
+            xp.full(f.shape, 4.0, dtype=xp.float32),
+            mask,
+            0.0,
+            method,
+            tol,
+            max_iterations,
+            None,
+            ws,
+        )
+        # Where the mask is zero both are pinned to the fill, but an iterative solve only gets
+        # them there within its tolerance, and dividing by that leftover p would pick d from
+        # rounding noise. Only the unmasked cells set d, the masked ones are made exact.
+        sel = mask > 0.0
+        pinned = ~sel
+        p[pinned] = 0.0
+        w[pinned] = 0.0
+        d = xp.max(w[sel] / -p[sel]) if bool(xp.any(sel)) else 0.0
+        w += d * p
+        return w, SolveInfo(info.method, info.iterations + pinfo.iterations, info.residual)
+
+    if mask is None:
+        # only the zero mean part of f has a periodic solution
+        f = f - f.mean()
+    rhs = _rhs(f, mask, fill)
+    rhs_norm = max(_rms(rhs, ws), 1e-30)
+
+    if method == "fft" and mask is not None:
+        # no direct solve for the masked problem
+        method = "multigrid"
+
+    if method == "fft":
+        u = solve_fft(f)
+        lv = _Level(xp.ones(f.shape, dtype=xp.float32), 1.0, True, ws)
+        return u, SolveInfo("fft", 1, _rms(lv.residual(u, rhs), ws) / rhs_norm)
+
+    m = xp.ones(f.shape, dtype=xp.float32) if mask is None else mask.astype(xp.float32)
+    if u0 is not None:
+        u = u0.astype(xp.float32)
+
+    if method == "jacobi":
+        lv = _Level(m, 1.0, mask is None, ws)
+        if u0 is None:
+            u = xp.zeros(f.shape, dtype=xp.float32)
+        res = _rms(lv.residual(u, rhs), ws) / rhs_norm
+        it = 0
+        while it < max_iterations and res >= tol:
+            lv.smooth(u, rhs, _JACOBI_CHECK)
+            it += _JACOBI_CHECK
+            res = _rms(lv.residual(u, rhs), ws) / rhs_norm
+        _project(u, [lv])
+        return u, SolveInfo("jacobi", it, res)
+
+    if method != "multigrid":
+        raise ValueError("Unknown Poisson solver: {}".format(method))
+
+    levels = _build_levels(m, mask is None, ws)
+    if u0 is None:
+        u = _fmg(levels, rhs)
+
+    res = np.inf
+    it = 0
+    while True:
+        prev, res = res, _rms(levels[0].residual(u, rhs), ws) / rhs_norm
+        # also stop when float32 rounding keeps the residual from going down any further
+        if res < tol or it >= max_iterations or res > prev * _STALL:
+            break
+        _vcycle(levels, 0, u, rhs)
+        it += 1
+    _project(u, levels)
+    return u, SolveInfo("multigrid", it, res)
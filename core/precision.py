@@ -0,0 +1,117 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Precision policy of the filters.
+
+Pixels are float32 from read to write. Filters allocate float32, and what comes out of a
+registry op or an operator payload is held to that: a float64 image is converted back and
+counted as "float64 results" in the trace. With debug on each one is also reported with a
+PrecisionWarning naming the op, once per op, to find where float64 crept in.
+
+Storage precision is for what is kept between runs, the result cache and the stage memo:
+
+    float32  as computed (default)
+    float16  image sized arrays are kept at half precision, half the memory, about three
+             significant digits. They come back as float32, filters never compute in it.
+
+Small arrays (kernels, histogram knots, quantile tables) are left as they are, they need
+the precision and take no room.
+"""
+
+import warnings
+
+from . import layout
+from . import trace
+from .backend import np
+
+STORAGE = ("float32", "float16")
+
+_debug = False
+_storage = "float32"
+_reported = set()
+
+
+class PrecisionWarning(UserWarning):
+    pass
+
+
+def configure(debug=None, storage=None):
+    global _debug, _storage
+    if debug is not None:
+        _debug = bool(debug)
+    if storage is not None:
+        if storage not in STORAGE:
+            raise ValueError("Unknown storage precision: {}".format(storage))
+        _storage = storage
+
+
+def debug():
+    return _debug
+
+
+def storage():
+    return _storage
+
+
+def _image(a):
+    # arrays of pixels or planes, not tables
+    return getattr(a, "ndim", 0) >= 2 and getattr(a, "dtype", None) is not None
+
+
+def enforce(name, res):
+    """res with float64 images converted to float32, reported as the result of `name`"""
+    if isinstance(res, tuple):
+        return tuple(enforce(name, r) for r in res)
+    if isinstance(res, layout.ImageBuffer):
+        data = enforce(name, res.data)
+        return res if data is res.data else layout.ImageBuffer(data, res.channels, res.planar)
+    if not _image(res) or res.dtype != np.float64:
+        return res
+
+    trace.count("float64 results")
+    if _debug and name not in _reported:
+        _reported.add(name)
+        warnings.warn("{}: float64 result, converted to float32".format(name), PrecisionWarning)
+    return res.astype(np.float32)
+
+
+def reported():
+    """Names of the ops reported in debug mode so far"""
+    return sorted(_reported)
+
+
+def store(value):
+    """value as the caches keep it, at the storage precision"""
+    if _storage == "float32":
+        return value
+    if isinstance(value, (tuple, list)):
+        return type(value)(store(v) for v in value)
+    if isinstance(value, layout.ImageBuffer):
+        return layout.ImageBuffer(store(value.data), value.channels, value.planar)
+    if _image(value) and value.dtype == np.float32:
+        return value.astype(np.float16)
+    return value
+
+
+def load(value):
+    """A value kept by store(), back at float32"""
+    if isinstance(value, (tuple, list)):
+        return type(value)(load(v) for v in value)
+    if isinstance(value, layout.ImageBuffer):
+        if value.dtype != np.float16:
+            return value
+        return layout.ImageBuffer(load(value.data), value.channels, value.planar)
+    if _image(value) and value.dtype == np.float16:
+        return value.astype(np.float32)
+    return value
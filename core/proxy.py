@@ -0,0 +1,87 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Reduced resolution proxies of a source image, for quick previews.
+
+Levels are made by averaging 2x2 blocks, so a 1/4 proxy is two halvings of the source. The
+pyramids of the last few sources are kept, keyed on the source hash, so tweaking settings
+only pays for the halvings once. Parameters measured in pixels are divided by the same
+factor to get about the same look on the proxy.
+"""
+
+import threading
+from collections import OrderedDict
+
+from . import layout
+from .backend import np
+
+# pyramids kept, one per source image
+_KEEP = 4
+
+_pyramids = OrderedDict()
+# previews and their refines run on different threads
+_lock = threading.RLock()
+
+
+def halve(pix):
+    """Average 2x2 blocks, an odd last row or column is dropped"""
+    h, w = pix.shape[0] // 2 * 2, pix.shape[1] // 2 * 2
+    p = pix[:h, :w]
+    return ((p[0::2, 0::2] + p[1::2, 0::2]) + (p[0::2, 1::2] + p[1::2, 1::2])) * 0.25
+
+
+def level(pix, factor, key=None):
+    """pix reduced `factor` times (a power of two), cached per key when one is given"""
+    steps = max(0, int(factor).bit_length() - 1)
+    if steps == 0:
+        return pix
+
+    # only the reduced levels are kept, the caller has the source anyway
+    with _lock:
+        reduced = list(_pyramids.get(key, [])) if key is not None else []
+    while len(reduced) < steps:
+        prev = reduced[-1] if reduced else pix
+        if min(prev.shape[:2]) < 2:
+            break
+        reduced.append(halve(prev))
+
+    if key is not None:
+        with _lock:
+            _pyramids[key] = reduced
+            _pyramids.move_to_end(key)
+            while len(_pyramids) > _KEEP:
+                _pyramids.popitem(last=False)
+    return reduced[min(steps, len(reduced)) - 1] if reduced else pix
+
+
+def upsample(pix, shape):
+    """Nearest neighbour resize of (h, w, c) pixels to shape[:2]"""
+    pix = layout.as_rgba(pix)
+    ys = np.arange(shape[0]) * pix.shape[0] // shape[0]
+    xs = np.arange(shape[1]) * pix.shape[1] // shape[1]
+    return pix[ys[:, None], xs[None, :]]
+
+
+def scale_params(params, spatial, factor):
+    """params with the ones named in `spatial` divided by factor, ints stay ints of at least 1"""
+    res = dict(params)
+    for name in spatial:
+        value = params[name] / factor
+        res[name] = max(1, int(round(value))) if isinstance(params[name], int) else value
+    return res
+
+
+def clear():
+    with _lock:
+        _pyramids.clear()
@@ -0,0 +1,140 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Sliding window rank (min / median / max) filters with wrap-around edges.
+
+A window of `size` values starting `offset` before each pixel is ranked and the value at
+`pick` (0 = smallest) kept. Everything is vectorized over whole rows at once:
+
+    pick 0 or size-1  -- running min / max from doubling windows, log2(size) passes
+    size <= 20        -- selection network: Batcher's odd-even merge sort, cut down to the
+                         comparators that reach `pick`, applied to shifted views of the rows
+    larger            -- np.partition over contiguous copies of the windows
+
+The last two work on row chunks so the temporaries stay around _CHUNK_BYTES. All of them are
+exact for float data, nothing is quantized.
+"""
+
+import functools
+
+from .backend import get_array_module
+
+# memory for the per chunk temporaries
+_CHUNK_BYTES = 64 * 2 ** 20
+
+# above this the comparator count of the network grows past what partition costs
+_NETWORK_MAX = 20
+
+
+def _wrapped(a, size, offset):
+    """a along axis 0 extended so that row i + j is a[(i - offset + j) % n], j < size"""
+    xp = get_array_module(a)
+    n = a.shape[0]
+    return a[xp.arange(-offset, n - offset + size - 1) % n]
+
+
+@functools.lru_cache(maxsize=None)
+def merge_sort_network(size):
+    """Comparators (i, j), i < j, of Batcher's odd-even merge sort for `size` wires"""
+    n = 1
+    while n < size:
+        n *= 2
+
+    comparators = []
+    p = 1
+    while p < n:
+        k = p
+        while k >= 1:
+            for j in range(k % p, n - k, 2 * k):
+                for i in range(min(k, n - j - k)):
+                    if (i + j) // (2 * p) == (i + j + k) // (2 * p):
+                        comparators.append((i + j, i + j + k))
+            k //= 2
+        p *= 2
+
+    # the missing wires would hold +inf, which never moves, so their comparators do nothing
+    return tuple((i, j) for i, j in comparators if j < size)
+
+
+@functools.lru_cache(maxsize=None)
+def selection_network(size, pick):
+    """The comparators of merge_sort_network(size) that wire `pick` depends on"""
+    needed = {pick}
+    kept = []
+    for i, j in reversed(merge_sort_network(size)):
+        if i in needed or j in needed:
+            kept.append((i, j))
+            needed.update((i, j))
+    return tuple(reversed(kept))
+
+
+def extreme_axis0(a, size, offset, largest=False):
+    """Running min (or max) over `size` rows along axis 0"""
+    xp = get_array_module(a)
+    op = xp.maximum if largest else xp.minimum
+    n = a.shape[0]
+    m = _wrapped(a, size, offset)
+
+    # m[i] holds the extreme of `p` rows starting at i, double p while it fits in the window
+    p = 1
+    while 2 * p <= size:
+        m = op(m[:-p], m[p:])
+        p *= 2
+
+    # two overlapping windows of p rows cover the whole window
+    return op(m[:n], m[size - p : size - p + n])
+
+
+def _select_rows(padded, r0, r1, size, pick):
+    xp = get_array_module(padded)
+    lanes = [padded[r0 + j : r1 + j] for j in range(size)]
+    for i, j in selection_network(size, pick):
+        lanes[i], lanes[j] = xp.minimum(lanes[i], lanes[j]), xp.maximum(lanes[i], lanes[j])
+    return lanes[pick]
+
+
+def _partition_rows(padded, r0, r1, size, pick):
+    xp = get_array_module(padded)
+    windows = xp.lib.stride_tricks.sliding_window_view(padded[r0 : r1 + size - 1], size, axis=0)
+    # partitioning along a strided axis is several times slower than copying first
+    windows = xp.ascontiguousarray(windows)
+    windows.partition(pick, axis=-1)
+    return windows[..., pick]
+
+
+def rank_axis0(a, size, offset, pick):
+    """Value at position `pick` of the sorted `size` rows around each row, along axis 0"""
+    if pick == 0 or pick == size - 1:
+        return extreme_axis0(a, size, offset, largest=pick == size - 1)
+
+    xp = get_array_module(a)
+    n = a.shape[0]
+    padded = _wrapped(a, size, offset)
+    out = xp.empty_like(a)
+    rows = _select_rows if size <= _NETWORK_MAX else _partition_rows
+
+    step = max(1, _CHUNK_BYTES // max(1, a[0].nbytes * size))
+    for r in range(0, n, step):
+        r1 = min(n, r + step)
+        out[r:r1] = rows(padded, r, r1, size, pick)
+    return out
+
+
+def rank_filter(pix, size, offset, pick):
+    """Separable rank filter: along x first, then along y"""
+    xp = get_array_module(pix)
+    res = xp.ascontiguousarray(xp.swapaxes(pix, 0, 1))
+    res = rank_axis0(res, size, offset, pick)
+    res = xp.ascontiguousarray(xp.swapaxes(res, 0, 1))
+    return rank_axis0(res, size, offset, pick)
@@ -0,0 +1,226 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compute backends, and the filter implementations registered for each of them.
+
+Backends, fastest first:
+    cupy   -- CUDA arrays, needs cupy and a GPU
+    numba  -- parallel CPU kernels compiled with numba, on numpy arrays
+    numpy  -- always there
+
+A filter is an Op with one implementation per backend it supports. Most filters are written
+against the array module of their input, so the same function serves cupy and numpy. Calling
+the op picks the fastest backend that has an implementation, is enabled and is available,
+moves the pixels (the first argument) there and runs it. Backends are only imported when an
+op first asks for them.
+
+Pixels are given to ops as (H, W, 4) RGBA arrays. Ops made with op(compact=True) take
+layout.ImageBuffers as they are, so a gray result goes on through them as one plane and
+only becomes RGBA at the first op that needs four channels, or when it's written.
+
+Backends can be turned off (the add-on preferences do that, the batch workers keep off the
+GPU), and `using()` restricts them for a block, to run or compare the CPU paths on a
+machine with a GPU.
+"""
+
+import contextlib
+import functools
+import importlib
+import importlib.util
+
+from . import backend
+from . import layout
+from . import precision
+from . import trace
+from .backend import np
+
+ORDER = ("cupy", "numba", "numpy")
+
+# implementations written against get_array_module(input)
+ARRAY = ("cupy", "numpy")
+
+
+def _load_cupy():
+    # Backend caches the outcome, so trying again here only happens after a reset
+    cupy = backend.load_cupy(retry=True)
+    try:
+        return cupy if cupy is not None and cupy.cuda.runtime.getDeviceCount() > 0 else None
+    except Exception:
+        return None
+
+
+def _load_numba():
+    if importlib.util.find_spec("numba") is None:
+        return None
+    try:
+        return importlib.import_module("numba")
+    except Exception:
+        return None
+
+
+class Backend:
+    def __init__(self, name, load, xp):
+        self.name = name
+        self._load = load
+        self._xp = xp
+        self._module = None
+        self.enabled = True
+
+    @property
+    def module(self):
+        """The backing library, None if it can't be loaded. Only tried once until reset"""
+        if self._module is None:
+            self._module = self._load() or False
+        return self._module or None
+
+    @property
+    def available(self):
+        return self.module is not None
+
+    @property
+    def xp(self):
+        """Array module of the arrays this backend works on"""
+        return self._xp() if callable(self._xp) else self._xp
+
+    def asarray(self, a, compact=False):
+        """a on this backend, ImageBuffers as RGBA unless compact"""
+        if isinstance(a, layout.ImageBuffer):
+            # move only the channels there are
+            a = layout.ImageBuffer(self.asarray(a.data), a.channels, a.planar)
+            return a if compact else a.rgba()
+        xp = self.xp
+        if backend.get_array_module(a) is xp:
+            return a
+        trace.count("bytes moved", a.nbytes)
+        if xp is np:
+            return a.get()
+        return xp.asarray(a)
+
+    def reset(self):
+        self._module = None
+
+
+BACKENDS = {
+    "cupy": Backend("cupy", _load_cupy, lambda: BACKENDS["cupy"].module),
+    "numba": Backend("numba", _load_numba, np),
+    "numpy": Backend("numpy", lambda: np, np),
+}
+
+
+def enable(name, on=True):
+    BACKENDS[name].enabled = on
+    if on:
+        # it may have been installed since the last try
+        BACKENDS[name].reset()
+
+
+def usable(name):
+    b = BACKENDS[name]
+    return b.enabled and b.available
+
+
+@contextlib.contextmanager
+def using(*names):
+    """Only the given backends (numpy always stays) inside the block"""
+    saved = {n: b.enabled for n, b in BACKENDS.items()}
+    for n, b in BACKENDS.items():
+        b.enabled = saved[n] and (n in names or n == "numpy")
+    try:
+        yield
+    finally:
+        for n, b in BACKENDS.items():
+            b.enabled = saved[n]
+
+
+def default_backend():
+    """The fastest usable backend for array code"""
+    for name in ORDER:
+        if name in ARRAY and usable(name):
+            return BACKENDS[name]
+    return BACKENDS["numpy"]
+
+
+def to_default(a):
+    """a on the fastest usable array backend, where ops without a preference should start"""
+    return default_backend().asarray(a)
+
+
+class Op:
+    """A filter with implementations per backend, called like the plain function"""
+
+    def __init__(self, name, compact=False):
+        self.name = name
+        self.impls = {}
+        # takes layout.ImageBuffers, not just RGBA arrays
+        self.compact = compact
+
+    def register(self, fn, backends):
+        for name in backends:
+            if name not in BACKENDS:
+                raise ValueError("Unknown backend: {}".format(name))
+            self.impls[name] = fn
+
+    def implementation(self, *backends):
+        """Decorator adding an implementation for the given backends"""
+
+        def _wrap(fn):
+            self.register(fn, backends)
+            return fn
+
+        return _wrap
+
+    def resolve(self):
+        """(backend, implementation) the op runs with right now"""
+        for name in ORDER:
+            if name in self.impls and usable(name):
+                return BACKENDS[name], self.impls[name]
+        raise RuntimeError("{}: no usable backend in {}".format(self.name, sorted(self.impls)))
+
+    def __call__(self, pix, *args, **kwargs):
+        b, fn = self.resolve()
+        with trace.span(self.name, backend=b.name):
+            pix = b.asarray(pix, compact=self.compact)
+            res = precision.enforce(self.name, fn(pix, *args, **kwargs))
+            if res is not pix:
+                trace.count("allocations")
+                trace.count("bytes allocated", getattr(res, "nbytes", 0))
+        return res
+
+
+OPS = {}
+
+
+def op(*backends, compact=False):
+    """Decorator turning a function into an Op implemented by it on the given backends. A
+    compact op takes layout.ImageBuffers as well as RGBA arrays"""
+    backends = backends or ARRAY
+
+    def _wrap(fn):
+        o = OPS.get(fn.__name__) or Op(fn.__name__, compact)
+        o.register(fn, backends)
+        functools.update_wrapper(o, fn)
+        OPS[fn.__name__] = o
+        return o
+
+    return _wrap
+
+
+def describe():
+    """'name: available/unavailable/off' for every backend, fastest first"""
+    lines = []
+    for name in ORDER:
+        b = BACKENDS[name]
+        state = "off" if not b.enabled else ("available" if b.available else "not available")
+        lines.append("{}: {}".format(name, state))
+    return lines
@@ -0,0 +1,154 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Filters split into stages, so a parameter change only recomputes what depends on it.
+
+A Graph is a list of stages in evaluation order, the last one being the result. Each stage
+names the earlier stages (or "source") it reads and the parameters it uses. Its key is built
+from the source key, its parameter values and the keys of its inputs, so changing one
+parameter changes the keys of the stages that use it and of everything downstream, and
+nothing else. Running the graph with a Memo starts from the result and only computes stages
+whose key isn't in the memo, inputs first.
+
+Stage functions must not modify their inputs, those may be memoized and reused. With float16
+storage (see precision) memoized values are kept at half precision, stages whose rounding
+later steps would amplify are marked exact and kept as computed.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from . import precision
+from . import trace
+
+Stage = namedtuple("Stage", "name fn inputs params exact")
+
+
+def stage(name, fn, inputs=("source",), params=(), exact=False):
+    """fn(*inputs, **params) -> value"""
+    return Stage(name, fn, tuple(inputs), tuple(params), exact)
+
+
+def _nbytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return getattr(value, "nbytes", 0)
+
+
+class Graph:
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = OrderedDict((s.name, s) for s in stages)
+        self.output = stages[-1].name
+        self.params = tuple(OrderedDict.fromkeys(p for s in stages for p in s.params))
+
+    def keys(self, source_key, params):
+        """Memo key of every stage"""
+        keys = {"source": source_key}
+        for s in self.stages.values():
+            text = repr(
+                (self.name, s.name, [keys[i] for i in s.inputs], [(p, params[p]) for p in s.params])
+            )
+            keys[s.name] = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return keys
+
+    def run(self, source, memo=None, source_key=None, **params):
+        """Value of the last stage. Without a memo or source key every stage runs once"""
+        missing = set(self.params) - set(params)
+        if missing:
+            raise TypeError("{}: missing parameters {}".format(self.name, sorted(missing)))
+
+        keys = self.keys(source_key, params) if memo is not None and source_key else None
+        values = {"source": source}
+
+        def _value(name):
+            if name in values:
+                return values[name]
+            s = self.stages[name]
+            value = memo.get(keys[name]) if keys else None
+            if value is None:
+                args = [_value(i) for i in s.inputs]
+                with trace.span("{}.{}".format(self.name, name)):
+                    value = s.fn(*args, **{p: params[p] for p in s.params})
+                if keys:
+                    memo.put(keys[name], value, exact=s.exact)
+            else:
+                trace.count("stages reused")
+            values[name] = value
+            return value
+
+        return _value(self.output)
+
+
+class Memo:
+    """LRU of stage values with a byte budget, safe to share with a background thread. Values
+    are kept at the storage precision, see precision"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    @property
+    def nbytes(self):
+        return sum(_nbytes(v) for v in self.values.values())
+
+    def get(self, key):
+        with self.lock:
+            if key in self.values:
+                self.values.move_to_end(key)
+                self.hits += 1
+                return precision.load(self.values[key])
+            self.misses += 1
+            return None
+
+    def put(self, key, value, exact=False):
+        with self.lock:
+            self.values[key] = value if exact else precision.store(value)
+            self.values.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            size = self.nbytes
+            while self.values and size > self.budget:
+                _, old = self.values.popitem(last=False)
+                size -= _nbytes(old)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.hits = self.misses = 0
+
+
+_shared = None
+
+
+def shared_memo(budget):
+    """The process wide memo, created or resized to this budget"""
+    global _shared
+    if _shared is None:
+        _shared = Memo(budget)
+    elif _shared.budget != budget:
+        _shared.budget = budget
+        _shared.evict()
+    return _shared
+
+
+def current():
+    """The process wide memo if it has been created, for showing its counters"""
+    return _shared
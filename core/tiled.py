@@ -0,0 +1,94 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Tiled, out-of-core filtering.
+
+Images too big to process in one piece live in memory-mapped float32 files, and the filter
+only ever sees one tile at a time. Each tile is cut out with `halo` extra pixels on every
+side, wrapping around the image edges, so a filter that only looks `halo` pixels away
+produces the same tile centers as it would for the full image. The halos are thrown away
+when the tile is stitched back.
+
+Convolutions run directly while tiling, since FFT results depend on the transform size. The
+full image still picks FFT for wide kernels, so tiles match it up to float rounding, not bit
+for bit. Measured on 512 pixel textures in 128 pixel tiles:
+
+    exact kernels (gaussian, sharpen)   < 1e-6
+    stacked box blurs                   < 5e-6
+    recursive blur                      2e-4 at width 10, 2e-3 at width 40
+
+The recursive blur starts each pass from a warm-up estimate, and that start-up error differs
+between a tile and the full image. A wider halo doesn't reduce it.
+
+Filters that look at the whole image (min/max normalization, histograms, solvers) can't be
+tiled this way.
+"""
+
+import contextlib
+import os
+import tempfile
+
+from .backend import np
+
+from . import convolve
+from .pixel_io import to_host
+
+
+def tile_ranges(n, size):
+    return [(i, min(i + size, n)) for i in range(0, n, size)]
+
+
+@contextlib.contextmanager
+def backing_store(shape, directory=None):
+    """A zeroed float32 np.memmap of the given shape, deleted on exit"""
+    fd, path = tempfile.mkstemp(suffix=".f32", dir=directory)
+    os.close(fd)
+    try:
+        mm = np.memmap(path, dtype=np.float32, mode="w+", shape=shape)
+        try:
+            yield mm
+        finally:
+            mm.flush()
+            del mm
+    finally:
+        os.remove(path)
+
+
+def read_tile(src, y0, y1, x0, x1, halo):
+    h, w = src.shape[0], src.shape[1]
+    rows = np.arange(y0 - halo, y1 + halo) % h
+    cols = np.arange(x0 - halo, x1 + halo) % w
+    return src[rows[:, None], cols[None, :]]
+
+
+def run_tiled(src, fn, halo, tile_size=1024, out=None):
+    """
+    out = fn(src), evaluated tile by tile. fn must return an array with the same shape as
+    its input. `out` can be a memmap, otherwise a new array is returned.
+    """
+    if out is None:
+        out = np.empty(src.shape, dtype=np.float32)
+    halo = int(halo)
+
+    for y0, y1 in tile_ranges(src.shape[0], tile_size):
+        for x0, x1 in tile_ranges(src.shape[1], tile_size):
+            tile = read_tile(src, y0, y1, x0, x1, halo)
+            with convolve.forced_method("direct"):
+                res = fn(tile)
+            if res.shape != tile.shape:
+                raise ValueError("Tiled filters can't change the image size")
+            res = to_host(res)
+            out[y0:y1, x0:x1] = res[halo : halo + y1 - y0, halo : halo + x1 - x0]
+
+    return out
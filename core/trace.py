@@ -0,0 +1,283 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Where the time goes: nested named spans, counters and peak memory of operator runs.
+
+Off by default. While off, span() hands back one shared do-nothing object and count()
+returns straight away, so the calls can stay in hot paths. enable() starts recording into
+a process wide Recorder, which collects spans from every thread until disable():
+
+    trace.enable(memory=True)
+    with trace.span("blur", width=20) as s:
+        ...
+        trace.count("bytes allocated", out.nbytes)
+        s.set(method="box")
+    trace.current().save_chrome_trace("run.json")
+
+With memory on, tracemalloc runs while recording and every span notes the peak host
+memory allocated inside it (numpy reports its arrays to tracemalloc), and the peak of the
+cupy memory pool when cupy is in use. tracemalloc slows allocations down noticeably, so
+it's a separate switch.
+
+Recordings export as plain JSON (spans, per name totals, counters, peaks) and as Chrome
+trace events, for chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from . import backend
+
+# recordings stop taking spans beyond this many, a session left on shouldn't eat the memory
+MAX_EVENTS = 200000
+
+
+class _Null:
+    """span() while not recording"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL = _Null()
+_recorder = None
+
+
+class _Span:
+    __slots__ = ("rec", "name", "args", "start", "peak", "device")
+
+    def __init__(self, rec, name, args):
+        self.rec = rec
+        self.name = name
+        self.args = args
+        self.peak = self.device = 0
+
+    def set(self, **args):
+        """Add arguments to the span, results only known at the end (iterations, sizes)"""
+        self.args.update(args)
+
+    def __enter__(self):
+        stack = self.rec._stack()
+        if self.rec.memory:
+            # each span keeps its own peak, folded into the enclosing one when it ends
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        rec = self.rec
+        stack = rec._stack()
+        stack.pop()
+        if rec.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            self.device = backend.device_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            rec.peak_host = max(rec.peak_host, self.peak)
+            rec.peak_device = max(rec.peak_device, self.device)
+        rec._add(self, end, len(stack))
+        return False
+
+
+class Recorder:
+    """Spans and counters of one recording"""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        # (name, start ns, duration ns, thread id, depth, args, host peak, device peak)
+        self.events = []
+        # (name, time ns, total so far) for every count(), for the counter tracks
+        self.samples = []
+        self.counters = {}
+        self.dropped = 0
+        self.peak_host = 0
+        self.peak_device = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add(self, s, end, depth):
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped += 1
+            return
+        self.events.append(
+            (
+                s.name,
+                s.start - self.origin,
+                end - s.start,
+                threading.get_ident(),
+                depth,
+                s.args,
+                s.peak,
+                s.device,
+            )
+        )
+
+    def count(self, name, value):
+        with self.lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+            if len(self.samples) < MAX_EVENTS:
+                self.samples.append((name, time.perf_counter_ns() - self.origin, total))
+
+    def totals(self):
+        """{name: {"calls", "seconds", "max_seconds"}}, slowest first"""
+        res = {}
+        for name, _, dur, *_ in self.events:
+            t = res.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            t["calls"] += 1
+            t["seconds"] += dur / 1e9
+            t["max_seconds"] = max(t["max_seconds"], dur / 1e9)
+        return dict(sorted(res.items(), key=lambda kv: -kv[1]["seconds"]))
+
+    def summary(self, lines=10):
+        """The slowest span names, a line each, with the counters and peaks after them"""
+        out = []
+        for name, t in list(self.totals().items())[:lines]:
+            out.append("{:>8.3f}s {:>6}x  {}".format(t["seconds"], t["calls"], name))
+        for name, value in sorted(self.counters.items()):
+            out.append("{}: {}".format(name, value))
+        if self.memory:
+            out.append(
+                "peak memory: host {:.1f} MB, device {:.1f} MB".format(
+                    self.peak_host / 2**20, self.peak_device / 2**20
+                )
+            )
+        return "\n".join(out)
+
+    def to_dict(self):
+        threads = {}
+        spans = []
+        for name, start, dur, tid, depth, args, peak, device in self.events:
+            span = {
+                "name": name,
+                "start": start / 1e9,
+                "seconds": dur / 1e9,
+                "thread": threads.setdefault(tid, len(threads)),
+                "depth": depth,
+            }
+            if args:
+                span["args"] = args
+            if self.memory:
+                span["peak_host_bytes"] = peak
+                span["peak_device_bytes"] = device
+            spans.append(span)
+        res = {
+            "spans": spans,
+            "totals": self.totals(),
+            "counters": dict(self.counters),
+            "dropped_spans": self.dropped,
+        }
+        if self.memory:
+            res["peak_host_bytes"] = self.peak_host
+            res["peak_device_bytes"] = self.peak_device
+        return res
+
+    def to_chrome_trace(self):
+        """Trace event format, complete events for spans and counter events for counters"""
+        events = []
+        for name, start, dur, tid, depth, args, peak, device in self.events:
+            e = {
+                "name": name,
+                "cat": "span",
+                "ph": "X",
+                "ts": start / 1e3,
+                "dur": dur / 1e3,
+                "pid": self.pid,
+                "tid": tid,
+            }
+            args = dict(args)
+            if self.memory:
+                args["peak_host_bytes"] = peak
+                args["peak_device_bytes"] = device
+            if args:
+                e["args"] = args
+            events.append(e)
+        for name, ts, total in self.samples:
+            events.append(
+                {"name": name, "ph": "C", "ts": ts / 1e3, "pid": self.pid, "args": {name: total}}
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1, default=str)
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+
+def enable(memory=False):
+    """Start recording, the Recorder. Keeps an ongoing recording if there is one"""
+    global _recorder
+    if _recorder is None:
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _recorder = Recorder(memory)
+    return _recorder
+
+
+def disable():
+    """Stop recording, the finished Recorder or None"""
+    global _recorder
+    rec, _recorder = _recorder, None
+    if rec is not None and rec.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return rec
+
+
+def enabled():
+    return _recorder is not None
+
+
+def current():
+    """The ongoing recording, None when off"""
+    return _recorder
+
+
+def span(name, **args):
+    """Context manager timing the block as name, nested in the enclosing span of the thread"""
+    if _recorder is None:
+        return _NULL
+    return _Span(_recorder, name, args)
+
+
+def count(name, value=1):
+    """Add value to the counter name"""
+    if _recorder is None:
+        return
+    _recorder.count(name, value)
@@ -0,0 +1,71 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Scratch buffers for iterative loops, allocated once and handed out again on every pass.
+
+A Workspace keeps one array per (name, shape, dtype). The first get() allocates it, later
+ones return the same array with whatever it held, so a loop that takes its temporaries from
+a workspace and writes them with out= and in place operators allocates nothing after its
+first pass. Names tell apart buffers of one shape that are live at the same time, a pair of
+them makes ping-pong buffers:
+
+    ws = Workspace(xp)
+    a, b = ws.pair(shape, "u")
+    for _ in range(n):
+        step(a, out=b)
+        a, b = b, a
+
+Buffers belong to whoever holds the workspace and stay valid for as long as it does, don't
+share one between threads.
+"""
+
+from . import trace
+from .backend import np
+
+
+class Workspace:
+    def __init__(self, xp=np, dtype=np.float32):
+        self.xp = xp
+        self.dtype = dtype
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, shape, name="tmp", dtype=None):
+        """The buffer for name and shape, contents undefined"""
+        dtype = self.dtype if dtype is None else dtype
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buf = self.buffers.get(key)
+        if buf is None:
+            buf = self.buffers[key] = self.xp.empty(shape, dtype=dtype)
+            self.allocations += 1
+            trace.count("workspace buffers")
+            trace.count("bytes allocated", buf.nbytes)
+        return buf
+
+    def zeros(self, shape, name="tmp", dtype=None):
+        """get(), filled with zeros"""
+        buf = self.get(shape, name, dtype)
+        buf.fill(0)
+        return buf
+
+    def pair(self, shape, name="tmp", dtype=None):
+        """Two distinct buffers for ping-ponging between"""
+        return self.get(shape, name + " 0", dtype), self.get(shape, name + " 1", dtype)
+
+    @property
+    def nbytes(self):
+        return sum(b.nbytes for b in self.buffers.values())
+
+    def clear(self):
+        self.buffers.clear()
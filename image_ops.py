@@ -17,27 +17,39 @@
 # Copyright: Tommi Hyppänen
 
 
-import bpy  # noqa:F401
-
-import numpy as np
+import importlib
+import time
+import traceback
 
-CUDA_ACTIVE = False
-try:
-    import cupy as cup
+_reloading = "master_ops" in locals()
 
-    CUDA_ACTIVE = True
-except Exception:
-    CUDA_ACTIVE = False
-    cup = np
+import bpy  # noqa:F401
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from .bpy_amb import master_ops
-from .bpy_amb import utils
-import importlib
-
-importlib.reload(master_ops)
-importlib.reload(utils)
+from .core import cache
+from .core import layout
+from .core import pixel_io
+from .core import precision
+from .core import proxy
+from .core import registry
+from .core import stages
+from .core import tiled
+from .core import trace
+
+if _reloading:
+    importlib.reload(master_ops)
+    importlib.reload(layout)
+    importlib.reload(precision)
+    importlib.reload(cache)
+    importlib.reload(pixel_io)
+    importlib.reload(proxy)
+    importlib.reload(registry)
+    importlib.reload(stages)
+    importlib.reload(tiled)
+    importlib.reload(trace)
 
 
 def get_teximage(context):
@@ -62,6 +74,126 @@ def get_area_image(context):
         return None
 
 
+def result_cache(context):
+    """The result cache as set up in the add-on preferences, None when it's turned off"""
+    addon = context.preferences.addons.get(__package__)
+    if addon is None or not addon.preferences.cache_enabled:
+        return None
+    prefs = addon.preferences
+    return cache.shared_cache(
+        prefs.cache_size * 2**20,
+        prefs.cache_spill_dir if prefs.cache_spill else None,
+        prefs.cache_spill_size * 2**20,
+    )
+
+
+def use_backend_prefs(context):
+    """Turn the optional compute backends on or off as set in the add-on preferences"""
+    addon = context.preferences.addons.get(__package__)
+    if addon is None:
+        return
+    prefs = addon.preferences
+    for name, on in (("cupy", prefs.use_cuda), ("numba", prefs.use_numba)):
+        if registry.BACKENDS[name].enabled != on:
+            registry.enable(name, on)
+
+
+def use_trace_prefs(context):
+    """Start or stop recording spans as set in the add-on preferences"""
+    addon = context.preferences.addons.get(__package__)
+    if addon is None:
+        return
+    prefs = addon.preferences
+    rec = trace.current()
+    if rec is not None and (not prefs.trace_enabled or rec.memory != prefs.trace_memory):
+        trace.disable()
+    if prefs.trace_enabled:
+        trace.enable(memory=prefs.trace_memory)
+
+
+def use_precision_prefs(context):
+    """Set the precision debug mode and the cache storage precision from the preferences"""
+    addon = context.preferences.addons.get(__package__)
+    if addon is None:
+        return
+    prefs = addon.preferences
+    precision.configure(debug=prefs.precision_debug, storage=prefs.storage_precision)
+
+
+def stage_memo(context):
+    """Memo for the intermediates of staged payloads, None when caching is turned off"""
+    addon = context.preferences.addons.get(__package__)
+    if addon is None or not addon.preferences.cache_enabled:
+        return None
+    return stages.shared_memo(addon.preferences.cache_stage_size * 2**20)
+
+
+def write_result(image, pixels, scratch=None):
+    if image.size[1] != pixels.shape[0] or image.size[0] != pixels.shape[1]:
+        image.scale(pixels.shape[1], pixels.shape[0])
+    pixel_io.write_pixels(image, pixels, scratch)
+
+
+# full resolution runs behind previews, one at a time, newest per target image wins
+_refiner = None
+_refining = {}
+
+
+def refine_in_background(image_name, fn, done):
+    """Run fn() on a worker thread and call done(result) from a Blender timer, on the main
+    thread, unless another refine for the same image was started in the meantime. An error
+    in fn() is printed to the console instead"""
+    global _refiner
+    if _refiner is None:
+        _refiner = ThreadPoolExecutor(max_workers=1)
+
+    old = _refining.get(image_name)
+    if old is not None:
+        old.cancel()
+    future = _refiner.submit(fn)
+    _refining[image_name] = future
+
+    def _poll():
+        if not future.done():
+            return 0.1
+        if _refining.get(image_name) is future:
+            del _refining[image_name]
+            try:
+                res = future.result()
+            except Exception:
+                print("Refining {} at full resolution failed:".format(image_name))
+                traceback.print_exc()
+                return None
+            done(res)
+        return None
+
+    bpy.app.timers.register(_poll, first_interval=0.1)
+
+
+class _Settings:
+    """Property values of an operator run, for running its payload on another thread after
+    Blender has freed the operator itself"""
+
+    def __init__(self, op, params, source_hash, memo):
+        self.__dict__.update(params)
+        self.source_hash = source_hash
+        self._memo = memo
+        self._payload = type(op).payload
+        self._prefix = op.prefix
+
+    def run_stages(self, graph, image, context, **params):
+        memo = self._memo if self.source_hash is not None else None
+        image = registry.to_default(image)
+        return graph.run(image, memo=memo, source_key=self.source_hash, **params)
+
+    def report(self, kind, message):
+        print(message)
+
+    def run(self, pixels):
+        res = precision.enforce(self._prefix, self._payload(self, pixels, None))
+        return pixel_io.host_result(res)
+
+
 def create(lc, additional_classes):
     """ create(locals()) """
     load_these = []
@@ -78,6 +210,21 @@ def create(lc, additional_classes):
     )
     _props["source"] = bpy.props.PointerProperty(name="Image", type=bpy.types.Image)
     _props["target"] = bpy.props.PointerProperty(name="Image", type=bpy.types.Image)
+    _props["tiled"] = bpy.props.BoolProperty(
+        name="Tiled",
+        description="Process large images in tiles through temporary files, where supported",
+        default=False,
+    )
+    _props["tile_size"] = bpy.props.IntProperty(name="Tile size", min=64, default=2048)
+    _props["preview"] = bpy.props.BoolProperty(
+        name="Preview",
+        description="Show a reduced resolution result first and compute the full resolution "
+        "one in the background",
+        default=False,
+    )
+    _props["preview_factor"] = bpy.props.EnumProperty(
+        name="Proxy", items=[("4", "1/4", "", 1), ("8", "1/8", "", 2)]
+    )
 
     def _panel_draw(self, context):
         layout = self.layout
@@ -98,6 +245,16 @@ def create(lc, additional_classes):
             row = box.row()
             row.prop(context.scene.texture_tools, "global" + "_target")
 
+        box = col.box()
+        row = box.row()
+        row.prop(context.scene.texture_tools, "global" + "_tiled")
+        if context.scene.texture_tools.global_tiled:
+            row.prop(context.scene.texture_tools, "global" + "_tile_size")
+        row = box.row()
+        row.prop(context.scene.texture_tools, "global" + "_preview")
+        if context.scene.texture_tools.global_preview:
+            row.prop(context.scene.texture_tools, "global" + "_preview_factor", expand=True)
+
     pbuild = master_ops.PanelBuilder(
         "texture_tools",
         load_these,
@@ -113,45 +270,104 @@ def create(lc, additional_classes):
     return pbuild.register_params, pbuild.unregister_params
 
 
-class BTT_InstallLibraries(bpy.types.Operator):
-    bl_idname = "uv.spacker_install_libraries"
-    bl_label = "Install required libraries: pip, cffi,  pyclipper"
+class ImageOperator(master_ops.MacroOperator):
+    # hash of the source pixels of the current run, None when nothing needs it
+    source_hash = None
 
-    def execute(self, context):
-        from subprocess import call
+    def payload(self, image, context):
+        pass
 
-        pp = bpy.app.binary_path_python
+    def params(self):
+        return {name: getattr(self, name) for name in self.prop_names}
 
-        call([pp, "-m", "ensurepip", "--user"])
-        call([pp, "-m", "pip", "install", "--user", "cupy-cuda100"])
+    def cache_key(self):
+        return cache.make_key(self.source_hash, self.prefix, self.params())
 
-        global CUDA_ACTIVE
-        CUDA_ACTIVE = True
+    def run_stages(self, graph, image, context, **params):
+        """Run a stages.Graph as the payload, reusing intermediates of earlier runs on the same
+        source pixels (redo panel changes, mostly)"""
+        memo = stage_memo(context) if self.source_hash is not None else None
+        image = registry.to_default(image)
+        return graph.run(image, memo=memo, source_key=self.source_hash, **params)
 
-        import cupy
+    def get_halo(self):
+        """How far the payload looks from each pixel, None if it needs the whole image"""
+        return self.halo() if callable(self.halo) else self.halo
 
-        global cup
-        cup = cupy
+    def execute_tiled(self, source_image, target_image, tile_size, context):
+        # tiles are different sources, staged payloads run without a memo
+        self.source_hash = None
 
-        return {"FINISHED"}
+        def _tile(pix):
+            return precision.enforce(self.prefix, self.payload(pix, context))
 
+        shape = pixel_io.image_shape(source_image)
+        with tiled.backing_store(shape) as src, tiled.backing_store(shape) as dst:
+            with trace.span("read"):
+                pixel_io.read_pixels(source_image, out=src)
+            with trace.span("payload", tile_size=tile_size):
+                tiled.run_tiled(src, _tile, self.get_halo(), tile_size=tile_size, out=dst)
 
-class BTT_AddonPreferences(bpy.types.AddonPreferences):
-    bl_idname = __name__
+            with trace.span("write"):
+                if target_image.size[1] != shape[0] or target_image.size[0] != shape[1]:
+                    target_image.scale(shape[1], shape[0])
+                pixel_io.write_pixels(target_image, dst)
 
-    def draw(self, context):
-        row = self.layout.row()
-        if CUDA_ACTIVE is False:
-            row.operator(BTT_InstallLibraries.bl_idname, text="Install CUDA acceleration library")
-        else:
-            row.label(text="All optional libraries installed")
+        return {"FINISHED"}
+
+    def execute_preview(self, sourcepixels, target_image, factor, results, key, context):
+        """Write the result for a reduced copy of the source now, the full one when ready"""
+        start = time.perf_counter()
+        memo = stage_memo(context)
+        params = self.params()
+
+        small = proxy.level(sourcepixels, factor, self.source_hash)
+        settings = _Settings(
+            self,
+            proxy.scale_params(params, self.spatial, factor),
+            "{}/{}".format(self.source_hash, factor),
+            memo,
+        )
+        with trace.span("preview", factor=factor):
+            res = settings.run(small)
+        # operations that change the size (crops) have no preview
+        if res.shape[:2] == small.shape[:2]:
+            with trace.span("write"):
+                write_result(target_image, proxy.upsample(res, sourcepixels.shape))
+        first = time.perf_counter() - start
+        self.report({"INFO"}, "Preview in {:.2f}s, refining in the background".format(first))
+
+        full = _Settings(self, params, self.source_hash, memo)
+        prefix = self.prefix
+
+        def _done(res):
+            if results is not None:
+                results.put(key, res)
+            image = bpy.data.images.get(target_image.name)
+            if image is not None:
+                # the full resolution run is done with the source pixels
+                write_result(image, res, scratch=sourcepixels)
+            print(
+                "{}: preview in {:.2f}s, full resolution in {:.2f}s".format(
+                    prefix, first, time.perf_counter() - start
+                )
+            )
 
+        def _refine():
+            with trace.span(prefix + " refine"):
+                return full.run(sourcepixels)
 
-class ImageOperator(master_ops.MacroOperator):
-    def payload(self, image, context):
-        pass
+        refine_in_background(target_image.name, _refine, _done)
+        return {"FINISHED"}
 
     def execute(self, context):
+        use_backend_prefs(context)
+        use_trace_prefs(context)
+        use_precision_prefs(context)
+        with trace.span(self.prefix):
+            return self.execute_image(context)
+
+    def execute_image(self, context):
         image = get_area_image(bpy.context)
 
         ctt = context.scene.texture_tools
@@ -166,34 +382,72 @@ class ImageOperator(master_ops.MacroOperator):
         else:
             target_image = image
 
-        if self.force_numpy:
-            sourcepixels = np.array(source_image.pixels[:], dtype=np.float32).reshape(
-                source_image.size[1], source_image.size[0], 4
-            )
-        else:
-            sourcepixels = cup.array(source_image.pixels[:], dtype=cup.float32).reshape(
-                source_image.size[1], source_image.size[0], 4
-            )
+        if ctt.global_tiled and self.get_halo() is not None:
+            return self.execute_tiled(source_image, target_image, ctt.global_tile_size, context)
 
-        with utils.Profile_this(lines=10):
-            sourcepixels = self.payload(sourcepixels, context)
+        with trace.span("read"):
+            sourcepixels = pixel_io.read_pixels(source_image)
+        # RGBA of compact results is built here for writing, once the payload is done with it
+        scratch = sourcepixels
 
+        results = result_cache(context) if self.cacheable else None
+        self.source_hash = None
         if (
-            target_image.size[1] != sourcepixels.shape[0]
-            or target_image.size[0] != sourcepixels.shape[1]
+            results is not None
+            or ctt.global_preview
+            or (self.staged and stage_memo(context) is not None)
         ):
-            target_image.scale(sourcepixels.shape[1], sourcepixels.shape[0])
+            with trace.span("fingerprint"):
+                self.source_hash = cache.fingerprint(sourcepixels)
+
+        cached = key = None
+        if results is not None:
+            key = self.cache_key()
+            with trace.span("cache lookup") as s:
+                cached = results.get(key)
+                s.set(hit=cached is not None)
+
+        if cached is not None:
+            sourcepixels = cached
+        elif ctt.global_preview:
+            return self.execute_preview(
+                sourcepixels, target_image, int(ctt.global_preview_factor), results, key, context
+            )
+        else:
+            with trace.span("payload"):
+                sourcepixels = precision.enforce(self.prefix, self.payload(sourcepixels, context))
+
+            if results is not None:
+                results.put(key, sourcepixels)
 
-        target_image.pixels = sourcepixels.ravel().tolist()
+        with trace.span("write"):
+            write_result(target_image, sourcepixels, scratch)
         return {"FINISHED"}
 
 
 class ImageOperatorGenerator(master_ops.OperatorGenerator):
     def __init__(self, master_name):
         self.init_begin(master_name)
-        self.force_numpy = False
+        self._init_defaults()
         self.generate()
         self.init_end()
         self.name = "IMAGE_OT_" + self.name
         self.create_op(ImageOperator, "image")
-        self.op.force_numpy = self.force_numpy
+        self.op.halo = self.halo
+        self.op.cacheable = self.cacheable
+        self.op.staged = self.staged
+        self.op.spatial = self.spatial
+        self.op.prefix = self.prefix
+        self.op.prop_names = tuple(self.props.keys())
+
+    def _init_defaults(self):
+        """What generate() can change, before it runs"""
+        # pixels of context the payload needs around each output pixel, either a number or a
+        # function of the operator, None if it can't run in tiles
+        self.halo = None
+        # False for payloads that aren't a function of the pixels and properties alone
+        self.cacheable = True
+        # True for payloads that go through run_stages
+        self.staged = False
+        # properties measured in pixels, scaled down for previews
+        self.spatial = ()
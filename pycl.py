@@ -120,6 +120,7 @@ from ctypes import (
     cast,
     create_string_buffer,
 )
+import hashlib
 import os
 import sys
 from warnings import warn
@@ -2304,6 +2305,248 @@ def clEnqueueFillBuffer(queue, mem, pattern, pattern_size=0, offset=0, size=0, w
     return out_event
 
 
+@_wrapdll(
+    cl_command_queue,
+    cl_buffer,
+    cl_bool,
+    cl_map_flags,
+    size_t,
+    size_t,
+    cl_uint,
+    P(cl_event),
+    P(cl_event),
+    P(cl_errnum),
+    res=void_p,
+    err=_lastarg_errcheck,
+)
+def clEnqueueMapBuffer(
+    queue,
+    mem,
+    flags=cl_map_flags.CL_MAP_READ | cl_map_flags.CL_MAP_WRITE,
+    offset=0,
+    size=None,
+    blocking=True,
+    wait_for=None,
+):
+    """
+    Maps a region of a buffer into host memory.
+
+    :param flags: :class:`cl_map_flags`, what the host will do with it.
+    :param offset: Start of the region, in bytes.
+    :param size: Size of the region in bytes, the rest of the buffer by default.
+    :returns: ``(pointer, evt)``, the host address (an int) of the region
+      and the :class:`cl_event` of the map. The memory is only valid
+      after the event completes, and until :func:`clEnqueueUnmapMemObject`.
+
+    For buffers created with ``CL_MEM_USE_HOST_PTR`` the pointer is
+    into the host memory the buffer was created over, on CPU devices
+    without copying anything. See also :func:`map_ndarray`.
+    """
+    if size is None:
+        size = clGetMemObjectInfo(mem, cl_mem_info.CL_MEM_SIZE) - offset
+    nevents, wait_array = _make_event_array(wait_for)
+    out_event = cl_event()
+    ptr = clEnqueueMapBuffer.call(
+        queue,
+        mem,
+        blocking,
+        flags,
+        offset,
+        size,
+        nevents,
+        wait_array,
+        byref(out_event),
+        byref(cl_errnum()),
+    )
+    return (ptr, out_event)
+
+
+@_wrapdll(cl_command_queue, cl_mem, void_p, cl_uint, P(cl_event), P(cl_event))
+def clEnqueueUnmapMemObject(queue, mem, pointer, wait_for=None):
+    """
+    Releases a mapping made by :func:`clEnqueueMapBuffer`. The
+    host must not touch the mapped memory afterwards.
+    """
+    nevents, wait_array = _make_event_array(wait_for)
+    out_event = cl_event()
+    clEnqueueUnmapMemObject.call(queue, mem, pointer, nevents, wait_array, byref(out_event))
+    return out_event
+
+
+@_wrapdll(
+    cl_buffer,
+    cl_mem_flags,
+    cl_buffer_create_type,
+    void_p,
+    P(cl_errnum),
+    res=cl_buffer,
+    err=_lastarg_errcheck,
+)
+def clCreateSubBuffer(buffer, origin, size, flags=None):
+    """
+    A buffer that is a region of another one, sharing its memory.
+
+    :param buffer: The parent :class:`cl_buffer`.
+    :param origin: Start of the region in bytes. Must be a multiple of
+      the device's :attr:`~cl_device.mem_base_addr_align` (which is in
+      bits), or this raises :exc:`MisalignedSubBufferOffsetError`.
+    :param size: Size of the region in bytes.
+    :param flags: :class:`cl_mem_flags`. By default the access flags
+      are inherited from the parent, as are the host pointer flags
+      in any case.
+    """
+    if flags is None:
+        flags = cl_mem_flags.NONE
+    region = cl_buffer_region(origin, size)
+    mem = clCreateSubBuffer.call(
+        buffer,
+        flags,
+        cl_buffer_create_type.CL_BUFFER_CREATE_TYPE_REGION,
+        byref(region),
+        byref(cl_errnum()),
+    )
+    mem._size = size
+    mem._context = buffer.context
+    mem._base = buffer
+    mem._offset = origin
+    mem._type = cl_mem_object_type.CL_MEM_OBJECT_BUFFER
+    return mem
+
+
+def _rect_call(
+    func,
+    queue,
+    mem,
+    pointer,
+    region,
+    buffer_origin,
+    host_origin,
+    buffer_pitches,
+    host_pitches,
+    blocking,
+    wait_for,
+):
+    def _sizes(values):
+        values = tuple(values) + (0,) * (3 - len(values))
+        return (size_t * 3)(*values)
+
+    nevents, wait_array = _make_event_array(wait_for)
+    out_event = cl_event()
+    func.call(
+        queue,
+        mem,
+        blocking,
+        _sizes(buffer_origin),
+        _sizes(host_origin),
+        _sizes(tuple(region) + (1,) * (3 - len(region))),
+        buffer_pitches[0],
+        buffer_pitches[1],
+        host_pitches[0],
+        host_pitches[1],
+        pointer,
+        nevents,
+        wait_array,
+        byref(out_event),
+    )
+    return out_event
+
+
+_rect_argtypes = (
+    cl_command_queue,
+    cl_buffer,
+    cl_bool,
+    P(size_t),
+    P(size_t),
+    P(size_t),
+    size_t,
+    size_t,
+    size_t,
+    size_t,
+    void_p,
+    cl_uint,
+    P(cl_event),
+    P(cl_event),
+)
+
+
+@_wrapdll(*_rect_argtypes)
+def clEnqueueReadBufferRect(
+    queue,
+    mem,
+    pointer,
+    region,
+    buffer_origin=(0, 0, 0),
+    host_origin=(0, 0, 0),
+    buffer_pitches=(0, 0),
+    host_pitches=(0, 0),
+    blocking=True,
+    wait_for=None,
+):
+    """
+    Reads a 2D or 3D rectangle of a buffer into host memory laid out
+    with other pitches, for example a block of a bigger image or every
+    fourth float of a row.
+
+    :param region: ``(bytes, rows, slices)`` to copy. Only the first
+      value is in bytes, rows and slices default to 1.
+    :param buffer_origin: ``(byte, row, slice)`` where the rectangle
+      starts in the buffer.
+    :param host_origin: The same for the host memory at `pointer`.
+    :param buffer_pitches: ``(row_pitch, slice_pitch)`` in bytes of the
+      buffer. 0 means tightly packed: a row pitch of ``region[0]`` and a
+      slice pitch of ``region[1]`` rows.
+    :param host_pitches: The same for the host memory.
+
+    The other parameters are as for :func:`clEnqueueReadBuffer`. See
+    also :func:`buffer_to_ndarray`, which works this out for strided arrays.
+    """
+    return _rect_call(
+        clEnqueueReadBufferRect,
+        queue,
+        mem,
+        pointer,
+        region,
+        buffer_origin,
+        host_origin,
+        buffer_pitches,
+        host_pitches,
+        blocking,
+        wait_for,
+    )
+
+
+@_wrapdll(*_rect_argtypes)
+def clEnqueueWriteBufferRect(
+    queue,
+    mem,
+    pointer,
+    region,
+    buffer_origin=(0, 0, 0),
+    host_origin=(0, 0, 0),
+    buffer_pitches=(0, 0),
+    host_pitches=(0, 0),
+    blocking=True,
+    wait_for=None,
+):
+    """
+    Writes a rectangle of host memory into a buffer, the reverse of
+    :func:`clEnqueueReadBufferRect`.
+    """
+    return _rect_call(
+        clEnqueueWriteBufferRect,
+        queue,
+        mem,
+        pointer,
+        region,
+        buffer_origin,
+        host_origin,
+        buffer_pitches,
+        host_pitches,
+        blocking,
+        wait_for,
+    )
+
+
 @_wrapdll(cl_mem, cl_mem_info, size_t, void_p, P(size_t))
 def clGetMemObjectInfo(mem, param_name):
     """
@@ -2678,7 +2921,7 @@ def clGetProgramInfo(program, param_name):
             binaries[i] = (ctypes.c_char * bsize)()
             param_value[i] = cast(binaries[i], char_p)
         clGetProgramInfo.call(program, param_name, sz, param_value, None)
-        return [x.value for x in binaries]
+        return [x.raw for x in binaries]
     else:
         raise ValueError("Unknown program info %s" % param_name)
 
@@ -2764,6 +3007,8 @@ def clBuildProgram(program, options=None, devices=None):
     with details.
     """
     if options is not None:
+        if sys.version_info[0] > 2 and isinstance(options, str):
+            options = options.encode()
         options = char_p(options)
     if devices is not None:
         num_devices = len(devices)
@@ -2784,6 +3029,42 @@ def clBuildProgram(program, options=None, devices=None):
                 raise BuildProgramFailureError(log)
 
 
+@_wrapdll(
+    cl_context,
+    cl_uint,
+    P(cl_device),
+    P(size_t),
+    P(char_p),
+    P(cl_int),
+    P(cl_errnum),
+    res=cl_program,
+    err=_lastarg_errcheck,
+)
+def clCreateProgramWithBinary(context, devices, binaries):
+    """
+    :param context: Context in which the program will exist
+    :param devices: List of :class:`cl_device` the binaries are for.
+    :param binaries: List of binaries, one per device, as returned
+      by :attr:`cl_program.binaries`.
+
+    Binary programs still need :meth:`~cl_program.build`, which only
+    links them. A binary the driver doesn't accept (say, from another
+    driver version) raises :exc:`InvalidBinaryError`.
+    """
+    num_devices = len(devices)
+    if len(binaries) != num_devices:
+        raise ValueError("Expected %d binaries." % num_devices)
+    dev_array = (cl_device * num_devices)(*devices)
+    lengths = (size_t * num_devices)(*[len(b) for b in binaries])
+    bin_array = (char_p * num_devices)(*binaries)
+    status = (cl_int * num_devices)()
+    prg = clCreateProgramWithBinary.call(
+        context, num_devices, dev_array, lengths, bin_array, status, byref(cl_errnum())
+    )
+    prg._context = context
+    return prg
+
+
 @_wrapdll(cl_program)
 def clRetainProgram(program):
     clRetainProgram.call(program)
@@ -2794,6 +3075,81 @@ def clReleaseProgram(program):
     clReleaseProgram.call(program)
 
 
+def program_cache_dir():
+    """
+    Where :func:`build_program_cached` keeps binaries: the
+    ``PYCL_CACHE_DIR`` environment variable, or ``~/.cache/pycl``.
+    """
+    return os.getenv("PYCL_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "pycl")
+
+
+def _program_cache_key(source, options, device):
+    h = hashlib.sha256()
+    for part in (
+        source,
+        options or "",
+        device.name,
+        device.vendor,
+        device.version,
+        device.driver_version,
+    ):
+        if not isinstance(part, bytes):
+            part = str(part).encode()
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def build_program_cached(context, source, options=None, cache_dir=None):
+    """
+    Same as ``clCreateProgramWithSource(context, source).build(options)``,
+    except that the built binaries are kept on disk, keyed by the source,
+    the options, and the name and driver version of each device. Building
+    the same source again, in this process or a later one, creates the
+    program from those binaries and skips the compiler.
+
+    :param cache_dir: Directory for the binaries, see :func:`program_cache_dir`.
+
+    Binaries the driver rejects are rebuilt from source and replaced.
+    Failing to write the cache is not an error, the program is returned
+    either way.
+    """
+    if cache_dir is None:
+        cache_dir = program_cache_dir()
+
+    def _path(device):
+        return os.path.join(cache_dir, _program_cache_key(source, options, device) + ".bin")
+
+    devices = context.devices
+    paths = [_path(d) for d in devices]
+    if all(os.path.exists(p) for p in paths):
+        try:
+            binaries = []
+            for path in paths:
+                with open(path, "rb") as f:
+                    binaries.append(f.read())
+            return clCreateProgramWithBinary(context, devices, binaries).build(options)
+        except (IOError, OSError, OpenCLError):
+            pass
+
+    program = clCreateProgramWithSource(context, source).build(options)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        for device, binary in zip(program.devices, program.binaries):
+            if not binary:
+                continue
+            # write and rename, so a concurrent build never reads half a file
+            path = _path(device)
+            tmp = "%s.%d.tmp" % (path, os.getpid())
+            with open(tmp, "wb") as f:
+                f.write(binary)
+            os.replace(tmp, path)
+    except (IOError, OSError):
+        pass
+    return program
+
+
 ##################
 # Kernel Objects #
 ##################
@@ -2809,6 +3165,9 @@ class cl_kernel(void_p):
     Kernels are reference counted.
     """
 
+    # the kernel_args whose values the kernel holds right now, if any
+    _bound = None
+
     def __del__(self):
         try:
             if self:
@@ -2878,6 +3237,20 @@ class cl_kernel(void_p):
             self.setarg(i, args[i])
         return self
 
+    def bind(self, *args):
+        """
+        Converts the arguments once and returns them as a
+        :class:`kernel_args`, for launching the kernel many times
+        with the same (or mostly the same) arguments:
+
+        >>> call = kernel.bind(2, x_buf, 5, y_buf) # doctest: +SKIP
+        >>> for i in range(100): # doctest: +SKIP
+        ...     evt = call.on(queue, len(x))
+
+        Arguments are interpreted as in :meth:`setarg`.
+        """
+        return kernel_args(self, args)
+
     def setarg(self, index, value=None, size=None):
         """
         Sets one of the kernel's arguments.
@@ -2898,6 +3271,15 @@ class cl_kernel(void_p):
         types. The types should be either :class:`cl_mem`, :class:`localmem`,
         a scalar type such as :class:`cl_int`, or a ctypes structure type.
         """
+        size, vref = self._convert_arg(index, value, size)
+        clSetKernelArg.call(self, index, size, vref)
+        self._bound = None
+
+    def _convert_arg(self, index, value=None, size=None):
+        """
+        The ``(size, pointer)`` pair :func:`clSetKernelArg` wants
+        for a :meth:`setarg` value.
+        """
         if value is None and size is None:
             # Er, maybe the argument is a global pointer, and
             # the user wants it set to NULL?
@@ -2971,6 +3353,7 @@ class cl_kernel(void_p):
                     value = scalar_value
                     size = sizeof(dtype)
                     self.argtypes[index] = dtype
+                    self._bound = None
                     break
                 except InvalidArgSizeError:
                     # Nope, not this one.
@@ -2985,7 +3368,7 @@ class cl_kernel(void_p):
             vref = byref(value)
         else:
             vref = None
-        clSetKernelArg.call(self, index, size, vref)
+        return size, vref
 
     def _get_argtypes(self):
         """
@@ -3069,6 +3452,7 @@ def clCreateKernel(program, kernel_name):
 
     Using the the ``program[kernel_name]`` syntax is preferable.
     """
+    name = kernel_name
     if sys.version_info[0] > 2 and isinstance(kernel_name, str):
         kernel_name = kernel_name.encode()
     kernel = clCreateKernel.call(program, char_p(kernel_name), byref(cl_errnum()))
@@ -3076,7 +3460,7 @@ def clCreateKernel(program, kernel_name):
     kernel._context = program.context
     if not hasattr(program, "_kernels"):
         program._kernels = dict()
-    program._kernels[kernel_name] = kernel
+    program._kernels[name] = kernel
     return kernel
 
 
@@ -3209,6 +3593,73 @@ class localmem(object):
         self.size = size
 
 
+class kernel_args(object):
+    """
+    A set of kernel arguments already converted to their C types,
+    made by :meth:`cl_kernel.bind`. Launching with :meth:`on` only
+    passes the arguments to OpenCL when the kernel was last launched
+    with something else, and reuses the work size arrays while the
+    sizes stay the same, so repeated launches cost little more than
+    the enqueue itself.
+
+    :meth:`update` replaces a single argument, say a buffer that
+    changes between launches.
+    """
+
+    def __init__(self, kernel, args):
+        self.kernel = kernel
+        self._args = [kernel._convert_arg(i, value) for i, value in enumerate(args)]
+        self._dirty = set()
+        self._sizes = None
+
+    def update(self, index, value=None, size=None):
+        """Replaces one argument, interpreted as in :meth:`cl_kernel.setarg`."""
+        self._args[index] = self.kernel._convert_arg(index, value, size)
+        self._dirty.add(index)
+
+    def set(self):
+        """
+        Sets the kernel's arguments to these, if they aren't already.
+        Returns the kernel.
+        """
+        kernel = self.kernel
+        if kernel._bound is self:
+            indices = self._dirty
+        else:
+            indices = range(len(self._args))
+        for i in indices:
+            size, vref = self._args[i]
+            clSetKernelArg.call(kernel, i, size, vref)
+        self._dirty = set()
+        kernel._bound = self
+        return kernel
+
+    def on(self, queue, gsize=(1,), lsize=None, offset=None, wait_for=None):
+        """
+        Enqueues the kernel with these arguments, see
+        :func:`clEnqueueNDRangeKernel` for the rest.
+        """
+        kernel = self.set()
+        key = (gsize, lsize, offset)
+        if self._sizes is None or self._sizes[0] != key:
+            self._sizes = (key,) + _work_size_arrays(gsize, lsize, offset)
+        _, nd, gsize_array, lsize_array, offset_array = self._sizes
+        nevents, wait_array = _make_event_array(wait_for)
+        out_event = cl_event()
+        clEnqueueNDRangeKernel.call(
+            queue,
+            kernel,
+            nd,
+            offset_array,
+            gsize_array,
+            lsize_array,
+            nevents,
+            wait_array,
+            byref(out_event),
+        )
+        return out_event
+
+
 @_wrapdll(cl_kernel, cl_uint, size_t, void_p)
 def clSetKernelArg(kernel, index, value=None, size=None):
     """
@@ -3265,6 +3716,25 @@ def clEnqueueNDRangeKernel(queue, kernel, gsize=(1,), lsize=None, offset=None, w
     this function with the default gsize, lsize, and offset values, so we haven't
     bothered to wrap it.
     """
+    nd, gsize_array, lsize_array, offset_array = _work_size_arrays(gsize, lsize, offset)
+    nevents, wait_array = _make_event_array(wait_for)
+    out_event = cl_event()
+    clEnqueueNDRangeKernel.call(
+        queue,
+        kernel,
+        nd,
+        offset_array,
+        gsize_array,
+        lsize_array,
+        nevents,
+        wait_array,
+        byref(out_event),
+    )
+    return out_event
+
+
+def _work_size_arrays(gsize, lsize, offset):
+    """``(nd, gsize, lsize, offset)`` as size_t arrays for clEnqueueNDRangeKernel"""
     if isinstance(gsize, int):
         nd = 1
         gsize = (gsize,)
@@ -3289,20 +3759,7 @@ def clEnqueueNDRangeKernel(queue, kernel, gsize=(1,), lsize=None, offset=None, w
         offset_array = (size_t * nd)()
         for i, s in enumerate(offset):
             offset_array[i] = s
-    nevents, wait_array = _make_event_array(wait_for)
-    out_event = cl_event()
-    clEnqueueNDRangeKernel.call(
-        queue,
-        kernel,
-        nd,
-        offset_array,
-        gsize_array,
-        lsize_array,
-        nevents,
-        wait_array,
-        byref(out_event),
-    )
-    return out_event
+    return nd, gsize_array, lsize_array, offset_array
 
 
 @_wrapdll(cl_command_queue)
@@ -3310,6 +3767,15 @@ def clFinish(queue):
     clFinish.call(queue)
 
 
+@_wrapdll(cl_command_queue)
+def clFlush(queue):
+    """
+    Submits the queued commands to the device without waiting for
+    them. Needed when commands on other queues wait for these.
+    """
+    clFlush.call(queue)
+
+
 try:
     from OpenGL import GL
 
@@ -3346,36 +3812,49 @@ if HAVE_OPENGL:
         return out_event
 
 
-def buffer_from_ndarray(queue, ary, buf=None, **kw):
+def buffer_from_ndarray(queue, ary, buf=None, pool=None, **kw):
     """
     Creates (or simply writes to) an OpenCL buffer using the contents
     of a Numpy array.
 
     :param queue: :class:`cl_command_queue` to enqueue the write to.
     :param ary: :class:`numpy.ndarray` object, or other object implementing
-      the array interface. We haven't wrapped the rectangular read/write
-      functions yet, so if the array isn't contiguous, a copy will be made.
+      the array interface. Strided views (a block of a bigger image, one
+      channel of an RGBA image) are written with a rectangular copy and
+      arrive packed in the buffer. Only layouts that need more than three
+      dimensions to describe are copied to a contiguous array first.
       Note that the entirety of the provided array will be written, so be sure
       to slice it down to just the part you want to write.
     :param buf: :class:`cl_buffer` object. If not provided, one the size
       of the array will be created. In any event, it should hopefully be large
       enough to hold the provided array.
+    :param pool: :class:`buffer_pool` to take the buffer from when none
+      is provided. Give it back with :meth:`buffer_pool.put` when done.
     :returns: ``(buf, evt)``, where ``evt`` is the :class:`cl_event` returned
       by the write operation.
 
     Any additional provided keyword arguments are passed along to
-    :func:`clEnqueueWriteBuffer`.
+    :func:`clEnqueueWriteBuffer` (or :func:`clEnqueueWriteBufferRect`).
     """
     if not np:
         raise Exception("numpy not available")
 
-    ary = np.ascontiguousarray(ary)
+    ary = np.asarray(ary)
+    layout = None
+    if not ary.flags.c_contiguous:
+        layout = _rect_layout(ary)
+        if layout is None:
+            ary = np.ascontiguousarray(ary)
+    if buf is None and pool is not None:
+        buf = pool.get(ary.nbytes)
     if buf is None:
         buf = clCreateBuffer(queue.context, ary.nbytes)
-    if ary.__array_interface__["strides"]:
-        raise ValueError("I don't know how to handle strided arrays yet.")
     ptr = void_p(ary.__array_interface__["data"][0])
-    evt = clEnqueueWriteBuffer(queue, buf, ptr, ary.nbytes, **kw)
+    if layout is not None:
+        region, pitches = layout
+        evt = clEnqueueWriteBufferRect(queue, buf, ptr, region, host_pitches=pitches, **kw)
+    else:
+        evt = clEnqueueWriteBuffer(queue, buf, ptr, ary.nbytes, **kw)
     return (buf, evt)
 
 
@@ -3387,8 +3866,8 @@ def buffer_to_ndarray(queue, buf, out=None, like=None, dtype="uint8", shape=None
     :param buf: The :class:`cl_buffer` to read from
     :param out: The :class:`numpy.ndarray` to read into. If not
       provided, one will be created based on the following arguments.
-      Unlike :func:`buffer_from_array`, this must currently be an actual
-      contiguous :class:`~numpy.ndarray` object.
+      It may be a strided view, as long as a rectangular copy can
+      describe it (see :func:`buffer_from_ndarray`).
     :param like: Only relevant if no out array is provided. The new array
       will have the same shape and dtype as this value.
     :param dtype: Only relevant if no out array or ``like`` parameter are provided.
@@ -3401,7 +3880,7 @@ def buffer_to_ndarray(queue, buf, out=None, like=None, dtype="uint8", shape=None
       read operation.
 
     Any further keyword arguments are passed directly to
-    :func:`clEnqueueReadBuffer`.
+    :func:`clEnqueueReadBuffer` (or :func:`clEnqueueReadBufferRect`).
     """
     if out is None:
         if like is not None:
@@ -3417,12 +3896,112 @@ def buffer_to_ndarray(queue, buf, out=None, like=None, dtype="uint8", shape=None
             if shape is None:
                 shape = buf.size // dtype.itemsize
             out = np.empty(shape, dtype)
-    assert out.flags.contiguous, "Don't know how to write non-contiguous yet."
     ptr = void_p(out.__array_interface__["data"][0])
-    evt = clEnqueueReadBuffer(queue, buf, ptr, out.nbytes, **kw)
+    if out.flags.c_contiguous:
+        evt = clEnqueueReadBuffer(queue, buf, ptr, out.nbytes, **kw)
+    else:
+        layout = _rect_layout(out)
+        if layout is None:
+            raise ValueError("Can't read into this strided array, give a contiguous one.")
+        region, pitches = layout
+        evt = clEnqueueReadBufferRect(queue, buf, ptr, region, host_pitches=pitches, **kw)
     return (out, evt)
 
 
+def _rect_layout(ary):
+    """
+    ``(region, (row_pitch, slice_pitch))`` describing the memory of a
+    strided array for the rectangular copies, None if three dimensions
+    aren't enough.
+    """
+    shape = list(ary.shape)
+    strides = list(ary.strides)
+    # the contiguous innermost axes are the first dimension, in bytes
+    inner = ary.itemsize
+    while shape and (shape[-1] == 1 or strides[-1] == inner):
+        inner *= shape.pop()
+        strides.pop()
+    dims = [(n, st) for n, st in zip(shape, strides) if n != 1][::-1]
+    if len(dims) > 2:
+        return None
+    dims += [(1, 0)] * (2 - len(dims))
+    (rows, row_pitch), (slices, slice_pitch) = dims
+    if rows > 1 and row_pitch < inner:
+        return None
+    if slices > 1 and (slice_pitch < rows * row_pitch or slice_pitch % row_pitch):
+        return None
+    return (inner, rows, slices), (row_pitch if rows > 1 else 0, slice_pitch if slices > 1 else 0)
+
+
+def empty_aligned(shape, dtype="float32", align=4096):
+    """
+    An empty :class:`numpy.ndarray` starting at a multiple of `align`
+    bytes. Devices can often only work on host memory in place, see
+    :func:`buffer_over_ndarray`, when it is aligned to a page.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + align, dtype=np.uint8)
+    start = -raw.__array_interface__["data"][0] % align
+    return raw[start : start + nbytes].view(dtype).reshape(shape)
+
+
+def buffer_over_ndarray(context, ary, flags=cl_mem_flags.CL_MEM_READ_WRITE):
+    """
+    A buffer over the memory of a contiguous array
+    (``CL_MEM_USE_HOST_PTR``), so uploading is free and kernels on CPU
+    devices read and write the array itself. The buffer keeps the array
+    alive.
+
+    The array belongs to OpenCL while kernels may use it: map the buffer
+    (:func:`map_ndarray`) before reading results from it on the host,
+    which on CPU devices hands back the array's own memory, and unmap it
+    before the next kernel. :func:`clCreateSubBuffer` gives tiles of it.
+    """
+    if not ary.flags.c_contiguous:
+        raise ValueError("Buffers over arrays need contiguous arrays.")
+    buf = clCreateBuffer(
+        context,
+        ary.nbytes,
+        flags | cl_mem_flags.CL_MEM_USE_HOST_PTR,
+        host_ptr=ary.__array_interface__["data"][0],
+    )
+    buf._host_array = ary
+    return buf
+
+
+def map_ndarray(
+    queue,
+    buf,
+    shape,
+    dtype="float32",
+    flags=cl_map_flags.CL_MAP_READ | cl_map_flags.CL_MAP_WRITE,
+    offset=0,
+    **kw
+):
+    """
+    Maps (part of) a buffer and returns it as a :class:`numpy.ndarray`
+    of the given shape and dtype, without copying on devices that share
+    memory with the host.
+
+    :returns: ``(ary, evt)``, `evt` being the map's :class:`cl_event`.
+      Release the mapping with :func:`unmap_ndarray` before kernels use
+      the buffer again, the array must not be used after that.
+
+    Further keyword arguments go to :func:`clEnqueueMapBuffer`.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    ptr, evt = clEnqueueMapBuffer(queue, buf, flags, offset, nbytes, **kw)
+    mem = (ctypes.c_char * nbytes).from_address(ptr)
+    return (np.frombuffer(mem, dtype).reshape(shape), evt)
+
+
+def unmap_ndarray(queue, buf, ary, wait_for=None):
+    """Releases a mapping made by :func:`map_ndarray`, returns the :class:`cl_event`"""
+    return clEnqueueUnmapMemObject(queue, buf, ary.__array_interface__["data"][0], wait_for)
+
+
 def buffer_from_pyarray(queue, ary, buf=None, **kw):
     """
     Essentially the same as :func:`buffer_from_ndarray`, except that
@@ -3464,6 +4043,201 @@ def buffer_to_pyarray(queue, buf, out=None, like=None, typecode="B", length=None
     return (out, evt)
 
 
+class buffer_pool(object):
+    """
+    Device buffers kept for reuse instead of being released, so code
+    that runs over and over with the same image sizes stops allocating.
+
+    Sizes are rounded up to a power of two, and a request is served by
+    any free buffer of its rounded size. The buffers you get may be
+    larger than asked for, so pass explicit sizes when reading and
+    writing them.
+
+    >>> pool = buffer_pool(ctx) # doctest: +SKIP
+    >>> buf = pool.get(4096) # doctest: +SKIP
+    >>> pool.put(buf) # doctest: +SKIP
+
+    :param max_bytes: How much free memory the pool may hold on to.
+      Buffers put back past that are released. None for no limit.
+    """
+
+    def __init__(self, context, flags=cl_mem_flags.CL_MEM_READ_WRITE, max_bytes=None):
+        self.context = context
+        self.flags = flags
+        self.max_bytes = max_bytes
+        self.free_bytes = 0
+        self.allocations = 0
+        self.reuses = 0
+        self._free = dict()
+
+    @staticmethod
+    def bucket(size):
+        """Size of the buffers serving a request for `size` bytes"""
+        return max(256, 1 << (int(size) - 1).bit_length())
+
+    def get(self, size):
+        """A :class:`cl_buffer` of at least `size` bytes"""
+        bucket = self.bucket(size)
+        free = self._free.get(bucket)
+        if free:
+            self.free_bytes -= bucket
+            self.reuses += 1
+            return free.pop()
+        self.allocations += 1
+        return clCreateBuffer(self.context, bucket, self.flags)
+
+    def put(self, buf):
+        """Hands a buffer from :meth:`get` back. Don't use it afterwards."""
+        size = buf.size
+        if self.max_bytes is not None and self.free_bytes + size > self.max_bytes:
+            return
+        self._free.setdefault(size, []).append(buf)
+        self.free_bytes += size
+
+    def clear(self):
+        """Releases all the free buffers"""
+        self._free.clear()
+        self.free_bytes = 0
+
+
+_pools = dict()
+
+
+def shared_pool(context, max_bytes=None):
+    """
+    The process wide :class:`buffer_pool` of a context, so buffers
+    are reused across separate runs. `max_bytes` updates its limit.
+    """
+    pool = _pools.get(context.value)
+    if pool is None:
+        pool = _pools[context.value] = buffer_pool(context, max_bytes=max_bytes)
+    elif max_bytes is not None:
+        pool.max_bytes = max_bytes
+    return pool
+
+
+class _tile_slot(object):
+    # device buffers of one tile in flight and the events guarding them
+    def __init__(self):
+        self.src = None
+        self.dst = None
+        self.uploaded = None
+        self.computed = None
+        self.downloaded = None
+        self.host = None
+        self.pending = None
+
+
+def pipeline_tiles(queues, tiles, launch, pool=None, depth=2):
+    """
+    Runs a kernel over a sequence of host tiles, uploading a tile,
+    computing the one before and downloading the one before that at
+    the same time.
+
+    :param queues: A :class:`cl_command_queue`, or an ``(upload, compute,
+      download)`` tuple of queues on the same context. Transfers and
+      kernels only overlap on devices that run separate queues
+      concurrently, with a single in-order queue the host still queues
+      ahead instead of blocking on every transfer.
+    :param tiles: Iterable of ``(src, dst)`` numpy arrays, dst receives
+      the kernel output for src and must not be touched until this
+      returns. dst can be a strided view (say, a column block of a bigger
+      image), it is then read into a temporary and copied in.
+    :param launch: ``launch(queue, src_buf, dst_buf, src, wait_for)``
+      enqueues the kernel reading src_buf and writing dst_buf and returns
+      its event. :meth:`cl_kernel.bind` makes this cheap.
+    :param pool: :class:`buffer_pool` for the tile buffers, by default the
+      context's :func:`shared_pool`.
+    :param depth: Tiles in flight, each needs its own pair of buffers.
+
+    Each transfer or launch waits on events only: the upload of a tile
+    on the kernel that last read its buffer, the kernel on the upload
+    and on the download that last read its output buffer, the download
+    on the kernel. The host only blocks when it has to reuse a
+    temporary or let go of the host tile a slot last uploaded from (in
+    case the upload is still running, it usually isn't), and at the
+    end.
+    """
+    if isinstance(queues, cl_command_queue):
+        queues = (queues, queues, queues)
+    upload_q, compute_q, download_q = queues
+    if pool is None:
+        pool = shared_pool(compute_q.context)
+
+    slots = [_tile_slot() for _ in range(depth)]
+    retired = []
+
+    def _finish(slot):
+        # copy a temporary into its strided destination once it has arrived
+        if slot.pending is not None:
+            slot.downloaded.wait()
+            tmp, dst = slot.pending
+            dst[...] = tmp
+            slot.pending = None
+
+    try:
+        for i, (src, dst) in enumerate(tiles):
+            slot = slots[i % depth]
+            _finish(slot)
+            src = np.ascontiguousarray(src)
+            # a buffer too small for this tile may still be read by its
+            # kernel or download, it goes back to the pool at the end
+            if slot.src is None or slot.src.size < src.nbytes:
+                if slot.src is not None:
+                    retired.append(slot.src)
+                slot.src = pool.get(src.nbytes)
+            if slot.dst is None or slot.dst.size < dst.nbytes:
+                if slot.dst is not None:
+                    retired.append(slot.dst)
+                slot.dst = pool.get(dst.nbytes)
+
+            # keep the host array alive while it's being uploaded, the
+            # previous one (maybe a temporary from ascontiguousarray) until
+            # its upload is done
+            if slot.uploaded is not None:
+                slot.uploaded.wait()
+            slot.host = src
+            slot.uploaded = uploaded = clEnqueueWriteBuffer(
+                upload_q,
+                slot.src,
+                void_p(src.__array_interface__["data"][0]),
+                src.nbytes,
+                blocking=False,
+                wait_for=slot.computed,
+            )
+            clFlush(upload_q)
+            slot.computed = launch(compute_q, slot.src, slot.dst, src, [uploaded, slot.downloaded])
+            clFlush(compute_q)
+
+            out = dst
+            if not dst.flags.c_contiguous:
+                out = np.empty(dst.shape, dst.dtype)
+                slot.pending = (out, dst)
+            slot.downloaded = clEnqueueReadBuffer(
+                download_q,
+                slot.dst,
+                void_p(out.__array_interface__["data"][0]),
+                out.nbytes,
+                blocking=False,
+                wait_for=slot.computed,
+            )
+            clFlush(download_q)
+
+        clWaitForEvents(*[s.downloaded for s in slots if s.downloaded])
+        for slot in slots:
+            _finish(slot)
+    finally:
+        # after an error commands may still be using the buffers
+        for q in dict((q.value, q) for q in queues).values():
+            clFinish(q)
+        for buf in retired:
+            pool.put(buf)
+        for slot in slots:
+            for buf in (slot.src, slot.dst):
+                if buf is not None:
+                    pool.put(buf)
+
+
 ### End OpenCL wrappers. ###
 def _pycl_make_all():
     g = globals()